@@ -1,32 +1,19 @@
 import { useState, useEffect, useCallback, useMemo } from 'react';
 
+const BASE_URL = 'https://api.alphacar.dev/parking-stat';
+
 /**
- * Aggregate 5-minute slots into wider buckets.
- * factor = 1 (5M), 3 (15M), 6 (30M), 12 (1H)
+ * Resolve the file for a day range at a given cell size.
+ * The server publishes sample-weighted 5M/15M/30M/1H matrices per range;
+ * older meta.json files without `resolutions` only have 5M data.
+ * Returns the file together with the cell size it actually holds.
  */
-function aggregateRow(row, factor) {
-    if (factor === 1) return row;
-    const out = [];
-    for (let i = 0; i < row.length; i += factor) {
-        const chunk = row.slice(i, i + factor);
-        const valid = chunk.filter(v => v !== null);
-        out.push(valid.length ? valid.reduce((a, b) => a + b, 0) / valid.length : null);
-    }
-    return out;
-}
-
-function aggregateCountRow(row, factor) {
-    if (factor === 1) return row;
-    const out = [];
-    for (let i = 0; i < row.length; i += factor) {
-        const chunk = row.slice(i, i + factor);
-        out.push(chunk.reduce((a, b) => a + b, 0));
-    }
-    return out;
+function heatmapFile(meta, dayRange, cellSize) {
+    const byRange = meta.resolutions?.[cellSize];
+    if (byRange?.[dayRange]) return { file: byRange[dayRange], cellSize };
+    return { file: dayRange === 'all' ? 'all.json' : `${dayRange}.json`, cellSize: '5M' };
 }
 
-const CELL_FACTORS = { '5M': 1, '15M': 3, '30M': 6, '1H': 12 };
-
 export default function useHeatmapData() {
     const [meta, setMeta] = useState(null);
     const [rawData, setRawData] = useState(null);
@@ -37,12 +24,14 @@ export default function useHeatmapData() {
     const [selectedLots, setSelectedLots] = useState([]);
     const [dayRange, setDayRange] = useState('all');
     const [cellSize, setCellSize] = useState('15M');
+    // Cell size of the data in rawData (5M when the requested size isn't published)
+    const [loadedCellSize, setLoadedCellSize] = useState(null);
     const [startHour, setStartHour] = useState(0);
     const [endHour, setEndHour] = useState(24);
 
     // Fetch meta on mount
     useEffect(() => {
-        fetch('https://api.alphacar.dev/parking-stat/meta.json')
+        fetch(`${BASE_URL}/meta.json`)
             .then(r => r.json())
             .then(m => {
                 setMeta(m);
@@ -51,66 +40,52 @@ export default function useHeatmapData() {
             .catch(e => setError(e.message));
     }, []);
 
-    // Fetch range data when dayRange changes
+    // Fetch range data when dayRange or cellSize changes
     useEffect(() => {
         if (!meta) return;
         setLoading(true);
-        const file = dayRange === 'all' ? 'all.json' : `${dayRange}.json`;
-        fetch(`https://api.alphacar.dev/parking-stat/${file}`)
+        const { file, cellSize: resolved } = heatmapFile(meta, dayRange, cellSize);
+        fetch(`${BASE_URL}/${file}`)
             .then(r => r.json())
             .then(d => {
                 setRawData(d);
+                setLoadedCellSize(resolved);
                 setLoading(false);
             })
             .catch(e => {
                 setError(e.message);
                 setLoading(false);
             });
-    }, [meta, dayRange]);
+    }, [meta, dayRange, cellSize]);
 
     // Compute processed data
     const processed = useMemo(() => {
         if (!rawData) return null;
 
-        const factor = CELL_FACTORS[cellSize] || 1;
-        const startSlot = startHour * 12; // 12 slots per hour at 5-min granularity
-        const endSlot = endHour * 12;
-
+        // Cells are already at the requested size; only the hour window is applied here
         const xLabels = rawData.meta.xLabels;
-
-        // Generate aggregated x labels
-        const aggLabels = [];
-        for (let i = startSlot; i < endSlot; i += factor) {
-            if (i < xLabels.length) {
-                aggLabels.push(xLabels[i]);
-            }
-        }
+        const slotsPerHour = xLabels.length / 24;
+        const startSlot = startHour * slotsPerHour;
+        const endSlot = endHour * slotsPerHour;
 
         const result = {};
         for (const lot of Object.keys(rawData.lots)) {
             const matrix = rawData.lots[lot];
             const counts = rawData.sample_counts[lot];
-            const aggMatrix = [];
-            const aggCounts = [];
-
-            for (let day = 0; day < 7; day++) {
-                // Slice to time window first, then aggregate
-                const sliced = matrix[day].slice(startSlot, endSlot);
-                const slicedCounts = counts[day].slice(startSlot, endSlot);
-                aggMatrix.push(aggregateRow(sliced, factor));
-                aggCounts.push(aggregateCountRow(slicedCounts, factor));
-            }
-
-            result[lot] = { matrix: aggMatrix, counts: aggCounts };
+            result[lot] = {
+                matrix: matrix.map(row => row.slice(startSlot, endSlot)),
+                counts: counts.map(row => row.slice(startSlot, endSlot)),
+            };
         }
 
         return {
             lots: result,
-            xLabels: aggLabels,
+            xLabels: xLabels.slice(startSlot, endSlot),
             yLabels: rawData.meta.yLabels,
             range: rawData.range,
+            cellSize: loadedCellSize,
         };
-    }, [rawData, cellSize, startHour, endHour]);
+    }, [rawData, loadedCellSize, startHour, endHour]);
 
     const toggleLot = useCallback((lot) => {
         setSelectedLots(prev =>
@@ -127,7 +102,8 @@ export default function useHeatmapData() {
         error,
         selectedLots,
         dayRange,
-        cellSize,
+        // The size shown is the one loaded, so a fallback to 5M is visible
+        cellSize: loadedCellSize ?? cellSize,
         startHour,
         endHour,
         setDayRange,
@@ -19,6 +19,14 @@ export default class extends WorkerEntrypoint<Env> {
     const key = url.pathname.slice(1);
     switch (request.method) {
       case "GET": {
+        // Published objects carry Cache-Control (immutable versions, short-lived meta.json),
+        // so the edge cache can answer repeat requests without reading R2
+        const cache = caches.default;
+        const cached = await cache.match(request);
+        if (cached) {
+          return cached;
+        }
+
         const object = await this.env.PARKING_STAT_BUCKET.get(key);
 
         if (object === null) {
@@ -30,10 +38,14 @@ export default class extends WorkerEntrypoint<Env> {
         headers.set("etag", object.httpEtag);
         headers.set("Access-Control-Allow-Origin", "*");
 
-        return new Response(object.body, {
+        const response = new Response(object.body, {
           status: 200,
           headers,
         });
+        if (headers.has("cache-control")) {
+          this.ctx.waitUntil(cache.put(request, response.clone()));
+        }
+        return response;
       }
       default:
         return new Response("Method Not Allowed", {
@@ -2,107 +2,266 @@
 """
 Aggregate parking data from PostgreSQL into heatmap JSON files for dashboard consumption.
 
-Produces:
-  - heatmaps/7d.json   (last 7 days)
-  - heatmaps/30d.json  (last 30 days)
-  - heatmaps/all.json  (all available data)
+Produces, for each window (7d, 30d, 90d, 120d, all) and cell size:
+  - heatmaps/7d.json       (last 7 days, 5-minute cells)
+  - heatmaps/7d_15m.json   (last 7 days, 15-minute cells)
+  - heatmaps/7d_30m.json   (last 7 days, 30-minute cells)
+  - heatmaps/7d_1h.json    (last 7 days, 1-hour cells)
+  - ...
+  - heatmaps/7d_dist.json  (p50 / p90 / probability-full matrices, likewise per cell size)
+  - heatmaps/7d_clean.json (same as 7d.json without flagged anomaly days, likewise per cell size)
+  - ...
+  - heatmaps/decayed.json  (exponentially decayed heatmap from the crawler's online state, per cell size)
+  - heatmaps/segment_semester.json (all history on days tagged 'semester' in the campus calendar, per cell size)
+  - heatmaps/meta.json     (file index and last update time)
+
+Occupancy time-series tiles (heatmaps/tiles/) come from timeseries_tiles.py.
 """
 import os
 import json
 from datetime import datetime
 from typing import Dict, List, Tuple, Optional
-from db import DB, LOT_INFO
+import numpy as np
+from db import DB, LOT_INFO, LOT_CAPACITY as LOT_CAPACITY_BY_ID, OCCUPANCY_BUCKETS, OCCUPANCY_BUCKET_WIDTH, FULL_BUCKET
+import metrics
+import decayed_heatmap
+import campus_calendar
+from metrics import timed, span
 
 # Configuration
 OUTPUT_DIR = "./heatmaps"
+# Built from db.LOT_REGISTRY; load_lots() refreshes them in place from the lots table
 LOTS = list(LOT_INFO.values())  # ["Stadium_Deck", "Athletics_Deck", "Haley_Deck"]
 LOT_ID_TO_NAME = {int(k): v for k, v in LOT_INFO.items()}
+LOT_CAPACITY = {name: LOT_CAPACITY_BY_ID[lot_id] for lot_id, name in LOT_INFO.items()}
 TIME_SLOTS = 288  # 24 hours × 6 (5-minute intervals)
+SLOT_MINUTES = 5
 DAYS_OF_WEEK = 7
 
-def generate_time_labels() -> List[str]:
-    """Generate 288 time slot labels like '00:00~00:05', '00:06~00:10', etc."""
+# Published cell sizes: label -> number of 5-minute slots merged per cell
+RESOLUTIONS = {"5M": 1, "15M": 3, "30M": 6, "1H": 12}
+
+# Windows: (days to look back, file name stem)
+RANGES = [
+    (7, "7d"),
+    (30, "30d"),
+    (90, "90d"),
+    (120, "120d"),
+    (None, "all"),
+]
+
+
+# Range name for the exponentially decayed heatmap (not a look-back window)
+DECAYED_RANGE = "decayed"
+
+# Calendar segment files are named '<SEGMENT_PREFIX><tag>'
+SEGMENT_PREFIX = "segment_"
+
+# Percentiles published in the distribution files
+QUANTILES = {"p50": 0.5, "p90": 0.9}
+
+
+def load_lots(db: DB) -> bool:
+    """
+    Take lot names and capacities from the lots table, so files cover every
+    lot readings reference. Updates LOTS, LOT_ID_TO_NAME and LOT_CAPACITY in
+    place (forecast and tiles share them); they keep the built-in registry if
+    the table can't be read.
+    """
+    rows = db.get_lots()
+    if not rows:
+        return False
+    LOTS[:] = [name for _, name, _ in rows]
+    LOT_ID_TO_NAME.clear()
+    LOT_ID_TO_NAME.update((lot_id, name) for lot_id, name, _ in rows)
+    LOT_CAPACITY.clear()
+    LOT_CAPACITY.update((name, capacity) for _, name, capacity in rows)
+    return True
+
+
+def heatmap_filename(range_name: str, resolution: str, variant: Optional[str] = None) -> str:
+    """
+    5M keeps the original '<range>.json' name; coarser cells and variants get suffixes,
+    e.g. '7d_15m.json', '7d_clean.json', '7d_15m_clean.json'.
+    """
+    parts = [range_name]
+    if RESOLUTIONS[resolution] != 1:
+        parts.append(resolution.lower())
+    if variant:
+        parts.append(variant)
+    return "_".join(parts) + ".json"
+
+
+def distribution_filename(range_name: str, resolution: str) -> str:
+    """e.g. '7d_dist.json', '7d_15m_dist.json'"""
+    return heatmap_filename(range_name, resolution, "dist")
+
+
+def heatmap_filenames(output_dir: str = OUTPUT_DIR) -> List[str]:
+    """
+    All heatmap files produced by the last generate_all_heatmaps() run into
+    output_dir, excluding meta.json. Segment files are the ones its meta.json lists.
+    """
+    files = []
+    for _, name in RANGES:
+        for res in RESOLUTIONS:
+            files.append(heatmap_filename(name, res))
+            files.append(heatmap_filename(name, res, "clean"))
+            files.append(distribution_filename(name, res))
+    files.extend(heatmap_filename(DECAYED_RANGE, res) for res in RESOLUTIONS)
+    for segment in generated_segments(output_dir):
+        files.extend(heatmap_filename(f"{SEGMENT_PREFIX}{segment}", res) for res in RESOLUTIONS)
+    return files
+
+
+def generated_segments(output_dir: str = OUTPUT_DIR) -> List[str]:
+    """Segment tags the last run wrote files for, from its meta.json (empty without one)."""
+    meta_path = os.path.join(output_dir, "meta.json")
+    if not os.path.exists(meta_path):
+        return []
+    with open(meta_path, 'r', encoding='utf-8') as f:
+        meta = json.load(f)
+    return list(meta.get("segments", {}).get("5M", {}))
+
+
+def remove_stale_segment_files(segments: List[str]) -> List[str]:
+    """Delete segment files in OUTPUT_DIR for tags that were not generated this run."""
+    keep = {heatmap_filename(f"{SEGMENT_PREFIX}{segment}", res) for segment in segments for res in RESOLUTIONS}
+    removed = []
+    for name in sorted(os.listdir(OUTPUT_DIR)):
+        if name.startswith(SEGMENT_PREFIX) and name.endswith(".json") and name not in keep:
+            os.remove(os.path.join(OUTPUT_DIR, name))
+            removed.append(name)
+    return removed
+
+
+def generate_time_labels(cell_minutes: int = SLOT_MINUTES) -> List[str]:
+    """Generate time slot labels like '00:00~00:05', '00:05~00:10', etc."""
     labels = []
-    for slot in range(TIME_SLOTS):
-        start_minutes = slot * 5
-        end_minutes = start_minutes + 5
+    for slot in range(TIME_SLOTS * SLOT_MINUTES // cell_minutes):
+        start_minutes = slot * cell_minutes
+        end_minutes = start_minutes + cell_minutes
         start_h, start_m = divmod(start_minutes, 60)
         end_h, end_m = divmod(end_minutes, 60)
         labels.append(f"{start_h:02d}:{start_m:02d}~{end_h:02d}:{end_m:02d}")
     return labels
 
 
-def compute_heatmap_from_db(db: DB, days: Optional[int]) -> Tuple[Dict[str, Dict], str, str]:
+def compute_heatmap_from_db(db: DB, days: Optional[int]) -> Tuple[Dict[str, Dict], Dict[str, Dict], str, str]:
     """
-    Compute heatmap matrices using pre-aggregated data from PostgreSQL.
+    Compute per-lot 5-minute cell arrays using pre-aggregated data from PostgreSQL.
     
     Args:
         db: Database connection
         days: Number of days to look back (None for all data)
     
     Returns:
-        Tuple of (results_dict, from_date, to_date)
-        results_dict contains matrix and sample_counts for each lot
+        Tuple of (results_dict, clean_results_dict, from_date, to_date)
+        results_dict maps lot name to 7×288 arrays:
+          avg:             occupancy % as rounded by PostgreSQL (NaN when no data)
+          sample_counts:   readings per cell
+          occupancy_sum:   unrounded sum of occupancy % (for sample-weighted merging)
+          occupancy_count: readings with non-zero capacity contributing to occupancy_sum
+        clean_results_dict has the same layout with flagged anomaly days left out
     """
     # Get aggregated data from database
     """
-    rows: (lot_id, day_of_week, time_slot, avg_occupancy, sample_count)
+    rows: (lot_id, day_of_week, time_slot, avg_occupancy, sample_count, occupancy_sum, occupancy_count,
+           clean_sample_count, clean_occupancy_sum, clean_occupancy_count)
     from_date: start date of data
     to_date: end date of data
     """
     rows, from_date, to_date = db.get_heatmap_data(days)
     
     # Initialize numpy arrays for each lot
-    # Using object dtype to allow None values
-    matrices = {}
-    counts = {}
-    for lot_id, lot_name in LOT_ID_TO_NAME.items():
-        matrices[lot_id] = [[None for _ in range(TIME_SLOTS)] for _ in range(DAYS_OF_WEEK)]
-        counts[lot_id] = [[0 for _ in range(TIME_SLOTS)] for _ in range(DAYS_OF_WEEK)]
-    
-    # Each row: (lot_id, day_of_week, time_slot, avg_occupancy, sample_count)
-    for row in rows:
-        lot_id, day, slot, avg_occ, count = row  # 1 | 1 | 90 | 75.0 | 1
-        if (lot_id in matrices) and (0 <= day < DAYS_OF_WEEK) and (0 <= slot < TIME_SLOTS) :
-            matrices[lot_id][day][slot] = float(avg_occ) if (avg_occ is not None) else None
-            counts[lot_id][day][slot] = int(count)
+    shape = (DAYS_OF_WEEK, TIME_SLOTS)
     
-    # Convert numpy arrays to nested lists for JSON serialization
-    results = {}
-    for lot_id, lot_name in LOT_ID_TO_NAME.items():
-        # Convert numpy array to list, handling None values
-        matrix_list = []
-        counts_list = []
-        for day in range(DAYS_OF_WEEK):
-            day_values = []
-            day_counts = []
-            for slot in range(TIME_SLOTS):
-                val = matrices[lot_id][day][slot]
-                day_values.append(float(val) if val is not None else None)
-                day_counts.append(int(counts[lot_id][day][slot]))
-            matrix_list.append(day_values)
-            counts_list.append(day_counts)
-        
-        results[lot_name] = {
-            "matrix": matrix_list,
-            "sample_counts": counts_list
+    def empty_cells():
+        return {
+            "avg": np.full(shape, np.nan),
+            "sample_counts": np.zeros(shape, dtype=np.int64),
+            "occupancy_sum": np.zeros(shape),
+            "occupancy_count": np.zeros(shape, dtype=np.int64),
         }
     
-    return results, from_date, to_date
-
-
-def generate_heatmap_json(db: DB, days: Optional[int], reference_date: datetime) -> Dict:
-    """Generate complete heatmap JSON structure for a date range."""
-    lot_data, from_date, to_date = compute_heatmap_from_db(db, days)
+    cells = {lot_id: empty_cells() for lot_id in LOT_ID_TO_NAME}
+    clean_cells = {lot_id: empty_cells() for lot_id in LOT_ID_TO_NAME}
     
-    print(f"  Range: {from_date} to {to_date}")
-    
-    # Flatten to just the matrices for the main "lots" object
-    lots_matrices = {lot: lot_data[lot]["matrix"] for lot in LOTS}
+    # Each row: (lot_id, day_of_week, time_slot, avg_occupancy, sample_count, occupancy_sum, occupancy_count,
+    #            clean_sample_count, clean_occupancy_sum, clean_occupancy_count)
+    for row in rows:
+        lot_id, day, slot, avg_occ, count, occ_sum, occ_count, clean_count, clean_sum, clean_occ_count = row
+        if (lot_id in cells) and (0 <= day < DAYS_OF_WEEK) and (0 <= slot < TIME_SLOTS):
+            lot_cells = cells[lot_id]
+            if avg_occ is not None:
+                lot_cells["avg"][day, slot] = float(avg_occ)
+            lot_cells["sample_counts"][day, slot] = int(count)
+            lot_cells["occupancy_sum"][day, slot] = float(occ_sum) if occ_sum is not None else 0.0
+            lot_cells["occupancy_count"][day, slot] = int(occ_count)
+            
+            lot_clean = clean_cells[lot_id]
+            lot_clean["sample_counts"][day, slot] = int(clean_count)
+            lot_clean["occupancy_sum"][day, slot] = float(clean_sum) if clean_sum is not None else 0.0
+            lot_clean["occupancy_count"][day, slot] = int(clean_occ_count)
     
-    # Include sample counts separately
-    sample_counts = {lot: lot_data[lot]["sample_counts"] for lot in LOTS}
+    # Clean 5-minute averages come from the filtered sums
+    for lot_clean in clean_cells.values():
+        with np.errstate(invalid="ignore", divide="ignore"):
+            lot_clean["avg"] = np.where(lot_clean["occupancy_count"] > 0,
+                                        round_half_up(lot_clean["occupancy_sum"] / lot_clean["occupancy_count"]),
+                                        np.nan)
     
+    results = {LOT_ID_TO_NAME[lot_id]: lot_cells for lot_id, lot_cells in cells.items()}
+    clean_results = {LOT_ID_TO_NAME[lot_id]: lot_cells for lot_id, lot_cells in clean_cells.items()}
+    return results, clean_results, from_date, to_date
+
+
+def round_half_up(values, decimals: int = 1):
+    """
+    Round half away from zero like PostgreSQL's ROUND(numeric), so values rounded
+    here match the ones the heatmap query rounds (numpy rounds half to even).
+    """
+    scale = 10 ** decimals
+    return np.sign(values) * np.floor(np.abs(values) * scale + 0.5) / scale
+
+
+def _to_json_matrix(values: np.ndarray) -> List[List[Optional[float]]]:
+    """Convert a float array to nested lists, mapping NaN to None."""
+    return [[None if np.isnan(v) else float(v) for v in day] for day in values.tolist()]
+
+
+def resample_cells(lot_cells: Dict[str, np.ndarray], factor: int) -> Tuple[List[List], List[List]]:
+    """
+    Merge every `factor` consecutive 5-minute slots into one cell.
+
+    Averages are weighted by sample count (sum of occupancy over sum of readings),
+    so a slot with 3 readings counts three times as much as a slot with 1.
+
+    Returns:
+        Tuple of (matrix, sample_counts) as nested lists
+    """
+    if factor == 1:
+        return _to_json_matrix(lot_cells["avg"]), lot_cells["sample_counts"].tolist()
+
+    cells = TIME_SLOTS // factor
+    occ_sum = lot_cells["occupancy_sum"].reshape(DAYS_OF_WEEK, cells, factor).sum(axis=2)
+    occ_count = lot_cells["occupancy_count"].reshape(DAYS_OF_WEEK, cells, factor).sum(axis=2)
+    samples = lot_cells["sample_counts"].reshape(DAYS_OF_WEEK, cells, factor).sum(axis=2)
+
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg = np.where(occ_count > 0, occ_sum / occ_count, np.nan)
+    return _to_json_matrix(round_half_up(avg)), samples.tolist()
+
+
+def build_heatmap_json(lot_data: Dict[str, Dict], from_date: str, to_date: str,
+                       resolution: str, reference_date: datetime) -> Dict:
+    """Build the JSON document for one window at one cell size."""
+    factor = RESOLUTIONS[resolution]
+    lots_matrices = {}
+    sample_counts = {}
+    for lot in LOTS:
+        lots_matrices[lot], sample_counts[lot] = resample_cells(lot_data[lot], factor)
+
     return {
         "range": {
             "from": from_date,
@@ -112,14 +271,247 @@ def generate_heatmap_json(db: DB, days: Optional[int], reference_date: datetime)
         "sample_counts": sample_counts,
         "meta": {
             "yLabels": ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"],
-            "xLabels": generate_time_labels(),
+            "xLabels": generate_time_labels(SLOT_MINUTES * factor),
             "metric": "occupancy_rate",
             "unit": "percent",
+            "resolution": resolution,
             "generated_at": reference_date.strftime("%Y-%m-%d %H:%M:%S")
         }
     }
 
 
+@timed("heatmap.generate_json")
+def generate_heatmap_json(db: DB, days: Optional[int],
+                          reference_date: datetime) -> Tuple[Dict[str, Dict], Dict[str, Dict]]:
+    """
+    Generate heatmap JSON structures for a date range at every cell size,
+    with and without flagged anomaly days.
+
+    All of them come from the same database aggregation pass.
+
+    Returns:
+        Tuple of (heatmaps, clean_heatmaps), each mapping resolution label (e.g. "15M") to its JSON document
+    """
+    lot_data, clean_data, from_date, to_date = compute_heatmap_from_db(db, days)
+    
+    print(f"  Range: {from_date} to {to_date}")
+    
+    heatmaps = {}
+    clean_heatmaps = {}
+    for resolution in RESOLUTIONS:
+        heatmaps[resolution] = build_heatmap_json(lot_data, from_date, to_date, resolution, reference_date)
+        clean = build_heatmap_json(clean_data, from_date, to_date, resolution, reference_date)
+        clean["meta"]["excludes"] = "anomaly_days"
+        clean_heatmaps[resolution] = clean
+    return heatmaps, clean_heatmaps
+
+
+def compute_decayed_cells(state: decayed_heatmap.DecayedHeatmap, now: datetime) -> Dict[str, Dict]:
+    """
+    Build per-lot cell arrays (same layout as compute_heatmap_from_db) from the decayed state.
+
+    Counts are effective (decayed) reading counts, so sample_counts are rounded.
+    """
+    results = {}
+    for lot_id, lot_name in LOT_ID_TO_NAME.items():
+        snapshot = state.snapshot(lot_id, now)
+        occ_sum = np.array(snapshot["occupancy_sum"]).reshape(DAYS_OF_WEEK, TIME_SLOTS)
+        occ_count = np.array(snapshot["occupancy_count"]).reshape(DAYS_OF_WEEK, TIME_SLOTS)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            avg = np.where(occ_count > 0, round_half_up(occ_sum / occ_count), np.nan)
+        results[lot_name] = {
+            "avg": avg,
+            "sample_counts": round_half_up(occ_count, 0).astype(np.int64),
+            "occupancy_sum": occ_sum,
+            "occupancy_count": occ_count,
+        }
+    return results
+
+
+@timed("heatmap.generate_decayed_json")
+def generate_decayed_heatmap_json(reference_date: datetime) -> Dict[str, Dict]:
+    """
+    Generate the decayed heatmap at every cell size from the crawler's checkpoint,
+    decayed to reference_date (timezone-aware).
+
+    Returns:
+        Dict mapping resolution label to its JSON document
+    """
+    state = decayed_heatmap.DecayedHeatmap.load()
+    lot_data = compute_decayed_cells(state, reference_date)
+    date_str = reference_date.strftime("%Y-%m-%d")
+
+    docs = {}
+    for resolution in RESOLUTIONS:
+        doc = build_heatmap_json(lot_data, "", date_str, resolution, reference_date)
+        doc["meta"]["half_life_days"] = decayed_heatmap.DECAY_HALF_LIFE_DAYS
+        docs[resolution] = doc
+    return docs
+
+
+def compute_segments_from_db(db: DB, calendar) -> Tuple[Dict[str, Dict[str, Dict]], Dict[str, Tuple[str, str]]]:
+    """
+    Compute per-segment, per-lot cell arrays from the daily rollups in one grouped query.
+    
+    Only segments with readings are returned.
+    
+    Returns:
+        Tuple of (dict mapping segment tag to a results dict laid out like compute_heatmap_from_db,
+        dict mapping segment tag to (from_date, to_date) of its first and last day with readings)
+    """
+    rows = db.get_segment_data(calendar, campus_calendar.DEFAULT_SEGMENT)
+    shape = (DAYS_OF_WEEK, TIME_SLOTS)
+    
+    segments: Dict[str, Dict[int, Dict]] = {}
+    day_ranges: Dict[str, list] = {}
+    # Each row: (segment, lot_id, day_of_week, time_slot, sample_count, occupancy_sum, occupancy_count,
+    #            first_day, last_day)
+    for segment, lot_id, day, slot, count, occ_sum, occ_count, first_day, last_day in rows:
+        if (lot_id not in LOT_ID_TO_NAME) or not (0 <= day < DAYS_OF_WEEK) or not (0 <= slot < TIME_SLOTS):
+            continue
+        day_range = day_ranges.setdefault(segment, [first_day, last_day])
+        day_range[0], day_range[1] = min(day_range[0], first_day), max(day_range[1], last_day)
+        lots = segments.setdefault(segment, {
+            lid: {
+                "sample_counts": np.zeros(shape, dtype=np.int64),
+                "occupancy_sum": np.zeros(shape),
+                "occupancy_count": np.zeros(shape, dtype=np.int64),
+            }
+            for lid in LOT_ID_TO_NAME
+        })
+        lots[lot_id]["sample_counts"][day, slot] = int(count)
+        lots[lot_id]["occupancy_sum"][day, slot] = float(occ_sum)
+        lots[lot_id]["occupancy_count"][day, slot] = int(occ_count)
+    
+    results = {}
+    for segment, lots in segments.items():
+        for lot_cells in lots.values():
+            with np.errstate(invalid="ignore", divide="ignore"):
+                lot_cells["avg"] = np.where(lot_cells["occupancy_count"] > 0,
+                                            round_half_up(lot_cells["occupancy_sum"] / lot_cells["occupancy_count"]),
+                                            np.nan)
+        results[segment] = {LOT_ID_TO_NAME[lot_id]: cells for lot_id, cells in lots.items()}
+    return results, {segment: (str(first), str(last)) for segment, (first, last) in day_ranges.items()}
+
+
+@timed("heatmap.generate_segment_json")
+def generate_segment_json(db: DB, reference_date: datetime) -> Dict[str, Dict[str, Dict]]:
+    """
+    Generate calendar-segment heatmaps at every cell size.
+
+    Returns:
+        Dict mapping segment tag to {resolution: JSON document} for the segments with
+        readings; empty without a calendar
+    """
+    calendar = campus_calendar.load_calendar()
+    if not calendar:
+        return {}
+    
+    docs = {}
+    segments, day_ranges = compute_segments_from_db(db, calendar)
+    for segment, lot_data in segments.items():
+        from_date, to_date = day_ranges[segment]
+        docs[segment] = {}
+        for resolution in RESOLUTIONS:
+            doc = build_heatmap_json(lot_data, from_date, to_date, resolution, reference_date)
+            doc["meta"]["segment"] = segment
+            docs[segment][resolution] = doc
+    return docs
+
+
+def compute_distribution_from_db(db: DB, days: Optional[int]) -> Tuple[Dict[str, np.ndarray], str, str]:
+    """
+    Merge daily occupancy histograms from the rollup table for a window.
+    
+    The window is whole local days (today and the `days` before it), so it
+    differs from the heatmap's rolling window and carries its own date range.
+    
+    Returns:
+        Tuple of (dict mapping lot name to a 7×288×OCCUPANCY_BUCKETS array of reading counts,
+        from_date, to_date)
+    """
+    rows, from_date, to_date = db.get_distribution_data(days)
+    
+    hists = {lot_id: np.zeros((DAYS_OF_WEEK, TIME_SLOTS, OCCUPANCY_BUCKETS), dtype=np.int64)
+             for lot_id in LOT_ID_TO_NAME}
+    
+    # Each row: (lot_id, day_of_week, time_slot, bucket, count)
+    for lot_id, day, slot, bucket, count in rows:
+        if (lot_id in hists) and (0 <= day < DAYS_OF_WEEK) and (0 <= slot < TIME_SLOTS) \
+                and (0 <= bucket < OCCUPANCY_BUCKETS):
+            hists[lot_id][day, slot, bucket] = int(count)
+    
+    return {LOT_ID_TO_NAME[lot_id]: hist for lot_id, hist in hists.items()}, from_date, to_date
+
+
+def histogram_quantile(hist: np.ndarray, q: float) -> np.ndarray:
+    """
+    Nearest-rank quantile over the last (bucket) axis.
+    
+    Returns the lower edge of the bucket holding the q-th reading, so values
+    are exact for the 0/25/50/75/100% readings small lots produce and
+    otherwise accurate to OCCUPANCY_BUCKET_WIDTH points. NaN where empty.
+    """
+    total = hist.sum(axis=-1)
+    cumulative = hist.cumsum(axis=-1)
+    rank = np.maximum(np.ceil(q * total), 1)[..., None]
+    bucket = (cumulative < rank).sum(axis=-1)
+    value = np.minimum(bucket * OCCUPANCY_BUCKET_WIDTH, 100).astype(float)
+    return np.where(total > 0, value, np.nan)
+
+
+def build_distribution_json(hists: Dict[str, np.ndarray], date_range: Dict[str, str],
+                            resolution: str, reference_date: datetime) -> Dict:
+    """Build the percentile / probability-full document for one window at one cell size."""
+    factor = RESOLUTIONS[resolution]
+    cells = TIME_SLOTS // factor
+    
+    lots = {}
+    for lot in LOTS:
+        hist = hists[lot].reshape(DAYS_OF_WEEK, cells, factor, OCCUPANCY_BUCKETS).sum(axis=2)
+        total = hist.sum(axis=-1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            p_full = np.where(total > 0, hist[..., FULL_BUCKET] / total * 100, np.nan)
+        
+        lot_json = {name: _to_json_matrix(histogram_quantile(hist, q)) for name, q in QUANTILES.items()}
+        lot_json["p_full"] = _to_json_matrix(round_half_up(p_full))
+        lot_json["sample_counts"] = total.tolist()
+        lots[lot] = lot_json
+    
+    return {
+        "range": date_range,
+        "lots": lots,
+        "meta": {
+            "yLabels": ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"],
+            "xLabels": generate_time_labels(SLOT_MINUTES * factor),
+            "metrics": {
+                "p50": "median occupancy rate (percent)",
+                "p90": "90th percentile occupancy rate (percent)",
+                "p_full": "share of readings with no free spot (percent)",
+            },
+            "bucket_width": OCCUPANCY_BUCKET_WIDTH,
+            "resolution": resolution,
+            "generated_at": reference_date.strftime("%Y-%m-%d %H:%M:%S")
+        }
+    }
+
+
+@timed("heatmap.generate_distribution_json")
+def generate_distribution_json(db: DB, days: Optional[int], reference_date: datetime) -> Dict[str, Dict]:
+    """
+    Generate distribution JSON structures for a window at every cell size.
+
+    Returns:
+        Dict mapping resolution label to its JSON document
+    """
+    hists, from_date, to_date = compute_distribution_from_db(db, days)
+    date_range = {"from": from_date, "to": to_date}
+    return {
+        resolution: build_distribution_json(hists, date_range, resolution, reference_date)
+        for resolution in RESOLUTIONS
+    }
+
+
 def generate_all_heatmaps():
     """
     Generate all heatmap JSON files.
@@ -147,35 +539,87 @@ def generate_all_heatmaps():
     
     print(f"\n📊 Total rows in database: {row_count}")
     
-    # Use current time as reference
-    reference_date = datetime.now()
+    # Bring the daily rollups (histogram sketches) up to date
+    db.create_aux_tables()
+    load_lots(db)
+    db.refresh_daily_rollups()
+    
+    # Use current local time as reference (the decayed heatmap decays to it)
+    reference_date = datetime.now(decayed_heatmap.CENTRAL_TZ)
     
     # Generate heatmaps for each range
-    ranges = [
-        (7, "7d.json"),
-        (30, "30d.json"),
-        (90, "90d.json"),
-        (120, "120d.json"),
-        (None, "all.json"),
-    ]
-    
-    for days, filename in ranges:
-        range_name = f"{days}d" if days else "all"
+    for days, range_name in RANGES:
         print(f"\nGenerating {range_name} heatmap...")
         
-        heatmap_json = generate_heatmap_json(db, days, reference_date)
+        heatmaps_by_resolution, clean_by_resolution = generate_heatmap_json(db, days, reference_date)
         
-        output_path = os.path.join(OUTPUT_DIR, filename)
-        with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(heatmap_json, f, indent=2)
+        for resolution, heatmap_json in heatmaps_by_resolution.items():
+            output_path = os.path.join(OUTPUT_DIR, heatmap_filename(range_name, resolution))
+            with span("heatmap.write_json"), open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(heatmap_json, f, indent=2)
+            
+            print(f"  ✅ Saved to: {output_path}")
+        
+        for resolution, heatmap_json in clean_by_resolution.items():
+            output_path = os.path.join(OUTPUT_DIR, heatmap_filename(range_name, resolution, "clean"))
+            with span("heatmap.write_json"), open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(heatmap_json, f, indent=2)
+        print(f"  ✅ Saved {len(clean_by_resolution)} files without anomaly days")
         
-        print(f"  ✅ Saved to: {output_path}")
+        distributions = generate_distribution_json(db, days, reference_date)
+        for resolution, dist_json in distributions.items():
+            output_path = os.path.join(OUTPUT_DIR, distribution_filename(range_name, resolution))
+            with span("heatmap.write_json"), open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(dist_json, f, indent=2)
+        print(f"  ✅ Saved {len(distributions)} distribution files")
+    
+    # Recency-weighted heatmap straight from the online state (no history scan)
+    print("\nGenerating decayed heatmap...")
+    for resolution, heatmap_json in generate_decayed_heatmap_json(reference_date).items():
+        output_path = os.path.join(OUTPUT_DIR, heatmap_filename(DECAYED_RANGE, resolution))
+        with span("heatmap.write_json"), open(output_path, 'w', encoding='utf-8') as f:
+            json.dump(heatmap_json, f, indent=2)
+    print(f"  ✅ Saved {len(RESOLUTIONS)} decayed heatmap files")
+    
+    # Calendar segments (semester, break, game day, ...) from one grouped pass over the rollups
+    segment_docs = generate_segment_json(db, reference_date)
+    if segment_docs:
+        print(f"\nGenerating {len(segment_docs)} calendar segment heatmaps...")
+    for segment, by_resolution in segment_docs.items():
+        for resolution, heatmap_json in by_resolution.items():
+            output_path = os.path.join(OUTPUT_DIR, heatmap_filename(f"{SEGMENT_PREFIX}{segment}", resolution))
+            with span("heatmap.write_json"), open(output_path, 'w', encoding='utf-8') as f:
+                json.dump(heatmap_json, f, indent=2)
+        print(f"  ✅ Saved segment '{segment}'")
+    for name in remove_stale_segment_files(list(segment_docs)):
+        print(f"  🗑️  Removed stale segment file {name}")
     
     # Generate meta file with last update time
     meta = {
         "last_updated": reference_date.strftime("%Y-%m-%d %H:%M:%S"),
-        "files": ["7d.json", "30d.json", "90d.json", "120d.json", "all.json"],
-        "lots": LOTS
+        "files": [heatmap_filename(range_name, "5M") for _, range_name in RANGES],
+        "resolutions": {
+            resolution: {
+                range_name: heatmap_filename(range_name, resolution)
+                for range_name in [name for _, name in RANGES] + [DECAYED_RANGE]
+            }
+            for resolution in RESOLUTIONS
+        },
+        "clean": {
+            resolution: {range_name: heatmap_filename(range_name, resolution, "clean") for _, range_name in RANGES}
+            for resolution in RESOLUTIONS
+        },
+        "segments": {
+            resolution: {segment: heatmap_filename(f"{SEGMENT_PREFIX}{segment}", resolution) for segment in segment_docs}
+            for resolution in RESOLUTIONS
+        },
+        "distributions": {
+            resolution: {range_name: distribution_filename(range_name, resolution) for _, range_name in RANGES}
+            for resolution in RESOLUTIONS
+        },
+        "tiles": "tiles/index.json",
+        "lots": LOTS,
+        "capacity": LOT_CAPACITY
     }
     meta_path = os.path.join(OUTPUT_DIR, "meta.json")
     with open(meta_path, 'w', encoding='utf-8') as f:
@@ -194,6 +638,7 @@ def generate_all_heatmaps():
 def main():
     """Standalone mode: generate heatmaps when run directly."""
     generate_all_heatmaps()
+    metrics.flush()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,310 @@
+#!/usr/bin/env python3
+"""
+Multi-window occupancy analytics from the published heatmaps or the daily rollups.
+
+Loads every window once into (window, lot, weekday, 5-minute slot) arrays of
+occupancy % and reading counts and computes, for all windows and lots at once:
+  - summary: cells with data, coverage, readings, min / max / mean over cells
+    and the reading-weighted mean
+  - peak hours: per weekday, the hour with the highest reading-weighted occupancy
+  - deltas: each window minus the next longer one (7d vs 30d, ...), mean and
+    largest change over cells with data in both
+  - fill time: per weekday, the first slot whose occupancy exceeds --full-pct
+
+Sources:
+  - files (default): the 5-minute window files (7d.json ... all.json) in --heatmaps-dir
+  - rollups: parking_daily_rollup, so compacted history counts too. Windows are
+    the last N local days (like the rollup-based outputs), so results can differ
+    slightly from the files, whose windows end at the time they were generated.
+
+Usage:
+    python analytics_report.py [--source files|rollups] [--heatmaps-dir ./heatmaps]
+                               [--format text|csv] [--output PATH] [--full-pct 90]
+"""
+import os
+import csv
+import sys
+import json
+import time
+import argparse
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from aggregate_heatmaps import (
+    OUTPUT_DIR, RANGES, LOTS, TIME_SLOTS, SLOT_MINUTES, DAYS_OF_WEEK, heatmap_filename, round_half_up,
+)
+from forecast import CENTRAL_TZ, DAY_LABELS, day_of_week, load_history
+from metrics import timed
+
+# Configuration
+FULL_PCT = 90.0
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+
+Row = Tuple[str, str, str, str, str, object]  # section, window, lot, day, metric, value
+
+
+def load_window_files(heatmaps_dir: str = OUTPUT_DIR) -> Optional[Dict]:
+    """
+    Stack the 5-minute window files into (windows, lots, 7, 288) arrays; missing files are skipped.
+
+    Returns:
+        Dict with "windows", "pct" (NaN without data) and "counts", or None if no file was found
+    """
+    windows, pct, counts = [], [], []
+    shape = (len(LOTS), DAYS_OF_WEEK, TIME_SLOTS)
+    for _, name in RANGES:
+        path = os.path.join(heatmaps_dir, heatmap_filename(name, "5M"))
+        if not os.path.exists(path):
+            print(f"⚠️  Heatmap file missing, skipping: {path}")
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            doc = json.load(f)
+        empty = [[None] * TIME_SLOTS] * DAYS_OF_WEEK
+        # None -> NaN on conversion to float
+        pct.append(np.array([doc["lots"].get(lot, empty) for lot in LOTS], dtype=np.float64).reshape(shape))
+        counts.append(np.array([doc.get("sample_counts", {}).get(lot, [[0] * TIME_SLOTS] * DAYS_OF_WEEK)
+                                for lot in LOTS], dtype=np.int64).reshape(shape))
+        windows.append(name)
+    if not windows:
+        return None
+    return {"windows": windows, "pct": np.stack(pct), "counts": np.stack(counts)}
+
+
+def load_rollup_windows(db) -> Optional[Dict]:
+    """
+    Fold the daily rollups into the same (windows, lots, 7, 288) arrays, one pass for all windows.
+
+    Returns:
+        Dict with "windows", "pct" and "counts", or None without rollups
+    """
+    first_date, occupancy_sum, occupancy_count, _ = load_history(db, None)
+    if first_date is None:
+        return None
+    days = occupancy_sum.shape[1]
+    dates = first_date + np.arange(days)
+    age = np.datetime64(datetime.now(CENTRAL_TZ).date(), "D") - dates
+    age = age.astype(np.int64)
+
+    # (windows, days, 7): day d counts toward weekday k of window w
+    in_window = np.array([age <= window_days if window_days is not None else np.ones(days, dtype=bool)
+                          for window_days, _ in RANGES])
+    weekday = day_of_week(dates)[:, None] == np.arange(DAYS_OF_WEEK)
+    assign = (in_window[:, :, None] & weekday[None]).astype(np.float64)
+
+    sums = np.einsum("lds,wdk->wlks", occupancy_sum.astype(np.float64), assign)
+    counts = np.einsum("lds,wdk->wlks", occupancy_count.astype(np.float64), assign).astype(np.int64)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        pct = np.where(counts > 0, sums / counts, np.nan)
+    return {"windows": [name for _, name in RANGES], "pct": pct, "counts": counts}
+
+
+def summary_stats(pct: np.ndarray, counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """Per (window, lot) statistics over all weekday/slot cells."""
+    valid = ~np.isnan(pct)
+    cells = valid.sum(axis=(2, 3))
+    readings = np.where(valid, counts, 0).sum(axis=(2, 3))
+    values = np.where(valid, pct, 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "cells": cells,
+            "coverage_pct": cells / (DAYS_OF_WEEK * TIME_SLOTS) * 100,
+            "readings": readings,
+            "min_pct": np.where(cells > 0, np.where(valid, pct, np.inf).min(axis=(2, 3)), np.nan),
+            "max_pct": np.where(cells > 0, np.where(valid, pct, -np.inf).max(axis=(2, 3)), np.nan),
+            "mean_pct": np.where(cells > 0, values.sum(axis=(2, 3)) / cells, np.nan),
+            "weighted_pct": np.where(readings > 0, (values * np.where(valid, counts, 0)).sum(axis=(2, 3)) / readings,
+                                     np.nan),
+        }
+
+
+def hourly_profile(pct: np.ndarray, counts: np.ndarray) -> np.ndarray:
+    """(windows, lots, 7, 24) reading-weighted occupancy per hour; NaN for hours without data."""
+    weights = np.where(np.isnan(pct), 0, counts)
+    hours = pct.shape[:3] + (TIME_SLOTS // SLOTS_PER_HOUR, SLOTS_PER_HOUR)
+    sums = (np.nan_to_num(pct) * weights).reshape(hours).sum(axis=-1)
+    totals = weights.reshape(hours).sum(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(totals > 0, sums / totals, np.nan)
+
+
+def peak_hours(hourly: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """(windows, lots, 7) peak hour (-1 without data) and its occupancy."""
+    filled = np.where(np.isnan(hourly), -np.inf, hourly)
+    hour = filled.argmax(axis=-1)
+    value = np.take_along_axis(hourly, hour[..., None], axis=-1)[..., 0]
+    return np.where(np.isnan(value), -1, hour), value
+
+
+def window_deltas(pct: np.ndarray) -> Dict[str, np.ndarray]:
+    """Each window minus the next longer one, per (window pair, lot), over cells with data in both."""
+    delta = pct[:-1] - pct[1:]
+    both = ~np.isnan(delta)
+    cells = both.sum(axis=(2, 3))
+    flat = np.where(both, np.abs(delta), -1.0).reshape(delta.shape[:2] + (-1,))
+    at = flat.argmax(axis=-1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return {
+            "cells": cells,
+            "mean_delta": np.where(cells > 0, np.where(both, delta, 0).sum(axis=(2, 3)) / cells, np.nan),
+            "max_delta": np.where(cells > 0, np.take_along_axis(delta.reshape(flat.shape), at[..., None],
+                                                                axis=-1)[..., 0], np.nan),
+            "max_delta_day": at // TIME_SLOTS,
+            "max_delta_slot": at % TIME_SLOTS,
+        }
+
+
+def fill_times(pct: np.ndarray, full_pct: float = FULL_PCT) -> np.ndarray:
+    """(windows, lots, 7) first slot above full_pct, -1 where the lot never gets that full."""
+    over = np.nan_to_num(pct, nan=-1.0) > full_pct
+    return np.where(over.any(axis=-1), over.argmax(axis=-1), -1)
+
+
+def slot_label(slot: int) -> str:
+    hours, minutes = divmod(int(slot) * SLOT_MINUTES, 60)
+    return f"{hours:02d}:{minutes:02d}"
+
+
+def _round(value) -> Optional[float]:
+    return None if np.isnan(value) else float(round_half_up(float(value)))
+
+
+@timed("analytics.report")
+def build_report(data: Dict, full_pct: float = FULL_PCT) -> List[Row]:
+    """All report rows (section, window, lot, day, metric, value) from loaded window arrays."""
+    windows, pct, counts = data["windows"], data["pct"], data["counts"]
+    stats = summary_stats(pct, counts)
+    peak_hour, peak_value = peak_hours(hourly_profile(pct, counts))
+    deltas = window_deltas(pct)
+    fills = fill_times(pct, full_pct)
+
+    rows: List[Row] = []
+    for w, window in enumerate(windows):
+        for l, lot in enumerate(LOTS):
+            for metric, values in stats.items():
+                value = values[w, l]
+                rows.append(("summary", window, lot, "", metric,
+                             int(value) if metric in ("cells", "readings") else _round(value)))
+            for d, day in enumerate(DAY_LABELS):
+                hour = int(peak_hour[w, l, d])
+                rows.append(("peak_hour", window, lot, day, "hour", hour if hour >= 0 else None))
+                rows.append(("peak_hour", window, lot, day, "occupancy_pct", _round(peak_value[w, l, d])))
+                slot = int(fills[w, l, d])
+                rows.append(("fill_time", window, lot, day, f"first_above_{full_pct:g}",
+                             slot_label(slot) if slot >= 0 else None))
+    for w in range(len(windows) - 1):
+        pair = f"{windows[w]}-{windows[w + 1]}"
+        for l, lot in enumerate(LOTS):
+            rows.append(("delta", pair, lot, "", "cells", int(deltas["cells"][w, l])))
+            rows.append(("delta", pair, lot, "", "mean_delta_pct", _round(deltas["mean_delta"][w, l])))
+            rows.append(("delta", pair, lot, "", "max_delta_pct", _round(deltas["max_delta"][w, l])))
+            if deltas["cells"][w, l]:
+                at = (f"{DAY_LABELS[deltas['max_delta_day'][w, l]]} "
+                      f"{slot_label(deltas['max_delta_slot'][w, l])}")
+                rows.append(("delta", pair, lot, "", "max_delta_at", at))
+    return rows
+
+
+def _table(header: List[str], lines: List[List[str]]) -> List[str]:
+    widths = [max(len(str(cell)) for cell in column) for column in zip(header, *lines)]
+    return ["  ".join(str(cell).ljust(width) for cell, width in zip(line, widths)).rstrip()
+            for line in [header] + lines]
+
+
+def render_text(rows: List[Row], full_pct: float = FULL_PCT) -> Iterator[str]:
+    """Human-readable tables, one per section."""
+    by_key: Dict[Tuple[str, str, str, str], Dict[str, object]] = {}
+    for section, window, lot, day, metric, value in rows:
+        by_key.setdefault((section, window, lot, day), {})[metric] = value
+    fmt = lambda v, spec="{:.1f}": "—" if v is None else spec.format(v)
+
+    keys = [k for k in by_key if k[0] == "summary"]
+    yield "📊 Summary (occupancy %, 5-minute weekday cells)"
+    yield from _table(
+        ["window", "lot", "cells", "coverage", "readings", "min", "max", "mean", "weighted"],
+        [[w, lot, str(m["cells"]), fmt(m["coverage_pct"], "{:.1f}%"), f"{m['readings']:,}",
+          fmt(m["min_pct"]), fmt(m["max_pct"]), fmt(m["mean_pct"]), fmt(m["weighted_pct"])]
+         for (_, w, lot, _), m in ((k, by_key[k]) for k in keys)])
+
+    pairs = list(dict.fromkeys((w, lot) for s, w, lot, _ in by_key if s == "peak_hour"))
+    yield ""
+    yield "🕐 Peak hour per weekday (hour: occupancy %)"
+    yield from _table(
+        ["window", "lot"] + DAY_LABELS,
+        [[w, lot] + [("—" if m["hour"] is None else f"{m['hour']:02d}h {m['occupancy_pct']:.1f}")
+                     for m in (by_key[("peak_hour", w, lot, day)] for day in DAY_LABELS)]
+         for w, lot in pairs])
+
+    yield ""
+    yield f"⏳ Fill time per weekday (first slot above {full_pct:g}%)"
+    metric = f"first_above_{full_pct:g}"
+    yield from _table(
+        ["window", "lot"] + DAY_LABELS,
+        [[w, lot] + [fmt(by_key[("fill_time", w, lot, day)][metric], "{}") for day in DAY_LABELS]
+         for w, lot in pairs])
+
+    deltas = [(k, by_key[k]) for k in by_key if k[0] == "delta"]
+    if deltas:
+        yield ""
+        yield "📈 Window-over-window change (shorter minus longer window, percentage points)"
+        yield from _table(
+            ["windows", "lot", "cells", "mean Δ", "largest Δ", "at"],
+            [[w.replace("-", " vs "), lot, str(m["cells"]), fmt(m["mean_delta_pct"], "{:+.1f}"),
+              fmt(m["max_delta_pct"], "{:+.1f}"), m.get("max_delta_at", "—")]
+             for (_, w, lot, _), m in deltas])
+
+
+def write_csv(rows: List[Row], f):
+    writer = csv.writer(f)
+    writer.writerow(["section", "window", "lot", "day", "metric", "value"])
+    writer.writerows(["" if cell is None else cell for cell in row] for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vectorized multi-window occupancy analytics")
+    parser.add_argument("--source", choices=("files", "rollups"), default="files",
+                        help="Window heatmap files (default) or the daily rollups in PostgreSQL")
+    parser.add_argument("--heatmaps-dir", default=OUTPUT_DIR, help=f"Window files directory (default {OUTPUT_DIR})")
+    parser.add_argument("--format", choices=("text", "csv"), default="text")
+    parser.add_argument("--output", help="Write the report here instead of stdout")
+    parser.add_argument("--full-pct", type=float, default=FULL_PCT,
+                        help=f"Fill-time threshold in percent (default {FULL_PCT:g})")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    if args.source == "rollups":
+        from db import DB
+        db = DB()
+        try:
+            data = load_rollup_windows(db)
+        finally:
+            db.close_connection()
+    else:
+        data = load_window_files(args.heatmaps_dir)
+    if data is None:
+        print("❌ No heatmap data found")
+        raise SystemExit(1)
+    loaded = time.perf_counter()
+    rows = build_report(data, args.full_pct)
+    computed = time.perf_counter()
+
+    f = open(args.output, 'w', newline='', encoding='utf-8') if args.output else sys.stdout
+    try:
+        if args.format == "csv":
+            write_csv(rows, f)
+        else:
+            for line in render_text(rows, args.full_pct):
+                print(line, file=f)
+    finally:
+        if args.output:
+            f.close()
+
+    timing = (f"{len(data['windows'])} windows × {len(LOTS)} lots: loaded in {(loaded - start) * 1000:.0f} ms, "
+              f"computed in {(computed - loaded) * 1000:.0f} ms")
+    if args.output:
+        print(f"✅ Report written to {args.output} ({timing})")
+    elif args.format == "text":
+        print(f"\n⏱️  {timing}")
+
+
+if __name__ == "__main__":
+    main()
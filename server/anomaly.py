@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Streaming anomaly detection for event days (game days, campus events).
+
+Each (lot, day of week, 5-minute slot) cell keeps Welford running statistics
+(count, mean, M2) of occupancy %. An incoming reading is anomalous when it is
+more than ANOMALY_Z_THRESHOLD standard deviations from its cell's mean, once
+the cell has ANOMALY_MIN_SAMPLES readings. Anomalous readings are not folded
+into the statistics, so a recurring event keeps standing out instead of
+dragging its cells' baseline towards itself. A (local day, lot) is flagged
+once it collects ANOMALY_DAY_MIN_READINGS anomalous readings; flagged days are
+stored in parking_anomaly_days so the aggregator can exclude them.
+
+A lasting change (semester start, a lot losing capacity) flags most days
+rather than one a week. Once a lot has ANOMALY_SHIFT_DAYS flagged days within
+ANOMALY_SHIFT_WINDOW_DAYS, its cells are re-baselined: their weight is cut
+back to ANOMALY_MIN_SAMPLES readings (mean and variance kept) and every
+reading is folded in, anomalous or not, until a whole window passes without a
+flagged day. The new level is learned within a few weeks instead of being
+flagged forever.
+
+State is checkpointed to ANOMALY_STATE_PATH as JSON after each crawl tick,
+merged per lot like the decayed heatmap state when crawl workers are sharded.
+
+Usage:
+    python anomaly.py --rebuild   # replay all DB history to warm up state and flag past days
+    python anomaly.py --self-check   # recurring spike flagged every time, step change learned
+"""
+import os
+import json
+import math
+import argparse
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Tuple
+from dotenv import load_dotenv
+from decayed_heatmap import CENTRAL_TZ, CELLS, cell_index, checkpoint_lock, write_checkpoint
+
+load_dotenv()
+
+# Configuration
+ANOMALY_STATE_PATH = os.getenv("ANOMALY_STATE_PATH", "./state/anomaly_state.json")
+ANOMALY_Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3"))
+ANOMALY_MIN_SAMPLES = int(os.getenv("ANOMALY_MIN_SAMPLES", "8"))
+ANOMALY_DAY_MIN_READINGS = int(os.getenv("ANOMALY_DAY_MIN_READINGS", "12"))
+# Occupancy is coarse (2-4 spots per lot), so never trust a std below this many points
+ANOMALY_MIN_STD = float(os.getenv("ANOMALY_MIN_STD", "10"))
+# Per-day counters older than this are dropped from the checkpoint
+DAY_COUNTER_RETENTION_DAYS = 3
+# This many flagged days within the window mean the lot's baseline moved, not an event
+ANOMALY_SHIFT_DAYS = int(os.getenv("ANOMALY_SHIFT_DAYS", "4"))
+ANOMALY_SHIFT_WINDOW_DAYS = 7
+
+
+class AnomalyDetector:
+    def __init__(self):
+        # lot_id -> {"n": [...], "mean": [...], "m2": [...]} flat over CELLS
+        self.lots: Dict[int, Dict[str, list]] = {}
+        # (local day ISO string, lot_id) -> [anomalous readings, readings]
+        self.days: Dict[Tuple[str, int], list] = {}
+        # lot_id -> {"flagged": [local day ISO strings within the shift window], "rebaseline": bool}
+        self.shifts: Dict[int, Dict] = {}
+
+    def _lot(self, lot_id: int) -> Dict[str, list]:
+        lot = self.lots.get(lot_id)
+        if lot is None:
+            lot = self.lots[lot_id] = {"n": [0] * CELLS, "mean": [0.0] * CELLS, "m2": [0.0] * CELLS}
+        return lot
+
+    def _shift(self, lot_id: int, day: date) -> Dict:
+        """The lot's shift state with flagged days outside the window (ending on `day`) dropped."""
+        shift = self.shifts.setdefault(lot_id, {"flagged": [], "rebaseline": False})
+        shift["flagged"] = [d for d in shift["flagged"]
+                            if (day - date.fromisoformat(d)).days < ANOMALY_SHIFT_WINDOW_DAYS]
+        if shift["rebaseline"] and not shift["flagged"]:
+            shift["rebaseline"] = False
+        return shift
+
+    def _start_rebaseline(self, lot_id: int):
+        """Cut every cell's weight back to ANOMALY_MIN_SAMPLES, keeping its mean and variance."""
+        lot = self._lot(lot_id)
+        for i, n in enumerate(lot["n"]):
+            if n > ANOMALY_MIN_SAMPLES:
+                lot["m2"][i] *= (ANOMALY_MIN_SAMPLES - 1) / (n - 1)
+                lot["n"][i] = ANOMALY_MIN_SAMPLES
+        self.shifts[lot_id]["rebaseline"] = True
+
+    def observe(self, lot_id: int, timestamp: datetime, occupied_spots: int,
+                available_spots: int) -> Optional[Tuple[date, int, int, int]]:
+        """
+        Score one reading against its cell, then fold it into the running
+        statistics unless it is anomalous (while the lot is re-baselining, fold it anyway).
+
+        Returns:
+            (day, lot_id, anomalous_readings, readings) when this reading is anomalous
+            and its day is (now) flagged, else None
+        """
+        capacity = occupied_spots + available_spots
+        if capacity <= 0:
+            return None
+        local_ts = timestamp.astimezone(CENTRAL_TZ)
+        local_day = local_ts.date()
+        shift = self._shift(lot_id, local_day)
+        x = occupied_spots / capacity * 100
+        i = cell_index(local_ts)
+        lot = self._lot(lot_id)
+        n, mean, m2 = lot["n"][i], lot["mean"][i], lot["m2"][i]
+
+        anomalous = False
+        if n >= ANOMALY_MIN_SAMPLES:
+            std = max(math.sqrt(m2 / (n - 1)), ANOMALY_MIN_STD)
+            anomalous = abs(x - mean) / std > ANOMALY_Z_THRESHOLD
+
+        if not anomalous or shift["rebaseline"]:
+            # Welford update
+            n += 1
+            delta = x - mean
+            mean += delta / n
+            m2 += delta * (x - mean)
+            lot["n"][i], lot["mean"][i], lot["m2"][i] = n, mean, m2
+
+        key = (local_day.isoformat(), lot_id)
+        counter = self.days.setdefault(key, [0, 0])
+        counter[1] += 1
+        if anomalous:
+            counter[0] += 1
+            if counter[0] >= ANOMALY_DAY_MIN_READINGS:
+                if counter[0] == ANOMALY_DAY_MIN_READINGS:
+                    shift["flagged"].append(key[0])
+                    if not shift["rebaseline"] and len(shift["flagged"]) >= ANOMALY_SHIFT_DAYS:
+                        self._start_rebaseline(lot_id)
+                return local_day, lot_id, counter[0], counter[1]
+        return None
+
+    def flagged_days(self):
+        """All (day, lot_id, anomalous_readings, readings) currently over the day threshold."""
+        return [(date.fromisoformat(day), lot_id, anomalous, total)
+                for (day, lot_id), (anomalous, total) in self.days.items()
+                if anomalous >= ANOMALY_DAY_MIN_READINGS]
+
+    def prune_days(self, today: date):
+        """Forget per-day counters for days that can no longer receive readings."""
+        self.days = {key: counter for key, counter in self.days.items()
+                     if (today - date.fromisoformat(key[0])).days <= DAY_COUNTER_RETENTION_DAYS}
+
+    def save(self, path: str = ANOMALY_STATE_PATH, lot_ids: Optional[Iterable[int]] = None):
+        """
+        Atomically write the checkpoint.
+
+        Args:
+            path: Checkpoint file
+            lot_ids: Only replace these lots in the existing file (None writes every lot)
+        """
+        self.prune_days(datetime.now(CENTRAL_TZ).date())
+        with checkpoint_lock(path):
+            lots, days, shifts = self.lots, self.days, self.shifts
+            if lot_ids is not None and os.path.exists(path):
+                owned = set(lot_ids)
+                existing = type(self).load(path)
+                lots = {lot_id: lot for lot_id, lot in existing.lots.items() if lot_id not in owned}
+                lots.update({lot_id: lot for lot_id, lot in self.lots.items() if lot_id in owned})
+                days = {key: counter for key, counter in existing.days.items() if key[1] not in owned}
+                days.update({key: counter for key, counter in self.days.items() if key[1] in owned})
+                shifts = {lot_id: shift for lot_id, shift in existing.shifts.items() if lot_id not in owned}
+                shifts.update({lot_id: shift for lot_id, shift in self.shifts.items() if lot_id in owned})
+            write_checkpoint(path, {
+                "lots": {str(lot_id): lot for lot_id, lot in lots.items()},
+                "days": [[day, lot_id, *counter] for (day, lot_id), counter in days.items()],
+                "shifts": {str(lot_id): shift for lot_id, shift in shifts.items()},
+            })
+
+    @classmethod
+    def load(cls, path: str = ANOMALY_STATE_PATH) -> "AnomalyDetector":
+        """Load the checkpoint, or start empty if there is none."""
+        detector = cls()
+        if not os.path.exists(path):
+            return detector
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        detector.lots = {int(lot_id): lot for lot_id, lot in data.get("lots", {}).items()}
+        detector.days = {(day, int(lot_id)): [anomalous, total]
+                         for day, lot_id, anomalous, total in data.get("days", [])}
+        detector.shifts = {int(lot_id): shift for lot_id, shift in data.get("shifts", {}).items()}
+        return detector
+
+
+# Process-wide state used by the crawler
+_state: Optional[AnomalyDetector] = None
+
+
+def get_state() -> AnomalyDetector:
+    """Return the crawler's detector, loading the checkpoint on first use."""
+    global _state
+    if _state is None:
+        try:
+            _state = AnomalyDetector.load()
+        except Exception as e:
+            print(f"⚠️  Failed to load anomaly state, starting empty: {e}")
+            _state = AnomalyDetector()
+    return _state
+
+
+def reset_state():
+    """Drop the in-memory state so the next get_state() re-reads the checkpoint."""
+    global _state
+    _state = None
+
+
+def rebuild_from_db(path: str = ANOMALY_STATE_PATH) -> bool:
+    """Replay every stored reading in order, flagging past event days along the way."""
+    from db import DB
+    db = DB()
+    detector = AnomalyDetector()
+    flagged = {}
+    rows = 0
+    try:
+        for chunk in db.iter_readings():
+            for timestamp, lot_id, occupied, available in chunk:
+                record = detector.observe(lot_id, timestamp, occupied, available)
+                if record:
+                    flagged[(record[0], record[1])] = record
+            rows += len(chunk)
+        for day, lot_id, anomalous, total in flagged.values():
+            db.flag_anomaly_day(day, lot_id, anomalous, total)
+    finally:
+        db.close_connection()
+    detector.save(path)
+    print(f"✅ Replayed {rows} readings, flagged {len(flagged)} lot-days -> {path}")
+    return True
+
+
+def self_check(normal_weeks: int = 10, spike_weeks: int = 8, step_weeks: int = 8,
+               step_learn_days: int = 28) -> bool:
+    """
+    Two synthetic scenarios on one lot, ANOMALY_DAY_MIN_READINGS morning readings a day:
+      - Recurring event: normal Mondays, then the same full-lot spike week after
+        week, then a normal Monday. Every spike Monday must be flagged and the
+        final normal one must not be.
+      - Step change: normal days, then the lot is full every day from then on.
+        The step must be flagged at first and no longer after step_learn_days.
+    """
+    first_monday = CENTRAL_TZ.localize(datetime(2026, 4, 6, 8, 0))  # no DST change for 19 weeks
+    slots = [timedelta(minutes=5 * k) for k in range(ANOMALY_DAY_MIN_READINGS)]
+
+    def feed(detector: AnomalyDetector, day: datetime, occupied) -> bool:
+        results = [detector.observe(1, day + offset, occupied(k), 4 - occupied(k)) for k, offset in enumerate(slots)]
+        return any(results)
+
+    detector = AnomalyDetector()
+    for week in range(normal_weeks):
+        feed(detector, first_monday + timedelta(weeks=week), lambda k: 1 + (week + k) % 2)
+    flagged = [feed(detector, first_monday + timedelta(weeks=normal_weeks + week), lambda k: 4)
+               for week in range(spike_weeks)]
+    after = feed(detector, first_monday + timedelta(weeks=normal_weeks + spike_weeks), lambda k: 1 + k % 2)
+    print(f"Spike Mondays flagged: {sum(flagged)}/{spike_weeks}; normal Monday afterwards flagged: {after}")
+
+    detector = AnomalyDetector()
+    for day in range(normal_weeks * 7):
+        feed(detector, first_monday + timedelta(days=day), lambda k: 1 + (day // 7 + k) % 2)
+    step_days = [day for day in range(step_weeks * 7)
+                 if feed(detector, first_monday + timedelta(days=normal_weeks * 7 + day), lambda k: 4)]
+    last = step_days[-1] + 1 if step_days else 0
+    print(f"Step change: {len(step_days)} of {step_weeks * 7} days flagged, last on day {last}")
+    learned = bool(step_days) and step_days[0] == 0 and last <= step_learn_days
+
+    return all(flagged) and not after and learned
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Streaming anomaly detector state")
+    parser.add_argument("--rebuild", action="store_true", help="Replay all DB history")
+    parser.add_argument("--self-check", action="store_true",
+                        help="Check on synthetic data that a recurring spike keeps being flagged "
+                             "and a step change is learned")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild_from_db()
+    elif args.self_check:
+        ok = self_check()
+        print("✅ Recurring spike flagged every time, step change learned" if ok
+              else "❌ Recurring spike not flagged every time, or step change never learned")
+        raise SystemExit(0 if ok else 1)
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+"""
+Benchmark forecast fitting on synthetic history.
+
+Builds (lots, days, 288) rollup arrays shaped like load_history() output and
+times fit_forecast() over them, so no database is needed.
+
+Usage:
+    python bench_forecast.py [--lots 120] [--years 3] [--repeat 3]
+"""
+import argparse
+import time
+import numpy as np
+from forecast import fit_forecast, FORECAST_DAYS, TIME_SLOTS
+
+
+def synthetic_history(lots: int, days: int, seed: int = 0):
+    """One reading per 5-minute slot with a daily occupancy curve plus noise; ~10% of slots missing."""
+    rng = np.random.default_rng(seed)
+    curve = 50 + 40 * np.sin(np.linspace(0, np.pi, TIME_SLOTS, dtype=np.float32))
+    occupancy = np.clip(curve[None, None, :] + rng.normal(0, 15, (lots, days, TIME_SLOTS)).astype(np.float32), 0, 100)
+    counts = (rng.random((lots, days, TIME_SLOTS)) > 0.1).astype(np.int32)
+    full = ((occupancy >= 95) & (counts > 0)).astype(np.int32)
+    return occupancy * counts, counts, full
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forecast fitting benchmark")
+    parser.add_argument("--lots", type=int, default=120, help="Number of lots (default 120)")
+    parser.add_argument("--years", type=float, default=3, help="Years of daily history (default 3)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs (default 3)")
+    args = parser.parse_args()
+
+    days = int(args.years * 365)
+    print(f"Generating {args.lots} lots × {days} days × {TIME_SLOTS} slots...")
+    occupancy_sum, occupancy_count, full_count = synthetic_history(args.lots, days)
+    first_date = np.datetime64("2020-01-01")
+    horizon = [first_date + np.timedelta64(days + i, "D") for i in range(FORECAST_DAYS)]
+
+    timings = []
+    for _ in range(args.repeat):
+        start = time.perf_counter()
+        occupancy, p_free = fit_forecast(occupancy_sum, occupancy_count, full_count, first_date, horizon)
+        timings.append(time.perf_counter() - start)
+
+    cells = args.lots * 7 * TIME_SLOTS
+    print(f"Fitted {cells:,} (lot, weekday, slot) cells")
+    print(f"  best {min(timings):.2f}s   mean {sum(timings) / len(timings):.2f}s   over {args.repeat} runs")
+    print(f"  output shape {occupancy.shape}, NaN cells {int(np.isnan(occupancy).sum())}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Benchmark plain vs prepared execution of the hot DB statements.
+
+Each mode runs in its own scratch schema (selected through search_path via
+PGOPTIONS, like bench_workers.py), where DB.create_table() builds every object
+the statements touch (parking_data, lots, the parking_readings view and
+parking_readings_since(), rollup, retention and anomaly tables). parking_data
+is seeded with a production-sized history, then add_data and get_heatmap_data
+are timed with DB(use_prepared=False/True). The schema is dropped afterwards,
+so production data is never read or touched and a fresh database works.
+
+Usage:
+    python bench_prepared.py [--days 365] [--inserts 2000] [--windows 20]
+"""
+import os
+import argparse
+import io
+import statistics
+import time
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta
+import pytz
+from db import DB, LOT_INFO
+
+CENTRAL_TZ = pytz.timezone('America/Chicago')
+WINDOWS = [7, 30, 90, 120, None]
+
+
+def query(db: DB, sql: str):
+    cursor = db.conn.cursor()
+    cursor.execute(sql)
+    db.conn.commit()
+    cursor.close()
+
+
+def seed_table(db: DB, days: int):
+    """Create the schema objects and fill parking_data with 5-minute readings for every lot."""
+    with redirect_stdout(io.StringIO()):
+        if not db.create_table():
+            raise RuntimeError("failed to create the benchmark tables")
+    cursor = db.conn.cursor()
+    cursor.execute("""
+        INSERT INTO parking_data (timestamp, lot_id, occupied_spots, available_spots)
+        SELECT ts, lot_id, occ, 4 - occ
+        FROM (
+            SELECT ts, lot_id, (random() * 4)::int AS occ
+            FROM generate_series(NOW() - %s * INTERVAL '1 day', NOW(), INTERVAL '5 minutes') AS ts,
+                 unnest(%s::int[]) AS lot_id
+        ) readings
+    """, (days, [int(k) for k in LOT_INFO]))
+    cursor.execute("ANALYZE parking_data")
+    cursor.execute("SELECT COUNT(*) FROM parking_data")
+    rows = cursor.fetchone()[0]
+    db.conn.commit()
+    cursor.close()
+    return rows
+
+
+def time_calls(func, n):
+    """Return per-call latencies in milliseconds."""
+    latencies = []
+    for i in range(n):
+        start = time.perf_counter()
+        func(i)
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+def summarize(label, latencies):
+    latencies = sorted(latencies)
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if len(latencies) > 1 else latencies[0]
+    print(f"  {label:<28} median {statistics.median(latencies):8.3f} ms   "
+          f"p95 {p95:8.3f} ms   n={len(latencies)}")
+
+
+def run(days: int, inserts: int, windows: int):
+    base_ts = CENTRAL_TZ.localize(datetime(2000, 1, 1))
+
+    for use_prepared in (False, True):
+        label = "prepared" if use_prepared else "plain"
+        schema = f"bench_prepared_{os.getpid()}_{label}"
+        # libpq reads PGOPTIONS at connect time, so every connection (streams included) uses the scratch schema
+        os.environ["PGOPTIONS"] = f"-c search_path={schema}"
+        db = DB(use_prepared=use_prepared)
+        try:
+            query(db, f"CREATE SCHEMA {schema}")
+            rows = seed_table(db, days)
+            print(f"\n[{label}] seeded {rows:,} rows ({days} days × {len(LOT_INFO)} lots) in schema {schema}")
+
+            insert_lat = time_calls(
+                lambda i: db.add_data(base_ts + timedelta(minutes=5 * i), 1, 2, 2), inserts)
+            summarize("add_data", insert_lat)
+
+            for window in WINDOWS:
+                name = f"{window}d" if window else "all"
+                # Silence the per-call progress line from get_heatmap_data
+                with redirect_stdout(io.StringIO()):
+                    lat = time_calls(lambda i: db.get_heatmap_data(window), windows)
+                summarize(f"get_heatmap_data({name})", lat)
+        finally:
+            try:
+                db.conn.rollback()
+                query(db, f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+            finally:
+                db.close_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Plain vs prepared statement latency benchmark")
+    parser.add_argument("--days", type=int, default=365, help="Days of history to seed (default 365)")
+    parser.add_argument("--inserts", type=int, default=2000, help="add_data calls to time")
+    parser.add_argument("--windows", type=int, default=20, help="Calls per heatmap window to time")
+    args = parser.parse_args()
+    run(args.days, args.inserts, args.windows)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Regression harness for versioned R2 publishing.
+
+Publishes a synthetic heatmap directory (meta.json, range files, forecast.json
+and --tiles day tiles behind tiles/index.json) through r2_publish with real
+boto3 against fake_r2.py, started in-process, and checks each step:
+
+  1. first publish: everything reachable from meta.json, versioned objects
+     immutable, meta.json short-lived
+  2. same files again: nothing uploaded
+  3. one range file and every tile changed: only those (plus the manifests)
+     uploaded, superseded versions still readable during the grace period
+  4. past the grace period: superseded versions and the fixed keys an older
+     publisher left behind deleted in batches of at most 1000 keys, every
+     current object still reachable
+
+The clock is simulated, so no step waits. No R2 credentials are used.
+
+Usage:
+    python bench_publish.py [--tiles 1200] [--page-size 250]
+"""
+import os
+import json
+import time
+import shutil
+import tempfile
+import argparse
+from datetime import datetime, timedelta, timezone
+import boto3
+from botocore.config import Config
+from fake_r2 import FakeR2, serve
+from r2_publish import (
+    publish, ROOT_MANIFEST, IMMUTABLE_CACHE_CONTROL, R2_MANIFEST_MAX_AGE, R2_GC_GRACE_HOURS, VERSIONED_KEY,
+)
+
+BUCKET = "parking-stat"
+PREFIX = "heatmaps/"
+TILE_INDEX = "tiles/index.json"
+RANGES = ("7d", "30d", "all")
+LEGACY_KEYS = ("7d.json", "30d.json", "all.json")
+
+
+def write_json(output_dir, name, doc):
+    path = os.path.join(output_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(doc, f)
+
+
+def build_site(output_dir, tiles, generation):
+    """Write the synthetic site; `generation` changes 7d.json and every tile."""
+    names = []
+    for range_name in RANGES:
+        name = f"{range_name}.json"
+        write_json(output_dir, name, {"range": range_name, "v": generation if range_name == "7d" else 0})
+        names.append(name)
+    write_json(output_dir, "forecast.json", {"days": 7})
+    names.append("forecast.json")
+
+    first = datetime(2023, 1, 1)
+    for i in range(tiles):
+        name = f"tiles/5m/{(first + timedelta(days=i)).date().isoformat()}.json"
+        write_json(output_dir, name, {"tile": i, "v": generation})
+        names.append(name)
+    write_json(output_dir, TILE_INDEX, {"tiles": {"5M": "tiles/5m/{day}.json"}})
+    write_json(output_dir, ROOT_MANIFEST, {"files": [f"{r}.json" for r in RANGES], "tiles": TILE_INDEX})
+    return names + [TILE_INDEX, ROOT_MANIFEST]
+
+
+def reachable(client):
+    """Fetch meta.json and everything it points at; returns (key -> Cache-Control) or raises."""
+    def get(key):
+        response = client.get_object(Bucket=BUCKET, Key=f"{PREFIX}{key}")
+        return json.loads(response["Body"].read()), response.get("CacheControl")
+
+    meta, meta_cache = get(ROOT_MANIFEST)
+    seen = {ROOT_MANIFEST: meta_cache}
+    keys = list(meta["files"]) + list(meta["objects"].values())
+    tiles, seen[meta["tiles"]] = get(meta["tiles"])
+    keys += list(tiles["objects"].values())
+    for key in keys:
+        seen[key] = get(key)[1]
+    return seen
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned R2 publishing regression harness")
+    parser.add_argument("--tiles", type=int, default=1200, help="Day tiles (default 1200, above one delete batch)")
+    parser.add_argument("--page-size", type=int, default=250, help="Fake ListObjectsV2 page cap (default 250)")
+    args = parser.parse_args()
+
+    fake = FakeR2(args.page_size)
+    server = serve(fake)
+    host, port = server.server_address[:2]
+    client = boto3.session.Session().client(
+        "s3", endpoint_url=f"http://{host}:{port}", aws_access_key_id="fake", aws_secret_access_key="fake",
+        region_name="auto", config=Config(s3={"addressing_style": "path"}),
+    )
+    workdir = tempfile.mkdtemp(prefix="bench_publish_")
+    output_dir = os.path.join(workdir, "heatmaps")
+    state_path = os.path.join(workdir, "state", "r2_publish.json")
+    t0 = datetime(2026, 10, 1, 5, tzinfo=timezone.utc)
+    failures = []
+
+    def check(label, ok):
+        print(f"  {'✅' if ok else '❌'} {label}")
+        if not ok:
+            failures.append(label)
+
+    def run(step, now):
+        puts = fake.requests["put"]
+        start = time.perf_counter()
+        ok = publish(client, BUCKET, PREFIX, output_dir, names, [TILE_INDEX, ROOT_MANIFEST], now,
+                     R2_GC_GRACE_HOURS, state_path)
+        print(f"  ({time.perf_counter() - start:.2f} s)")
+        check(f"{step}: publish succeeded", ok)
+        return fake.requests["put"] - puts
+
+    try:
+        for key in LEGACY_KEYS:
+            fake.put(BUCKET, f"{PREFIX}{key}", b"{}", {"Content-Type": "application/json"})
+
+        print("\n[1] First publish")
+        names = build_site(output_dir, args.tiles, 1)
+        uploaded = run("first", t0)
+        check(f"uploaded {uploaded} objects (expected {len(names)})", uploaded == len(names))
+        seen = reachable(client)
+        check(f"{len(seen)} objects reachable from meta.json", len(seen) == len(names))
+        check("meta.json is short-lived", seen.pop(ROOT_MANIFEST) == f"public, max-age={R2_MANIFEST_MAX_AGE}")
+        check("all other objects are immutable and versioned",
+              all(cache == IMMUTABLE_CACHE_CONTROL and VERSIONED_KEY.search(key) for key, cache in seen.items()))
+        first_version = set(seen)
+
+        print("\n[2] Same files again")
+        uploaded = run("unchanged", t0 + timedelta(hours=1))
+        check(f"uploaded {uploaded} objects (expected 0)", uploaded == 0)
+
+        print("\n[3] 7d.json and every tile changed")
+        names = build_site(output_dir, args.tiles, 2)
+        changed_at = t0 + timedelta(hours=2)
+        uploaded = run("changed", changed_at)
+        check(f"uploaded {uploaded} objects (expected {args.tiles + 3})", uploaded == args.tiles + 3)
+        keys = set(fake.keys(BUCKET))
+        check("superseded versions still readable", all(f"{PREFIX}{key}" in keys for key in first_version))
+
+        print("\n[4] Past the grace period")
+        deletes = fake.requests["delete"]
+        run("collect", changed_at + timedelta(hours=R2_GC_GRACE_HOURS, minutes=1))
+        seen = reachable(client)
+        keys = set(fake.keys(BUCKET))
+        expected_deleted = len(first_version - set(seen)) + len(LEGACY_KEYS)
+        check(f"{fake.requests['deleted_keys']} objects deleted (expected {expected_deleted}) "
+              f"in {fake.requests['delete'] - deletes} requests",
+              fake.requests["deleted_keys"] == expected_deleted)
+        check(f"bucket holds exactly the {len(seen)} reachable objects", keys == {f"{PREFIX}{k}" for k in seen})
+    finally:
+        server.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    counts = ", ".join(f"{op} {n:,}" for op, n in sorted(fake.requests.items()))
+    print(f"\nFake R2 requests: {counts}")
+    print("✅ Versioned publishing behaves as expected" if not failures else f"❌ {len(failures)} checks failed")
+    raise SystemExit(0 if not failures else 1)
+
+
+if __name__ == "__main__":
+    main()
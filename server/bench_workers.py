@@ -0,0 +1,265 @@
+#!/usr/bin/env python3
+"""
+Failover harness for the sharded crawl workers.
+
+Starts --workers crawl_worker.CrawlWorker processes against fake_fopark.py
+(served in-process) and a scratch schema holding its own parking_data, lots
+and rollup tables, then drives --ticks simulated ticks. During --kill-tick one
+worker is SIGKILLed while it is still crawling; the survivors take over its
+lots on the next tick. Afterwards every (lot, tick) must have exactly one
+reading in parking_readings. The only exception is the kill tick, where lots
+the killed worker held may have no reading (never two).
+
+The real lots plus --lots synthetic ones are crawled, all from the fake
+server. Advisory locks use their own namespaces (--lock-ns), checkpoints go to
+a temporary directory and the schema is dropped at the end, so the harness can
+run next to production workers on the same database.
+
+Usage:
+    python bench_workers.py [--workers 3] [--lots 12] [--ticks 8] [--kill-tick 4]
+                            [--latency-ms 20] [--change-probability 1]
+"""
+import os
+import sys
+import time
+import signal
+import shutil
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timedelta
+from functools import partial
+from db import DB, LOT_REGISTRY, LOT_NAME_TO_ID
+from fake_fopark import SHAPES, FakeFopark, serve
+from parking_crawl import CENTRAL_TZ, TICK_MINUTES, FETCHERS, LOT_FETCHERS, occupancy_url
+from crawl_worker import LIVE_WORKERS_SQL, CrawlWorker, tick_timestamp
+
+# Synthetic lots get ids from here up (SMALLINT, clear of real lot ids)
+BENCH_LOT_ID_BASE = 1000
+# Protocol lines on a worker's stdout start with this; anything else is crawl output
+MARKER = "bench:"
+
+HELD_LOTS_SQL = """
+    SELECT pid, objid FROM pg_locks
+    WHERE locktype = 'advisory' AND objsubid = 2 AND granted AND classid = %s
+"""
+
+READING_COUNTS_SQL = """
+    SELECT lot_id, timestamp, COUNT(*) FROM parking_readings
+    GROUP BY lot_id, timestamp
+"""
+
+
+def register_bench_lots(lots: int):
+    """Add synthetic lots (served by fake_fopark as `<shape>-<n>`) to this process's registry."""
+    for i in range(lots):
+        lot_id, name, shape = BENCH_LOT_ID_BASE + i, f"Bench_{i}", SHAPES[i % len(SHAPES)]
+        LOT_REGISTRY[lot_id] = (name, 4 if shape != "haley" else 2, shape)
+        LOT_NAME_TO_ID[name] = lot_id
+        LOT_FETCHERS[name] = partial(FETCHERS[shape], occupancy_url(f"{shape}-{i}"))
+
+
+def tick_time(base: datetime, tick: int) -> datetime:
+    return base + timedelta(minutes=TICK_MINUTES * tick)
+
+
+def run_worker(lots: int, base: datetime):
+    """Worker process: register, then crawl one tick per line read from stdin."""
+    register_bench_lots(lots)
+    worker = CrawlWorker()
+    worker.register()
+    print(f"{MARKER} ready {worker.slot} {worker.lock_db.conn.get_backend_pid()}", flush=True)
+    for line in sys.stdin:
+        tick = int(line)
+        saved = worker.tick(tick_time(base, tick))
+        print(f"{MARKER} done {tick} {int(bool(saved))}", flush=True)
+
+
+class WorkerProcess:
+    def __init__(self, index: int, env: dict, lots: int, base: datetime, verbose: bool):
+        self.index = index
+        self.verbose = verbose
+        self.proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), "--worker", "--lots", str(lots), "--base", base.isoformat()],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE, env=env, text=True, bufsize=1,
+        )
+        _, slot, pid = self.expect("ready")
+        self.slot, self.backend_pid = int(slot), int(pid)
+
+    def expect(self, kind: str):
+        """Read up to the next protocol line of the given kind."""
+        while True:
+            line = self.proc.stdout.readline()
+            if not line:
+                raise RuntimeError(f"worker {self.index} exited (status {self.proc.poll()})")
+            if line.startswith(MARKER):
+                fields = line[len(MARKER):].split()
+                if fields[0] == kind:
+                    return fields
+            elif self.verbose:
+                print(f"  [w{self.index}] {line.rstrip()}")
+
+    def send_tick(self, tick: int):
+        self.proc.stdin.write(f"{tick}\n")
+        self.proc.stdin.flush()
+
+    def kill(self):
+        self.proc.send_signal(signal.SIGKILL)
+        self.proc.wait()
+
+    def stop(self):
+        if self.proc.poll() is None:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=30)
+
+
+def query(db: DB, sql: str, params=()):
+    cursor = db.conn.cursor()
+    cursor.execute(sql, params)
+    rows = cursor.fetchall() if cursor.description else []
+    db.conn.commit()
+    cursor.close()
+    return rows
+
+
+def held_lots(db: DB, namespace: int) -> dict:
+    """backend pid -> set of lot ids it holds."""
+    held = {}
+    for pid, lot_id in query(db, HELD_LOTS_SQL, (namespace,)):
+        held.setdefault(pid, set()).add(lot_id)
+    return held
+
+
+def wait_for_workers(db: DB, namespace: int, count: int, timeout: float = 10.0) -> bool:
+    """Wait until PostgreSQL has released the locks of dead workers."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if query(db, LIVE_WORKERS_SQL, (namespace,))[0][0] == count:
+            return True
+        time.sleep(0.05)
+    return False
+
+
+def run(args) -> bool:
+    schema = f"bench_workers_{os.getpid()}"
+    state_dir = tempfile.mkdtemp(prefix="bench_workers_")
+    ns_workers, ns_lots = args.lock_ns, args.lock_ns + 1
+
+    fake = FakeFopark(args.seed, args.latency_ms, args.jitter_ms, 0.0, change_probability=args.change_probability)
+    server = serve(fake)
+    host, port = server.server_address[:2]
+
+    # libpq reads PGOPTIONS at connect time, so every connection here and in the workers uses the scratch schema
+    env = dict(os.environ,
+               PGOPTIONS=f"-c search_path={schema}",
+               FOPARK_API_BASE=f"http://{host}:{port}",
+               CRAWL_ADAPTIVE="0",
+               CRAWL_LOCK_NS_WORKERS=str(ns_workers),
+               CRAWL_LOCK_NS_LOTS=str(ns_lots),
+               DECAY_STATE_PATH=os.path.join(state_dir, "decayed_heatmap.json"),
+               ANOMALY_STATE_PATH=os.path.join(state_dir, "anomaly_state.json"),
+               CRAWL_SCHEDULE_PATH=os.path.join(state_dir, "poll_schedule.json"),
+               METRICS_MODE="off")
+    os.environ["PGOPTIONS"] = env["PGOPTIONS"]
+
+    register_bench_lots(args.lots)
+    lot_ids = sorted(LOT_REGISTRY)
+    base = tick_timestamp(datetime.now(CENTRAL_TZ)) - timedelta(minutes=TICK_MINUTES * args.ticks)
+    ticks = [tick_time(base, tick) for tick in range(args.ticks)]
+
+    db = DB()
+    workers = []
+    try:
+        query(db, f"CREATE SCHEMA {schema}")
+        if not db.create_table():
+            return False
+
+        # One at a time, so their startup DDL (create_aux_tables) doesn't race
+        for index in range(args.workers):
+            workers.append(WorkerProcess(index, env, args.lots, base, args.verbose))
+        print(f"{args.workers} workers, {len(lot_ids)} lots, {args.ticks} ticks; "
+              f"killing worker 0 during tick {args.kill_tick}")
+
+        victim, victim_lots = workers[0], set()
+        for tick in range(args.ticks):
+            fake.tick = tick
+            live = [w for w in workers if w.proc.poll() is None]
+            for worker in live:
+                worker.send_tick(tick)
+            if tick == args.kill_tick:
+                # Let it take its locks and start fetching, then kill it mid-crawl
+                time.sleep(args.kill_after_ms / 1000)
+                victim_lots = held_lots(db, ns_lots).get(victim.backend_pid, set())
+                victim.kill()
+                live.remove(victim)
+            for worker in live:
+                worker.expect("done")
+            if tick == args.kill_tick and not wait_for_workers(db, ns_workers, len(live)):
+                print("❌ PostgreSQL kept the killed worker's locks")
+                return False
+
+            held = held_lots(db, ns_lots)
+            shares = ", ".join(f"#{w.slot} {len(held.get(w.backend_pid, ()))}" for w in live)
+            print(f"  tick {tick}: lots held after release {shares}")
+
+        counts = {(lot_id, ts): n for lot_id, ts, n in query(db, READING_COUNTS_SQL)}
+    finally:
+        for worker in workers:
+            worker.stop()
+        server.shutdown()
+        shutil.rmtree(state_dir, ignore_errors=True)
+        try:
+            query(db, f"DROP SCHEMA IF EXISTS {schema} CASCADE")
+        finally:
+            db.close_connection()
+
+    duplicates = missing = lost_to_kill = 0
+    for tick, ts in enumerate(ticks):
+        for lot_id in lot_ids:
+            n = counts.get((lot_id, ts), 0)
+            if n > 1:
+                duplicates += 1
+            elif n == 0 and tick == args.kill_tick and lot_id in victim_lots:
+                lost_to_kill += 1
+            elif n == 0:
+                missing += 1
+    unexpected = sum(1 for lot_id, ts in counts if lot_id not in LOT_REGISTRY or ts not in ticks)
+
+    print(f"\nkilled worker held {len(victim_lots)} lots; {lost_to_kill} of them have no reading for tick {args.kill_tick}")
+    print(f"  (lot, tick) with 2+ readings {duplicates}, missing {missing}, readings outside the run {unexpected}")
+    return duplicates == 0 and missing == 0 and unexpected == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Crawl worker failover harness")
+    parser.add_argument("--workers", type=int, default=3, help="Worker processes (default 3)")
+    parser.add_argument("--lots", type=int, default=12, help="Synthetic lots on top of the real ones (default 12)")
+    parser.add_argument("--ticks", type=int, default=8, help="Ticks to run (default 8)")
+    parser.add_argument("--kill-tick", type=int, default=4, help="Tick during which worker 0 is killed (default 4)")
+    parser.add_argument("--kill-after-ms", type=float, default=30,
+                        help="Delay into the kill tick before SIGKILL (default 30)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=20, help="Fake upstream latency per fetch (default 20)")
+    parser.add_argument("--jitter-ms", type=float, default=5)
+    parser.add_argument("--change-probability", type=float, default=1.0,
+                        help="Chance per tick that a lot's readings change; below 1 exercises run markers")
+    parser.add_argument("--lock-ns", type=int, default=41901,
+                        help="Advisory lock namespaces to use (this and the next; default 41901)")
+    parser.add_argument("--verbose", action="store_true", help="Echo the workers' crawl output")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--base", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        run_worker(args.lots, datetime.fromisoformat(args.base))
+        return
+    if args.workers < 2 or not 0 <= args.kill_tick < args.ticks - 1:
+        parser.error("need at least 2 workers and a kill tick before the last tick")
+
+    ok = run(args)
+    print("✅ Every (lot, tick) has exactly one reading" if ok else "❌ Readings were lost or duplicated")
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
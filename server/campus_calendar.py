@@ -0,0 +1,53 @@
+"""
+Local campus calendar used to segment heatmaps (semester, break, game day, ...).
+
+The calendar is a CSV of inclusive local date ranges with a tag:
+
+    start,end,tag
+    2026-08-17,2026-12-11,semester
+    2026-11-21,2026-11-29,break
+    2026-09-05,2026-09-05,game_day
+
+Lines starting with '#' are ignored. When ranges overlap, the later row wins,
+so list broad ranges (semesters) before specific ones (game days). Days not
+covered by any row fall into the "other" segment.
+"""
+import os
+import csv
+import re
+from datetime import date
+from typing import List, Tuple
+
+CALENDAR_PATH = os.getenv(
+    "CALENDAR_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "calendar_segments.csv"),
+)
+DEFAULT_SEGMENT = "other"
+_TAG_PATTERN = re.compile(r"^[a-z0-9_-]+$")
+
+
+def load_calendar(path: str = CALENDAR_PATH) -> List[Tuple[date, date, str]]:
+    """
+    Read calendar rows in file order.
+
+    Returns:
+        List of (start, end, tag); empty if the file is missing
+    """
+    if not os.path.exists(path):
+        return []
+
+    entries = []
+    with open(path, 'r', newline='', encoding='utf-8') as f:
+        lines = [line for line in f if line.strip() and not line.lstrip().startswith("#")]
+    for row in csv.DictReader(lines):
+        tag = row['tag'].strip().lower()
+        if not _TAG_PATTERN.match(tag):
+            print(f"⚠️  Invalid calendar tag '{tag}' (use a-z, 0-9, _ or -), skipping...")
+            continue
+        start = date.fromisoformat(row['start'].strip())
+        end = date.fromisoformat(row['end'].strip())
+        if end < start:
+            print(f"⚠️  Calendar range {start}..{end} ends before it starts, skipping...")
+            continue
+        entries.append((start, end, tag))
+    return entries
@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+"""
+One-shot crawl for systemd timers and cron.
+
+Crawls every due lot once for the current tick and exits, so an OS timer can
+replace the resident `start.py` loop for crawling. Only what a tick needs is
+imported (parking_crawl, db, requests, psycopg2); numpy, pandas and boto3 are
+never loaded, and a warning is printed if one ever is. The connection is used
+as is, with no separate test query; a connection failure exits with status 1.
+
+Runs are serialized with a non-blocking lock on CRAWL_LOCK_PATH. A run that
+finds the lock held (the previous one is still going) exits 0 without
+crawling. Readings are stamped with the tick's clock mark, like crawl_worker.py,
+so a late or repeated timer firing stores at most one reading per tick.
+The decayed heatmap and anomaly state come from their checkpoints as usual.
+In adaptive mode the per-lot schedule is checkpointed too (CRAWL_SCHEDULE_PATH),
+and the timer must fire every CRAWL_MIN_INTERVAL_MINUTES (default 1) instead of
+every 5 minutes, or the fast rungs are never served. A run that finds a lot
+overdue by a whole tick prints a warning.
+Upstream ETags are not kept between runs, so every run fetches full payloads.
+
+Each run prints its cold-start profile: import, connect and crawl time,
+total wall time since the interpreter started, and peak RSS. Like start.py
+it runs from the project root, so checkpoints under state/ are shared with
+the other crawl modes.
+
+Usage:
+    python server/crawl_tick.py
+    # systemd: OnCalendar=*:0/5 with ExecStart=<project>/venv/bin/python <project>/server/crawl_tick.py
+    # cron:    */5 * * * * <project>/venv/bin/python <project>/server/crawl_tick.py
+    # CRAWL_ADAPTIVE=1: fire every CRAWL_MIN_INTERVAL_MINUTES instead (OnCalendar=*:0/1, cron * * * * *)
+"""
+import time
+
+_STARTED = time.perf_counter()
+
+import os
+import sys
+import fcntl
+import resource
+from contextlib import contextmanager
+from datetime import datetime
+from dotenv import load_dotenv
+
+# Run from the project root like start.py, so state/ checkpoints are shared with it
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(PROJECT_ROOT)
+sys.path.append(os.path.join(PROJECT_ROOT, "server"))
+
+from parking_crawl import CENTRAL_TZ, TICK_MINUTES, LOT_FETCHERS, schedule, crawl_lots
+from crawl_worker import tick_timestamp
+from db import DB
+import metrics
+from metrics import span
+
+_IMPORTED = time.perf_counter()
+
+load_dotenv()
+
+# Configuration
+CRAWL_LOCK_PATH = os.getenv("CRAWL_LOCK_PATH", "./state/crawl_tick.lock")
+# Modules a tick must not pull in; loading one means an import went eager somewhere
+HEAVY_MODULES = ("numpy", "pandas", "boto3")
+
+
+@contextmanager
+def exclusive_run(path: str):
+    """Yield True while holding the run lock, or False at once if another run holds it."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as lock_file:
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def process_seconds() -> float:
+    """Wall time since this process started (Linux), including interpreter startup."""
+    try:
+        with open("/proc/self/stat", 'r') as f:
+            start_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime", 'r') as f:
+            uptime = float(f.read().split()[0])
+        return uptime - start_ticks / os.sysconf("SC_CLK_TCK")
+    except (OSError, ValueError, IndexError):
+        return time.perf_counter() - _STARTED
+
+
+def peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def run() -> int:
+    """Crawl the current tick once; returns the process exit status."""
+    with exclusive_run(CRAWL_LOCK_PATH) as acquired:
+        if not acquired:
+            print("⏭️  Previous crawl still running; skipping this tick")
+            return 0
+
+        connect_start = time.perf_counter()
+        try:
+            with span("crawl.oneshot_connect"):
+                db = DB()
+        except Exception as e:
+            print(f"❌ Database connection failed: {e}")
+            return 1
+        # Lots added to LOT_REGISTRY since the last run need their lots row before readings can reference it
+        db.ensure_lots()
+        crawl_start = time.perf_counter()
+
+        try:
+            schedule.restore()
+        except Exception as e:
+            print(f"⚠️  Failed to load the polling schedule, starting fresh: {e}")
+        try:
+            now = tick_timestamp(datetime.now(CENTRAL_TZ))
+            overdue = schedule.overdue_minutes(now)
+            if overdue >= TICK_MINUTES:
+                print(f"⚠️  A lot was due {overdue:.0f} min ago: in adaptive mode the timer must fire "
+                      f"every {TICK_MINUTES} min (CRAWL_MIN_INTERVAL_MINUTES), e.g. OnCalendar=*:0/{TICK_MINUTES}")
+            with span("crawl.tick"):
+                saved = crawl_lots(db, LOT_FETCHERS, now)
+            schedule.save()
+        except Exception as e:
+            print(f"Error during crawl: {e}")
+            saved = None
+        finally:
+            db.close_connection()
+        done = time.perf_counter()
+
+    print("✅ Crawl completed" if saved else "ℹ️  Nothing saved this tick" if saved is False else "❌ Crawl failed")
+    print(f"⏱️  Cold start: imports {(_IMPORTED - _STARTED) * 1000:.0f} ms, "
+          f"connect {(crawl_start - connect_start) * 1000:.0f} ms, crawl {(done - crawl_start) * 1000:.0f} ms, "
+          f"process total {process_seconds() * 1000:.0f} ms, peak RSS {peak_rss_mb():.1f} MB")
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+    if loaded:
+        print(f"⚠️  Heavy modules loaded by a crawl tick: {', '.join(loaded)}")
+    return 0 if saved is not None else 1
+
+
+def main():
+    status = run()
+    metrics.flush()
+    raise SystemExit(status)
+
+
+if __name__ == "__main__":
+    main()
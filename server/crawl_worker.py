@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Sharded crawl worker.
+
+Any number of workers on one host share the lot registry through PostgreSQL
+session advisory locks, so no extra table or coordinator is needed:
+
+  - Each worker holds one "worker slot" lock (namespace CRAWL_LOCK_NS_WORKERS);
+    counting those locks in pg_locks gives the number of live workers.
+  - A worker crawls exactly the lots whose lock it holds (CRAWL_LOCK_NS_LOTS).
+    At the start of every tick it tops itself up to its fair share,
+    ceil(lots / workers); after the tick it releases anything above that
+    share so a newly started worker can pick it up on the next tick.
+  - Locks live as long as the worker's lock connection. When a worker dies,
+    PostgreSQL drops its locks and the survivors absorb its lots on their
+    next tick.
+
+Every reading is stamped with the tick's clock mark, and parking_data is keyed
+on (lot_id, timestamp), so even during a hand-over a lot gets at most
+one reading per tick.
+
+Workers must run on a single host: the decayed heatmap and anomaly state
+are per-lot JSON checkpoints under state/, merged under a local file lock,
+and a worker taking over a lot resumes from that file. A worker on another
+host would start the lot from its own (stale or empty) checkpoint.
+
+Usage:
+    python crawl_worker.py            # run alongside other workers
+    python start.py --no-crawl        # keep the scheduler for daily tasks only
+"""
+import os
+import math
+import time
+from datetime import datetime
+import psycopg2
+from db import DB, LOT_NAME_TO_ID
+import metrics
+import decayed_heatmap
+import anomaly
+from metrics import timed, incr
+from parking_crawl import (
+    CENTRAL_TZ, TICK_MINUTES, LOT_FETCHERS, schedule, crawl_lots, forget_readings,
+    get_seconds_until_next_interval,
+)
+
+# Advisory lock namespaces (first key of pg_try_advisory_lock(int, int))
+CRAWL_LOCK_NS_WORKERS = int(os.getenv("CRAWL_LOCK_NS_WORKERS", "41001"))
+CRAWL_LOCK_NS_LOTS = int(os.getenv("CRAWL_LOCK_NS_LOTS", "41002"))
+CRAWL_MAX_WORKERS = int(os.getenv("CRAWL_MAX_WORKERS", "64"))
+
+# Two-int advisory locks show up in pg_locks as classid/objid with objsubid = 2
+LIVE_WORKERS_SQL = """
+    SELECT COUNT(*) FROM pg_locks
+    WHERE locktype = 'advisory' AND objsubid = 2 AND granted
+      AND classid = %s AND database = (SELECT oid FROM pg_database WHERE datname = current_database())
+"""
+
+OWNED_LOTS_SQL = """
+    SELECT objid FROM pg_locks
+    WHERE locktype = 'advisory' AND objsubid = 2 AND granted
+      AND classid = %s AND pid = pg_backend_pid()
+"""
+
+
+def tick_timestamp(now: datetime) -> datetime:
+    """Floor `now` to its TICK_MINUTES clock mark, so every worker stamps a tick alike."""
+    return now.replace(minute=now.minute - now.minute % TICK_MINUTES, second=0, microsecond=0)
+
+
+class CrawlWorker:
+    def __init__(self):
+        # Locks are held on a dedicated autocommit connection; readings go through self.db
+        self.lock_db = DB()
+        self.lock_db.conn.autocommit = True
+        self.db = DB()
+        # Hand-overs rely on ON CONFLICT DO NOTHING, which needs the (lot_id, timestamp) key
+        if not self.db.create_aux_tables() or not self.db.ensure_unique_readings():
+            self.db.close_connection()
+            self.lock_db.close_connection()
+            raise RuntimeError("parking_data has no unique (lot_id, timestamp) key; refusing to run sharded")
+        self.slot = None
+        self.lot_ids = sorted(LOT_NAME_TO_ID[name] for name in LOT_FETCHERS)
+        self.lot_names = {LOT_NAME_TO_ID[name]: name for name in LOT_FETCHERS}
+
+    def _query(self, sql, params=()):
+        cursor = self.lock_db.conn.cursor()
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+        cursor.close()
+        return rows
+
+    def _try_lock(self, namespace: int, key: int) -> bool:
+        return self._query("SELECT pg_try_advisory_lock(%s, %s)", (namespace, key))[0][0]
+
+    def _unlock(self, namespace: int, key: int):
+        self._query("SELECT pg_advisory_unlock(%s, %s)", (namespace, key))
+
+    def register(self):
+        """Claim the lowest free worker slot."""
+        for slot in range(CRAWL_MAX_WORKERS):
+            if self._try_lock(CRAWL_LOCK_NS_WORKERS, slot):
+                self.slot = slot
+                print(f"✅ Registered as crawl worker #{slot}")
+                return
+        raise RuntimeError(f"All {CRAWL_MAX_WORKERS} crawl worker slots are taken")
+
+    def live_workers(self) -> int:
+        return max(1, self._query(LIVE_WORKERS_SQL, (CRAWL_LOCK_NS_WORKERS,))[0][0])
+
+    def owned_lots(self):
+        return sorted(row[0] for row in self._query(OWNED_LOTS_SQL, (CRAWL_LOCK_NS_LOTS,)))
+
+    def fair_share(self) -> int:
+        return math.ceil(len(self.lot_ids) / self.live_workers())
+
+    def acquire(self):
+        """
+        Top up to the fair share of lots.
+
+        Scans from an offset based on the worker slot so concurrently starting
+        workers don't all contend for the same first lots.
+
+        Returns:
+            Tuple of (owned lot ids, newly acquired lot ids)
+        """
+        share = self.fair_share()
+        owned = self.owned_lots()
+        acquired = []
+        offset = (self.slot * share) % len(self.lot_ids)
+        for lot_id in self.lot_ids[offset:] + self.lot_ids[:offset]:
+            if len(owned) + len(acquired) >= share:
+                break
+            if lot_id not in owned and self._try_lock(CRAWL_LOCK_NS_LOTS, lot_id):
+                acquired.append(lot_id)
+        return sorted(owned + acquired), acquired
+
+    def release_extra(self, owned):
+        """Give back lots above the fair share once they've been crawled this tick."""
+        share = self.fair_share()
+        for lot_id in owned[share:]:
+            self._unlock(CRAWL_LOCK_NS_LOTS, lot_id)
+            incr("crawl.lots_released")
+            print(f"↪️  Worker #{self.slot} released {self.lot_names[lot_id]}")
+
+    def reconnect(self):
+        """Re-register after losing the lock connection (all its locks went with it)."""
+        self.lock_db.reconnect()
+        self.lock_db.conn.autocommit = True
+        self.register()
+
+    @timed("crawl.worker_tick")
+    def tick(self, now: datetime) -> bool:
+        """Crawl the owned shard once for the tick at `now`."""
+        owned, acquired = self.acquire()
+        if acquired:
+            incr("crawl.lots_acquired", len(acquired))
+            names = ", ".join(self.lot_names[lot_id] for lot_id in acquired)
+            print(f"↩️  Worker #{self.slot} acquired {names}")
+            # Another worker wrote these lots last; re-read its state before continuing
+            decayed_heatmap.reset_state()
+            anomaly.reset_state()
+            forget_readings(acquired)
+        if not owned:
+            return False
+
+        saved = crawl_lots(self.db, [self.lot_names[lot_id] for lot_id in owned], tick_timestamp(now),
+                           checkpoint_lot_ids=owned)
+        self.release_extra(owned)
+        return saved
+
+    def run(self):
+        self.register()
+        last_tick = None
+        try:
+            while True:
+                now = datetime.now(CENTRAL_TZ)
+                mark = tick_timestamp(now)
+                if mark != last_tick:
+                    try:
+                        self.tick(now)
+                    except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+                        print(f"⚠️  Lost lock connection, re-registering: {e}")
+                        try:
+                            self.reconnect()
+                        except Exception as e:
+                            print(f"❌ Reconnect failed, retrying next tick: {e}")
+                    except Exception as e:
+                        print(f"Error during worker tick: {e}")
+                    last_tick = mark
+                    metrics.flush()
+
+                wait_seconds = get_seconds_until_next_interval()
+                time.sleep(min(30, max(1, wait_seconds)))
+        finally:
+            self.db.close_connection()
+            self.lock_db.close_connection()
+
+
+def main():
+    print("🚀 Auburn Parking Analytics - Crawl Worker")
+    cadence = f"adaptive {schedule.ladder[0]}-{schedule.ladder[-1]}" if schedule.adaptive else f"every {TICK_MINUTES}"
+    print(f"Crawl interval: {cadence} minutes, {len(LOT_FETCHERS)} lots in registry")
+    print("-" * 60)
+    try:
+        CrawlWorker().run()
+    except RuntimeError as e:
+        print(f"❌ {e}")
+        raise SystemExit(1)
+    except KeyboardInterrupt:
+        print("\n\n👋 Crawl worker stopped by user.")
+
+
+if __name__ == "__main__":
+    main()
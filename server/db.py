@@ -2,9 +2,14 @@ import psycopg2
 import csv
 import os
 import glob
-from datetime import datetime
+import re
+import gzip
+import itertools
+from datetime import date, datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
 from dotenv import load_dotenv
 import pytz
+from metrics import timed, incr
 
 # Central Time zone for CSV imports
 CENTRAL_TZ = pytz.timezone('America/Chicago')
@@ -21,17 +26,481 @@ DB_CONFIG = {
     "database": os.getenv("DB_NAME"),
 }
 
-LOT_INFO = {
-    "1": "Stadium_Deck",
-    "2": "Athletics_Deck",
-    "3": "Haley_Deck"
+# Lot registry, the one place a lot is added: lot_id -> (name, EV stalls watched,
+# parking_crawl.FETCHERS key). It seeds the lots table; the maps below and
+# parking_crawl.LOT_FETCHERS are derived from it.
+LOT_REGISTRY = {
+    1: ("Stadium_Deck", 4, "stadium"),
+    2: ("Athletics_Deck", 4, "athletics"),
+    3: ("Haley_Deck", 2, "haley"),
 }
 
+LOT_INFO = {str(lot_id): name for lot_id, (name, _, _) in LOT_REGISTRY.items()}
+
 # Reverse mapping: lot_name -> lot_id
-LOT_NAME_TO_ID = {v: int(k) for k, v in LOT_INFO.items()}
+LOT_NAME_TO_ID = {name: lot_id for lot_id, (name, _, _) in LOT_REGISTRY.items()}
+
+# EV stalls watched per lot
+LOT_CAPACITY = {str(lot_id): capacity for lot_id, (_, capacity, _) in LOT_REGISTRY.items()}
+
+# Rows fetched per round trip when streaming through a server-side cursor
+DEFAULT_CHUNK_SIZE = 10000
+
+# Record layout for NumPy batches from iter_readings(as_numpy=True)
+READING_DTYPE = [
+    ("timestamp", "datetime64[s]"),  # UTC
+    ("lot_id", "i2"),
+    ("occupied_spots", "i2"),
+    ("available_spots", "i2"),
+]
+
+# Server-side cursor names must be unique per connection
+_cursor_ids = itertools.count(1)
+
+# Use server-side prepared statements for the hot queries (set DB_USE_PREPARED=0 to disable)
+USE_PREPARED = os.getenv("DB_USE_PREPARED", "1").strip().lower() not in ("0", "false", "no", "off")
+
+# Look-back start shared by the windowed statements below
+WINDOW_SINCE = "NOW() - %s * INTERVAL '1 day'"
+
+CREATE_LOTS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS lots (
+        lot_id SMALLINT PRIMARY KEY,
+        name TEXT NOT NULL UNIQUE,
+        capacity SMALLINT NOT NULL,              -- EV stalls watched
+        created_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+"""
+
+# Register every lot in one statement; unchanged rows are left alone (no dead tuples per run)
+SEED_LOTS_SQL = """
+    INSERT INTO lots (lot_id, name, capacity)
+    SELECT * FROM unnest(%s::smallint[], %s::text[], %s::smallint[])
+    ON CONFLICT (lot_id) DO UPDATE SET name = EXCLUDED.name, capacity = EXCLUDED.capacity
+    WHERE (lots.name, lots.capacity) IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.capacity)
+"""
+
+# Compact reading layout: no surrogate id, the natural (lot_id, timestamp) key,
+# 2-byte counts, and 8-byte-aligned columns first so nothing is padded. A plain
+# reading is a 24-byte tuple header plus 16 bytes of data.
+CREATE_READINGS_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS {name} (
+        timestamp TIMESTAMPTZ NOT NULL,
+        last_seen TIMESTAMPTZ,                   -- end of an unchanged run (NULL: single reading)
+        lot_id SMALLINT NOT NULL REFERENCES lots (lot_id),
+        occupied_spots SMALLINT NOT NULL,
+        available_spots SMALLINT NOT NULL,
+        poll_minutes SMALLINT,                   -- coverage after the last poll (NULL: grid interval)
+        CONSTRAINT {name}_pkey PRIMARY KEY (lot_id, timestamp)
+    )
+"""
+
+CREATE_TIMESTAMP_INDEX_SQL = "CREATE INDEX IF NOT EXISTS idx_parking_timestamp ON parking_data (timestamp)"
+
+# Rows parking_readings has to expand (runs and adaptive-cadence readings)
+CREATE_SPANS_INDEX_SQL = """
+    CREATE INDEX IF NOT EXISTS idx_parking_spans
+    ON parking_data (timestamp) WHERE last_seen IS NOT NULL OR poll_minutes IS NOT NULL
+"""
+
+# ON CONFLICT without a target is a no-op without a (lot_id, timestamp) key (the
+# primary key, or the unique index on legacy tables); with it, a second writer
+# for the same lot and tick is silently ignored.
+INSERT_READING_SQL = """
+    INSERT INTO parking_data (timestamp, lot_id, occupied_spots, available_spots, poll_minutes)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT DO NOTHING
+"""
+
+# Grid readings are aggregated on; the fixed crawl cadence ticks on the same marks
+READING_INTERVAL_MINUTES = 5
+
+# A row covers [timestamp, COALESCE(last_seen, timestamp) + poll_minutes):
+#   - last_seen marks a run of identical readings (the crawler extends the row
+#     instead of inserting repeats; runs never cross local midnight)
+#   - poll_minutes is the time until the lot's next scheduled poll (NULL: the
+#     5-minute grid interval) when polling is adaptive
+# parking_readings turns rows back into one reading per (lot, 5-minute grid
+# cell): occupied/available as of the cell's start, and pct as the time-weighted
+# mean over the cell, so volatile stretches polled every minute weigh no more
+# than stable ones polled every 15. Plain grid-interval rows pass straight
+# through, keeping the timestamp index usable for them. {plain}, {spans} and
+# {cells} take the extra filters of parking_readings_since().
+READINGS_SELECT_SQL = f"""
+    SELECT timestamp, lot_id, occupied_spots, available_spots,
+           occupied_spots::float / NULLIF(occupied_spots + available_spots, 0) * 100 AS pct
+    FROM parking_data
+    WHERE last_seen IS NULL AND poll_minutes IS NULL{{plain}}
+    UNION ALL
+    SELECT
+        cell AS timestamp,
+        lot_id,
+        (array_agg(occupied_spots ORDER BY span_start > cell, ABS(EXTRACT(EPOCH FROM span_start - cell))))[1],
+        (array_agg(available_spots ORDER BY span_start > cell, ABS(EXTRACT(EPOCH FROM span_start - cell))))[1],
+        SUM(pct * overlap) / NULLIF(SUM(overlap) FILTER (WHERE pct IS NOT NULL), 0)
+    FROM (
+        SELECT
+            s.lot_id, s.occupied_spots, s.available_spots, s.pct, s.span_start, c.cell,
+            EXTRACT(EPOCH FROM LEAST(s.span_end, c.cell + INTERVAL '{READING_INTERVAL_MINUTES} minutes')
+                               - GREATEST(s.span_start, c.cell)) AS overlap
+        FROM (
+            SELECT
+                lot_id, occupied_spots, available_spots,
+                occupied_spots::float / NULLIF(occupied_spots + available_spots, 0) * 100 AS pct,
+                timestamp AS span_start,
+                COALESCE(last_seen, timestamp)
+                    + COALESCE(poll_minutes, {READING_INTERVAL_MINUTES}) * INTERVAL '1 minute' AS span_end
+            FROM parking_data
+            WHERE (last_seen IS NOT NULL OR poll_minutes IS NOT NULL){{spans}}
+        ) s
+        CROSS JOIN LATERAL generate_series(
+            to_timestamp(FLOOR(EXTRACT(EPOCH FROM s.span_start) / {READING_INTERVAL_MINUTES * 60})
+                         * {READING_INTERVAL_MINUTES * 60}),
+            s.span_end - INTERVAL '1 second',
+            INTERVAL '{READING_INTERVAL_MINUTES} minutes') AS c(cell){{cells}}
+    ) pieces
+    GROUP BY lot_id, cell
+"""
+
+CREATE_READINGS_VIEW_SQL = "CREATE OR REPLACE VIEW parking_readings AS" + READINGS_SELECT_SQL.format(
+    plain="", spans="", cells="")
+
+# Longest time one row can cover: a run within one local day (25 hours on the
+# day DST ends) plus its last poll's coverage (CRAWL_MAX_INTERVAL_MINUTES, under an hour)
+MAX_ROW_SPAN_SQL = "INTERVAL '26 hours'"
+
+# parking_readings from `since` on. Filtering the view itself only drops cells
+# after every span row has been expanded; this filters parking_data on its
+# timestamp index first (spans may start up to MAX_ROW_SPAN_SQL earlier), so a
+# 7-day window expands 7 days of runs, not all history. Being a plain SQL
+# function it is inlined into the calling query when `since` has no subquery.
+CREATE_READINGS_SINCE_SQL = f"""
+    CREATE OR REPLACE FUNCTION parking_readings_since(since TIMESTAMPTZ)
+    RETURNS SETOF parking_readings
+    LANGUAGE sql STABLE AS $$
+    {READINGS_SELECT_SQL.format(
+        plain=" AND timestamp >= since",
+        spans=f" AND timestamp >= since - {MAX_ROW_SPAN_SQL}",
+        cells=" WHERE c.cell >= since")}
+    $$
+"""
+
+# parking_readings over the last %s days, for the windowed statements
+WINDOW_READINGS = f"parking_readings_since({WINDOW_SINCE}) AS parking_readings"
+
+EXTEND_READING_SQL = """
+    UPDATE parking_data SET last_seen = %s, poll_minutes = %s
+    WHERE lot_id = %s AND timestamp = %s
+"""
+
+SET_COVERAGE_SQL = """
+    UPDATE parking_data SET poll_minutes = %s
+    WHERE lot_id = %s AND timestamp = %s
+"""
+
+LAST_READING_SQL = f"""
+    SELECT timestamp, COALESCE(last_seen, timestamp), occupied_spots, available_spots,
+           COALESCE(poll_minutes, {READING_INTERVAL_MINUTES})
+    FROM parking_data
+    WHERE lot_id = %s
+    ORDER BY timestamp DESC
+    LIMIT 1
+"""
+
+# Retention watermark: days before raw_from (local date) have been compacted into
+# parking_daily_rollup and their raw rows removed from parking_data. first/last_reading
+# keep the compacted history's date range for all.json.
+CREATE_RETENTION_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS parking_retention (
+        id BOOLEAN PRIMARY KEY DEFAULT TRUE CHECK (id),  -- single row
+        raw_from DATE NOT NULL,
+        first_reading TIMESTAMPTZ,
+        last_reading TIMESTAMPTZ,
+        compacted_at TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    )
+"""
+
+# Local midnight from which parking_data still holds raw readings (-infinity before any compaction)
+RAW_FROM_SQL = (
+    "COALESCE((SELECT raw_from::timestamp AT TIME ZONE 'America/Chicago' FROM parking_retention), "
+    "'-infinity'::timestamptz)"
+)
+RAW_WHERE = f"WHERE timestamp >= {RAW_FROM_SQL}"
+
+DATE_RANGE_SQL = """
+    SELECT MIN(timestamp::date), MAX(timestamp::date)
+    FROM {readings}
+"""
+
+# All history: raw readings plus the range of the compacted days
+DATE_RANGE_ALL_SQL = f"""
+    SELECT LEAST(MIN(timestamp), (SELECT first_reading FROM parking_retention))::date,
+           GREATEST(MAX(timestamp), (SELECT last_reading FROM parking_retention))::date
+    FROM parking_readings {RAW_WHERE}
+"""
+
+# PostgreSQL DOW: Sun=0, Mon=1, ..., Sat=6
+# time slot: 0 ~ 288 (5 mins)
+# Convert UTC timestamp to local timezone for correct day/time slot calculation
+# The clean_* columns exclude readings on (lot, local day) pairs flagged in
+# parking_anomaly_days, so heatmaps with and without event days share one scan.
+# Each source row carries (sample_count, occupancy_sum, occupancy_count): 1 per
+# raw reading from {readings}, or a compacted day's rollup ({rollups}). Sums are NUMERIC so they
+# add up exactly in any order, and all.json comes out the same before and after
+# compaction.
+HEATMAP_SQL = """
+    SELECT 
+        lot_id,
+        day_of_week,
+        time_slot,
+        ROUND(SUM(occupancy_sum) / NULLIF(SUM(occupancy_count), 0), 1) AS avg_occupancy,
+        SUM(sample_count)::bigint AS sample_count,
+        SUM(occupancy_sum) AS occupancy_sum,
+        SUM(occupancy_count)::bigint AS occupancy_count,
+        COALESCE(SUM(sample_count) FILTER (WHERE NOT flagged), 0)::bigint AS clean_sample_count,
+        SUM(occupancy_sum) FILTER (WHERE NOT flagged) AS clean_occupancy_sum,
+        COALESCE(SUM(occupancy_count) FILTER (WHERE NOT flagged), 0)::bigint AS clean_occupancy_count
+    FROM (
+        SELECT
+            lot_id,
+            EXTRACT(DOW FROM timestamp AT TIME ZONE 'America/Chicago')::int AS day_of_week,
+            FLOOR((EXTRACT(HOUR FROM timestamp AT TIME ZONE 'America/Chicago') * 60 + EXTRACT(MINUTE FROM timestamp AT TIME ZONE 'America/Chicago')) / 5)::int AS time_slot,
+            1 AS sample_count,
+            pct::numeric AS occupancy_sum,
+            (pct IS NOT NULL)::int AS occupancy_count,
+            EXISTS (
+                SELECT 1 FROM parking_anomaly_days a
+                WHERE a.lot_id = parking_readings.lot_id
+                  AND a.day = (parking_readings.timestamp AT TIME ZONE 'America/Chicago')::date
+            ) AS flagged
+        FROM {readings}
+        {rollups}
+    ) readings
+    GROUP BY lot_id, day_of_week, time_slot
+    ORDER BY lot_id, day_of_week, time_slot
+"""
+
+# Compacted days for HEATMAP_SQL's {rollups}
+COMPACTED_ROLLUPS_SQL = """
+        UNION ALL
+        SELECT
+            r.lot_id,
+            EXTRACT(DOW FROM r.day)::int,
+            r.time_slot,
+            r.sample_count,
+            r.occupancy_sum,
+            r.occupancy_count,
+            EXISTS (
+                SELECT 1 FROM parking_anomaly_days a
+                WHERE a.lot_id = r.lot_id AND a.day = r.day
+            )
+        FROM parking_daily_rollup r
+        WHERE r.day < (SELECT raw_from FROM parking_retention)
+"""
+
+CREATE_ANOMALY_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS parking_anomaly_days (
+        day DATE NOT NULL,                       -- local date (America/Chicago)
+        lot_id INT NOT NULL,
+        anomalous_readings INT NOT NULL,
+        readings INT NOT NULL,
+        flagged_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (day, lot_id)
+    )
+"""
+
+# Occupancy histogram stored per (day, lot, slot) rollup: 20 buckets of 5 points
+# ([0,5), [5,10), ..., [95,100)) plus a final bucket for exactly 100% (full).
+# Histograms add element-wise, so any window's distribution is the sum of its days.
+OCCUPANCY_BUCKET_WIDTH = 5
+OCCUPANCY_BUCKETS = 100 // OCCUPANCY_BUCKET_WIDTH + 1
+FULL_BUCKET = OCCUPANCY_BUCKETS - 1
+
+CREATE_ROLLUP_TABLE_SQL = """
+    CREATE TABLE IF NOT EXISTS parking_daily_rollup (
+        day DATE NOT NULL,                       -- local date (America/Chicago)
+        lot_id INT NOT NULL,
+        time_slot SMALLINT NOT NULL,             -- 0 ~ 287 (5 mins)
+        sample_count INT NOT NULL,
+        occupancy_sum NUMERIC NOT NULL,          -- exact, so compacted days re-add losslessly
+        occupancy_count INT NOT NULL,
+        occupancy_hist INT[] NOT NULL,
+        PRIMARY KEY (day, lot_id, time_slot)
+    )
+"""
+
+# Rebuild rollups for every local day on or after a bound (local days back from today)
+REFRESH_ROLLUP_SQL = """
+    WITH readings AS (
+        SELECT
+            (timestamp AT TIME ZONE 'America/Chicago') AS local_ts,
+            lot_id,
+            pct
+        FROM {readings}
+    ), slotted AS (
+        SELECT
+            local_ts::date AS day,
+            lot_id,
+            FLOOR((EXTRACT(HOUR FROM local_ts) * 60 + EXTRACT(MINUTE FROM local_ts)) / 5)::int AS time_slot,
+            pct,
+            LEAST(FLOOR(pct / %(width)s), %(full)s)::int AS bucket
+        FROM readings
+    )
+    INSERT INTO parking_daily_rollup
+        (day, lot_id, time_slot, sample_count, occupancy_sum, occupancy_count, occupancy_hist)
+    SELECT
+        day, lot_id, time_slot,
+        COUNT(*),
+        COALESCE(SUM(pct::numeric), 0),
+        COUNT(pct),
+        ARRAY[{buckets}]::int[]
+    FROM slotted
+    GROUP BY day, lot_id, time_slot
+    ON CONFLICT (day, lot_id, time_slot) DO UPDATE SET
+        sample_count = EXCLUDED.sample_count,
+        occupancy_sum = EXCLUDED.occupancy_sum,
+        occupancy_count = EXCLUDED.occupancy_count,
+        occupancy_hist = EXCLUDED.occupancy_hist
+""".format(
+    readings="{readings}",
+    buckets=", ".join(f"COUNT(*) FILTER (WHERE bucket = {i})" for i in range(OCCUPANCY_BUCKETS)),
+)
+
+# Local days before today that the nightly refresh rebuilds (they may still receive readings)
+ROLLUP_REFRESH_DAYS = 2
+
+# Local midnight starting the last N local days (including today)
+LOCAL_DAYS_SINCE = (
+    "(((NOW() AT TIME ZONE 'America/Chicago')::date - %(days)s)::timestamp "
+    "AT TIME ZONE 'America/Chicago')"
+)
+
+# Raw rows whose whole span (see CREATE_READINGS_VIEW_SQL) ends by %(before)s. A row
+# running past it is kept; RAW_WHERE then only reads its cells from raw_from on.
+COMPACTABLE_WHERE = f"""
+    WHERE timestamp < %(before)s
+      AND COALESCE(last_seen, timestamp)
+          + COALESCE(poll_minutes, {READING_INTERVAL_MINUTES}) * INTERVAL '1 minute' <= %(before)s
+"""
+
+# Local days folded into rollups per compaction transaction
+COMPACT_BATCH_DAYS = 31
+
+# Distribution windows are whole local days from the rollups: today and the N days before it
+DISTRIBUTION_WINDOW_WHERE = "WHERE day >= (NOW() AT TIME ZONE 'America/Chicago')::date - %s"
+
+# First and last local day the distribution window actually covers
+DISTRIBUTION_RANGE_SQL = """
+    SELECT MIN(day), MAX(day) FROM parking_daily_rollup {where}
+"""
+
+# Merge day histograms into one per (lot, day_of_week, slot) for a window
+DISTRIBUTION_SQL = """
+    SELECT
+        lot_id,
+        EXTRACT(DOW FROM day)::int AS day_of_week,
+        time_slot,
+        h.bucket - 1 AS bucket,
+        SUM(h.cnt) AS count
+    FROM parking_daily_rollup,
+         unnest(occupancy_hist) WITH ORDINALITY AS h(cnt, bucket)
+    {where}
+    GROUP BY lot_id, day_of_week, time_slot, h.bucket
+    HAVING SUM(h.cnt) > 0
+"""
+
+# Merge daily rollups per (calendar segment, lot, day_of_week, slot) in one pass.
+# Each day takes the tag of the last calendar row covering it, else the default segment.
+SEGMENT_SQL = """
+    WITH calendar AS (
+        SELECT *
+        FROM unnest(%(starts)s::date[], %(ends)s::date[], %(tags)s::text[])
+             WITH ORDINALITY AS c(start_day, end_day, tag, priority)
+    )
+    SELECT
+        COALESCE(seg.tag, %(default)s) AS segment,
+        r.lot_id,
+        EXTRACT(DOW FROM r.day)::int AS day_of_week,
+        r.time_slot,
+        SUM(r.sample_count) AS sample_count,
+        SUM(r.occupancy_sum) AS occupancy_sum,
+        SUM(r.occupancy_count) AS occupancy_count,
+        MIN(r.day) AS first_day,
+        MAX(r.day) AS last_day
+    FROM parking_daily_rollup r
+    LEFT JOIN LATERAL (
+        SELECT c.tag FROM calendar c
+        WHERE r.day BETWEEN c.start_day AND c.end_day
+        ORDER BY c.priority DESC
+        LIMIT 1
+    ) seg ON TRUE
+    GROUP BY segment, r.lot_id, day_of_week, r.time_slot
+"""
+
+# name -> (parameter types, SQL with %s placeholders)
+PREPARED_STATEMENTS = {
+    "insert_reading": (("timestamptz", "smallint", "smallint", "smallint", "smallint"), INSERT_READING_SQL),
+    "extend_reading": (("timestamptz", "smallint", "smallint", "timestamptz"), EXTEND_READING_SQL),
+    "date_range_window": (("int",), DATE_RANGE_SQL.format(readings=WINDOW_READINGS)),
+    "date_range_all": ((), DATE_RANGE_ALL_SQL),
+    "heatmap_window": (("int",), HEATMAP_SQL.format(readings=WINDOW_READINGS, rollups="")),
+    "heatmap_all": ((), HEATMAP_SQL.format(readings=f"parking_readings {RAW_WHERE}", rollups=COMPACTED_ROLLUPS_SQL)),
+}
+
+
+def _to_positional(sql: str) -> str:
+    """Rewrite psycopg2 %s placeholders as $1, $2, ... for PREPARE."""
+    counter = itertools.count(1)
+    return re.sub(r"%s", lambda _: f"${next(counter)}", sql)
+
+
+def build_reading_source(start: Optional[datetime] = None,
+                         end: Optional[datetime] = None,
+                         lot_ids: Optional[Iterable[int]] = None,
+                         days: Optional[int] = None) -> Tuple[str, list]:
+    """
+    Build a parameterized, filtered parking_readings source for a FROM clause.
+
+    A lower bound goes through parking_readings_since(), so only rows from
+    then on are expanded.
+
+    Args:
+        start: Inclusive lower bound on timestamp
+        end: Exclusive upper bound on timestamp
+        lot_ids: Restrict to these lot ids
+        days: Look back this many days from NOW()
+
+    Returns:
+        Tuple of (source_sql, params) for cursor.execute, e.g.
+        "parking_readings_since(%s) AS parking_readings WHERE lot_id = ANY(%s)"
+    """
+    source = "parking_readings"
+    conditions = []
+    params = []
+    if days is not None:
+        source = WINDOW_READINGS
+        params.append(int(days))
+        if start is not None:
+            conditions.append("timestamp >= %s")
+            params.append(start)
+    elif start is not None:
+        source = "parking_readings_since(%s) AS parking_readings"
+        params.append(start)
+    if end is not None:
+        conditions.append("timestamp < %s")
+        params.append(end)
+    if lot_ids is not None:
+        conditions.append("lot_id = ANY(%s)")
+        params.append([int(lot_id) for lot_id in lot_ids])
+
+    where_sql = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+    return source + where_sql, params
 
 class DB:
-    def __init__(self):
+    def __init__(self, use_prepared=USE_PREPARED):
+        self.use_prepared = use_prepared
+        # Prepared statements live in the server session, so track them per connection
+        self._prepared = set()
         self.conn = self.get_connection()
     
     def get_connection(self):
@@ -41,6 +510,38 @@ class DB:
     def close_connection(self):
         self.conn.close()
 
+    def reconnect(self):
+        """Replace a dropped connection; prepared statements are re-created lazily."""
+        try:
+            self.conn.close()
+        except Exception:
+            pass
+        self.conn = self.get_connection()
+        self._prepared = set()
+
+    def _execute(self, cursor, name, params=()):
+        """
+        Execute one of PREPARED_STATEMENTS, preparing it on first use per connection.
+
+        Falls back to sending the plain SQL text when use_prepared is off.
+        """
+        arg_types, sql = PREPARED_STATEMENTS[name]
+        if not self.use_prepared:
+            cursor.execute(sql, params)
+            return
+
+        if name not in self._prepared:
+            types_sql = f" ({', '.join(arg_types)})" if arg_types else ""
+            cursor.execute(f"PREPARE {name}{types_sql} AS {_to_positional(sql)}")
+            self._prepared.add(name)
+
+        if params:
+            placeholders = ", ".join(["%s"] * len(params))
+            cursor.execute(f"EXECUTE {name} ({placeholders})", params)
+        else:
+            cursor.execute(f"EXECUTE {name}")
+
+    @timed("db.test_connection")
     def test_connection(self):
         """Test the database connection."""
         try:
@@ -55,53 +556,305 @@ class DB:
             print(f"❌ Connection failed: {e}")
             return False
 
-    def add_data(self, timestamp, lot_id, occupied_spots, available_spots):
-        """Add a single parking data record."""
+    @timed("db.add_data")
+    def add_data(self, timestamp, lot_id, occupied_spots, available_spots, poll_minutes=None, _retry=True):
+        """
+        Add a single parking data record.
+
+        poll_minutes is the time the reading covers when it differs from the
+        5-minute grid interval (adaptive polling); None means the grid interval.
+        
+        Returns:
+            "inserted", "duplicate" (a reading for this lot and timestamp already
+            exists, e.g. written by another worker) or None on failure
+        """
         try:
             cursor = self.conn.cursor()
-            cursor.execute(
-                """INSERT INTO parking_data 
-                   (timestamp, lot_id, occupied_spots, available_spots) 
-                   VALUES (%s, %s, %s, %s)""",
-                (timestamp, lot_id, occupied_spots, available_spots)
-            )
+            self._execute(cursor, "insert_reading",
+                          (timestamp, lot_id, occupied_spots, available_spots, poll_minutes))
+            inserted = cursor.rowcount
             self.conn.commit()
             cursor.close()
-            return True
+            incr("db.rows_inserted", inserted)
+            return "inserted" if inserted else "duplicate"
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if not _retry:
+                print(f"❌ Failed to add data: {e}")
+                return None
+            print(f"⚠️  Database connection lost, reconnecting: {e}")
+            try:
+                self.reconnect()
+            except Exception as e:
+                print(f"❌ Reconnect failed: {e}")
+                return None
+            return self.add_data(timestamp, lot_id, occupied_spots, available_spots, poll_minutes, _retry=False)
         except Exception as e:
+            self.conn.rollback()
             print(f"❌ Failed to add data: {e}")
-            return False
+            return None
         
+    @timed("db.extend_reading")
+    def extend_reading(self, lot_id, run_start, timestamp, poll_minutes=None, _retry=True):
+        """
+        Record an unchanged tick by extending the lot's run that started at run_start.
+        poll_minutes is the new tick's coverage, as in add_data().
+
+        Returns:
+            bool: True if the run's row was updated, False otherwise (caller should insert instead)
+        """
+        try:
+            cursor = self.conn.cursor()
+            self._execute(cursor, "extend_reading", (timestamp, poll_minutes, lot_id, run_start))
+            updated = cursor.rowcount
+            self.conn.commit()
+            cursor.close()
+            incr("db.rows_extended", updated)
+            return updated > 0
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            if not _retry:
+                print(f"❌ Failed to extend reading: {e}")
+                return False
+            print(f"⚠️  Database connection lost, reconnecting: {e}")
+            try:
+                self.reconnect()
+            except Exception as e:
+                print(f"❌ Reconnect failed: {e}")
+                return False
+            return self.extend_reading(lot_id, run_start, timestamp, poll_minutes, _retry=False)
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to extend reading: {e}")
+            return False
+
+    @timed("db.set_reading_coverage")
+    def set_reading_coverage(self, lot_id, run_start, poll_minutes):
+        """Shorten a row's coverage when a lot was polled again before its scheduled time."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(SET_COVERAGE_SQL, (poll_minutes, lot_id, run_start))
+            self.conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to set reading coverage: {e}")
+            return False
+
+    @timed("db.get_last_reading")
+    def get_last_reading(self, lot_id):
+        """
+        Latest stored row for a lot.
+
+        Returns:
+            (run_start, last_tick, occupied_spots, available_spots, poll_minutes),
+            or None if there is none
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(LAST_READING_SQL, (lot_id,))
+            row = cursor.fetchone()
+            self.conn.commit()
+            cursor.close()
+            return row
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to get last reading: {e}")
+            return None
+
+    @timed("db.create_table")
     def create_table(self):
-        """Create the parking_data table if it doesn't exist."""
+        """Create the lots and parking_data tables (compact layout) if they don't exist."""
         try:
             cursor = self.conn.cursor()
+            self._create_lots_table(cursor)
+            cursor.execute(CREATE_READINGS_TABLE_SQL.format(name="parking_data"))
+            # Create index for faster time-based queries
+            cursor.execute(CREATE_TIMESTAMP_INDEX_SQL)
+            self.conn.commit()
+            cursor.close()
+            if not self.create_aux_tables() or not self.ensure_unique_readings():
+                return False
+            print("✅ Table 'parking_data' created/verified successfully!")
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to create table: {e}")
+            return False
+
+    def _create_lots_table(self, cursor):
+        """
+        Create the lots table and register LOT_REGISTRY in it. On a legacy
+        parking_data (no foreign key yet), lot ids found only in readings get a
+        placeholder row.
+        """
+        cursor.execute(CREATE_LOTS_TABLE_SQL)
+        lot_ids = list(LOT_REGISTRY)
+        cursor.execute(SEED_LOTS_SQL, (lot_ids,
+                                       [LOT_REGISTRY[lot_id][0] for lot_id in lot_ids],
+                                       [LOT_REGISTRY[lot_id][1] for lot_id in lot_ids]))
+        if self._is_legacy_schema(cursor):
             cursor.execute("""
-                CREATE TABLE IF NOT EXISTS parking_data (
-                    id SERIAL PRIMARY KEY,
-                    timestamp TIMESTAMPTZ NOT NULL,
-                    lot_id INT NOT NULL,
-                    occupied_spots INT NOT NULL,
-                    available_spots INT NOT NULL
-                )
+                INSERT INTO lots (lot_id, name, capacity)
+                SELECT lot_id, 'Lot_' || lot_id, MAX(occupied_spots + available_spots)
+                FROM parking_data
+                GROUP BY lot_id
+                ON CONFLICT (lot_id) DO NOTHING
             """)
-            # Create index for faster time-based queries
+
+    @timed("db.ensure_lots")
+    def ensure_lots(self):
+        """Create the lots table if needed and register lots added to (or changed in) LOT_REGISTRY."""
+        try:
+            cursor = self.conn.cursor()
+            self._create_lots_table(cursor)
+            self.conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to register lots: {e}")
+            return False
+
+    @timed("db.get_lots")
+    def get_lots(self):
+        """
+        Returns:
+            List of (lot_id, name, capacity) from the lots table in lot_id order, or [] on failure
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute("SELECT lot_id, name, capacity FROM lots ORDER BY lot_id")
+            rows = cursor.fetchall()
+            self.conn.commit()
+            cursor.close()
+            return rows
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to get lots: {e}")
+            return []
+
+    def _is_legacy_schema(self, cursor) -> bool:
+        """True for the original parking_data layout (SERIAL id, INT columns)."""
+        cursor.execute("""
+            SELECT EXISTS (
+                SELECT 1 FROM information_schema.columns
+                WHERE table_name = 'parking_data' AND column_name = 'id'
+            )
+        """)
+        return cursor.fetchone()[0]
+
+    @timed("db.ensure_unique_readings")
+    def ensure_unique_readings(self):
+        """
+        Enforce at most one reading per (lot_id, timestamp).
+        
+        The compact layout's primary key already does; legacy tables get a
+        unique index. That fails (and leaves the table unchanged) if duplicates
+        already exist; they must be removed before sharded crawlers can rely on it.
+        """
+        try:
+            cursor = self.conn.cursor()
+            if self._is_legacy_schema(cursor):
+                cursor.execute("""
+                    CREATE UNIQUE INDEX IF NOT EXISTS idx_parking_lot_timestamp
+                    ON parking_data (lot_id, timestamp)
+                """)
+            self.conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to create unique (lot_id, timestamp) index: {e}")
+            return False
+
+    @timed("db.migrate_compact_schema")
+    def migrate_compact_schema(self):
+        """
+        Rewrite a legacy parking_data into the compact layout (CREATE_READINGS_TABLE_SQL).
+        
+        Copies the rows in timestamp order into a new table and swaps it in, with
+        its indexes and the parking_readings view, in one transaction. Writers
+        wait on the table lock meanwhile and fail once the old table is dropped,
+        so stop the crawlers first. Legacy duplicate (lot_id, timestamp) rows
+        make the copy fail; the table is then left unchanged.
+        
+        Returns:
+            bool: True if migrated (or already compact), False otherwise
+        """
+        try:
+            cursor = self.conn.cursor()
+            if not self._is_legacy_schema(cursor):
+                print("✅ parking_data already uses the compact layout")
+                cursor.close()
+                return True
+            self.conn.commit()
+            # Bring a legacy table up to the current columns first
+            if not self.create_aux_tables():
+                return False
+
+            cursor.execute("LOCK TABLE parking_data IN EXCLUSIVE MODE")
+            self._create_lots_table(cursor)
+            cursor.execute("DROP TABLE IF EXISTS parking_data_compact")
+            cursor.execute(CREATE_READINGS_TABLE_SQL.format(name="parking_data_compact"))
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_parking_timestamp 
-                ON parking_data (timestamp)
+                INSERT INTO parking_data_compact
+                    (timestamp, last_seen, lot_id, occupied_spots, available_spots, poll_minutes)
+                SELECT timestamp, last_seen, lot_id, occupied_spots, available_spots, poll_minutes
+                FROM parking_data
+                ORDER BY timestamp, lot_id
             """)
+            copied = cursor.rowcount
+            cursor.execute("DROP FUNCTION IF EXISTS parking_readings_since(TIMESTAMPTZ)")
+            cursor.execute("DROP VIEW parking_readings")
+            cursor.execute("DROP TABLE parking_data")
+            cursor.execute("ALTER TABLE parking_data_compact RENAME TO parking_data")
+            cursor.execute("ALTER TABLE parking_data RENAME CONSTRAINT parking_data_compact_pkey TO parking_data_pkey")
+            cursor.execute("ALTER TABLE parking_data RENAME CONSTRAINT parking_data_compact_lot_id_fkey "
+                           "TO parking_data_lot_id_fkey")
+            cursor.execute(CREATE_TIMESTAMP_INDEX_SQL)
+            cursor.execute(CREATE_SPANS_INDEX_SQL)
+            cursor.execute(CREATE_READINGS_VIEW_SQL)
+            cursor.execute(CREATE_READINGS_SINCE_SQL)
+            self.conn.commit()
+            cursor.close()
+            self.vacuum_readings()
+            print(f"✅ Migrated {copied} readings to the compact parking_data layout")
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to migrate parking_data: {e}")
+            return False
+
+    def create_aux_tables(self):
+        """Create the readings view and the lots, rollup, anomaly and retention tables the aggregator reads, if they don't exist."""
+        try:
+            cursor = self.conn.cursor()
+            self._create_lots_table(cursor)
+            cursor.execute("ALTER TABLE parking_data ADD COLUMN IF NOT EXISTS last_seen TIMESTAMPTZ")
+            cursor.execute("ALTER TABLE parking_data ADD COLUMN IF NOT EXISTS poll_minutes SMALLINT")
+            cursor.execute("DROP INDEX IF EXISTS idx_parking_runs")
+            cursor.execute(CREATE_SPANS_INDEX_SQL)
+            cursor.execute(CREATE_READINGS_VIEW_SQL)
+            cursor.execute(CREATE_READINGS_SINCE_SQL)
+            cursor.execute(CREATE_ROLLUP_TABLE_SQL)
+            # Rollups written before compaction existed summed occupancy in floating point
             cursor.execute("""
-                CREATE INDEX IF NOT EXISTS idx_parking_lot_id 
-                ON parking_data (lot_id)
+                SELECT data_type FROM information_schema.columns
+                WHERE table_name = 'parking_daily_rollup' AND column_name = 'occupancy_sum'
             """)
+            if cursor.fetchone()[0] == "double precision":
+                cursor.execute("ALTER TABLE parking_daily_rollup ALTER COLUMN occupancy_sum TYPE NUMERIC")
+            cursor.execute(CREATE_ANOMALY_TABLE_SQL)
+            cursor.execute(CREATE_RETENTION_TABLE_SQL)
             self.conn.commit()
             cursor.close()
-            print("✅ Table 'parking_data' created/verified successfully!")
             return True
         except Exception as e:
-            print(f"❌ Failed to create table: {e}")
+            self.conn.rollback()
+            print(f"❌ Failed to create auxiliary tables: {e}")
             return False
 
+    @timed("db.import_csv")
     def import_csv(self, csv_path):
         """Import parking data from a single CSV file."""
         if not os.path.exists(csv_path):
@@ -132,30 +885,21 @@ class DB:
                     occupied = int(row['occupied_spots'])
                     available = int(row['available_spots'])
                     
-                    batch.append((timestamp, lot_id, occupied, available))
+                    batch.append((timestamp, lot_id, occupied, available, None))
                     
                     if len(batch) >= batch_size:
-                        cursor.executemany(
-                            """INSERT INTO parking_data 
-                               (timestamp, lot_id, occupied_spots, available_spots)
-                               VALUES (%s, %s, %s, %s)""",
-                            batch
-                        )
+                        cursor.executemany(INSERT_READING_SQL, batch)
                         rows_inserted += len(batch)
                         batch = []
                 
                 # Insert remaining rows
                 if batch:
-                    cursor.executemany(
-                        """INSERT INTO parking_data 
-                           (timestamp, lot_id, occupied_spots, available_spots)
-                           VALUES (%s, %s, %s, %s)""",
-                        batch
-                    )
+                    cursor.executemany(INSERT_READING_SQL, batch)
                     rows_inserted += len(batch)
             
             self.conn.commit()
             cursor.close()
+            incr("db.rows_inserted", rows_inserted)
             print(f"✅ Imported {rows_inserted} rows from {os.path.basename(csv_path)}")
             return True
             
@@ -187,6 +931,7 @@ class DB:
         print(f"\n✅ Successfully imported {success_count}/{len(csv_files)} files")
         return success_count == len(csv_files)
 
+    @timed("db.get_row_count")
     def get_row_count(self):
         """Get the total number of rows in parking_data table."""
         try:
@@ -199,19 +944,130 @@ class DB:
             print(f"❌ Failed to get row count: {e}")
             return -1
 
-    def get_data(self, where_clause=""):
-        """Get data from parking_data table with optional WHERE clause."""
+    def iter_readings(self,
+                      start: Optional[datetime] = None,
+                      end: Optional[datetime] = None,
+                      lot_ids: Optional[Iterable[int]] = None,
+                      chunk_size: int = DEFAULT_CHUNK_SIZE,
+                      as_numpy: bool = False) -> Iterator:
+        """
+        Stream readings in timestamp order through a named server-side cursor
+        on a dedicated connection (see _stream).
+
+        Only one chunk is held in memory at a time, so memory stays flat
+        regardless of how much history the table holds.
+
+        Args:
+            start: Inclusive lower bound on timestamp (None for no bound)
+            end: Exclusive upper bound on timestamp (None for no bound)
+            lot_ids: Restrict to these lot ids (None for all lots)
+            chunk_size: Rows fetched per round trip / yielded per batch
+            as_numpy: Yield NumPy record arrays (READING_DTYPE) instead of tuple lists
+
+        Yields:
+            Lists of (timestamp, lot_id, occupied_spots, available_spots) tuples,
+            or NumPy record arrays with UTC timestamps when as_numpy is set
+        """
+        source_sql, params = build_reading_source(start, end, lot_ids)
+        ts_column = "EXTRACT(EPOCH FROM timestamp)::bigint" if as_numpy else "timestamp"
+        query = f"""
+            SELECT {ts_column}, lot_id, occupied_spots, available_spots
+            FROM {source_sql}
+            ORDER BY timestamp, lot_id
+        """
+
+        if as_numpy:
+            import numpy as np
+
+        for rows in self._stream("iter_readings", query, params, chunk_size):
+            yield np.array(rows, dtype=READING_DTYPE) if as_numpy else rows
+
+    def iter_daily_rollups(self,
+                           days: Optional[int] = None,
+                           chunk_size: int = DEFAULT_CHUNK_SIZE,
+                           start: Optional[date] = None,
+                           end: Optional[date] = None) -> Iterator[List[Tuple]]:
+        """
+        Stream daily rollup rows in day order through a named server-side cursor
+        on a dedicated connection (see _stream).
+        
+        Args:
+            days: Number of local days to look back (None for all data)
+            chunk_size: Rows fetched per round trip / yielded per batch
+            start: Inclusive first local day (None for no bound)
+            end: Exclusive last local day (None for no bound)
+        
+        Yields:
+            Lists of (day, lot_id, time_slot, sample_count, occupancy_sum,
+            occupancy_count, full_count) tuples
+        """
+        conditions, params = [], []
+        if days is not None:
+            conditions.append("day >= (NOW() AT TIME ZONE 'America/Chicago')::date - %s")
+            params.append(int(days))
+        if start is not None:
+            conditions.append("day >= %s")
+            params.append(start)
+        if end is not None:
+            conditions.append("day < %s")
+            params.append(end)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"""
+            SELECT day, lot_id, time_slot, sample_count, occupancy_sum, occupancy_count,
+                   occupancy_hist[{FULL_BUCKET + 1}] AS full_count
+            FROM parking_daily_rollup
+            {where}
+            ORDER BY day, lot_id, time_slot
+        """
+        
+        yield from self._stream("iter_daily_rollups", query, params, chunk_size)
+
+    def _stream(self, name, query, params, chunk_size):
+        """
+        Yield query results in chunks from a named server-side cursor.
+
+        The cursor gets its own read-only connection: a named cursor lives in a
+        transaction that must stay open while the caller iterates, and ending
+        it on self.conn would roll back whatever the caller had not committed.
+        """
+        conn = self.get_connection()
         try:
-            cursor = self.conn.cursor()
-            query = f"SELECT * FROM parking_data {where_clause}"
-            cursor.execute(query)
-            rows = cursor.fetchall()
+            conn.set_session(readonly=True)
+            cursor = conn.cursor(name=f"{name}_{next(_cursor_ids)}")
+            cursor.itersize = chunk_size
+            cursor.execute(query, params)
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield rows
             cursor.close()
+        finally:
+            conn.close()
+
+    @timed("db.get_data")
+    def get_data(self,
+                 start: Optional[datetime] = None,
+                 end: Optional[datetime] = None,
+                 lot_ids: Optional[Iterable[int]] = None) -> List[Tuple]:
+        """
+        Get readings as a list of tuples. Prefer iter_readings() for large ranges.
+
+        Args:
+            start: Inclusive lower bound on timestamp (None for no bound)
+            end: Exclusive upper bound on timestamp (None for no bound)
+            lot_ids: Restrict to these lot ids (None for all lots)
+        """
+        try:
+            rows = []
+            for chunk in self.iter_readings(start, end, lot_ids):
+                rows.extend(chunk)
             return rows
         except Exception as e:
             print(f"❌ Failed to get data: {e}")
             return []
 
+    @timed("db.export_to_csv")
     def export_to_csv(self, output_dir="./data"):
         """
         Export all parking data to CSV files, split by ISO week.
@@ -223,21 +1079,28 @@ class DB:
             # Ensure directory exists
             os.makedirs(output_dir, exist_ok=True)
             
+            # Weeks with compacted days were exported while their raw rows existed; don't overwrite them
+            raw_from = self.get_raw_from()
             cursor = self.conn.cursor()
             
             # Get all data ordered by timestamp
-            cursor.execute("""
+            cursor.execute(f"""
                 SELECT 
                     timestamp AT TIME ZONE 'America/Chicago' as timestamp_cst,
-                    lot_id,
+                    lots.name,
                     occupied_spots,
                     available_spots,
-                    (occupied_spots + available_spots) as total_capacity
-                FROM parking_data 
+                    lots.capacity as total_capacity
+                FROM parking_readings
+                JOIN lots USING (lot_id)
+                {RAW_WHERE}
                 ORDER BY timestamp
             """)
             rows = cursor.fetchall()
             cursor.close()
+            if raw_from is not None:
+                rows = [row for row in rows
+                        if row[0].date() - timedelta(days=row[0].weekday()) >= raw_from]
             
             if not rows:
                 print("❌ No data to export")
@@ -271,8 +1134,7 @@ class DB:
                     
                     # Data rows
                     for row in week_rows:
-                        timestamp, lot_id, occupied, available, total = row
-                        lot_name = LOT_INFO.get(str(lot_id), f"Unknown_{lot_id}")
+                        timestamp, lot_name, occupied, available, total = row
                         # Format timestamp as YYYY-MM-DD HH:MM
                         timestamp_str = timestamp.strftime('%Y-%m-%d %H:%M')
                         writer.writerow([timestamp_str, lot_name, occupied, available, total])
@@ -281,6 +1143,7 @@ class DB:
                 total_rows += len(week_rows)
                 # print(f"  - {filename}: {len(week_rows)} rows")
             
+            incr("db.rows_exported", total_rows)
             print(f"✅ Exported {total_rows} rows across {total_files} files in {output_dir}")
             return True
             
@@ -289,6 +1152,7 @@ class DB:
             return False
 
 
+    @timed("db.get_heatmap_data")
     def get_heatmap_data(self, days=None):
         """
         Get aggregated heatmap data directly from PostgreSQL.
@@ -304,44 +1168,28 @@ class DB:
         
         Returns:
             Tuple of (data_rows, from_date, to_date)
-            data_rows: List of tuples (lot_id, day_of_week, time_slot, avg_occupancy, sample_count)
+            data_rows: List of tuples (lot_id, day_of_week, time_slot, avg_occupancy, sample_count,
+                       occupancy_sum, occupancy_count, clean_sample_count, clean_occupancy_sum,
+                       clean_occupancy_count). The unrounded sum and the count of readings with
+                       non-zero capacity let callers merge slots by sample weight; clean_* leave
+                       out flagged anomaly days.
         """
         try:
             cursor = self.conn.cursor()
             
-            # Build WHERE clause for date filtering
+            # Window statements bind the look-back; "all" uses its own unfiltered plan
             if days is not None:
-                where_clause = f"WHERE timestamp >= NOW() - INTERVAL '{days} days'"
+                suffix, params = "window", (int(days),)
             else:
-                where_clause = ""
+                suffix, params = "all", ()
             
             # Get date range
-            date_query = f"""
-                SELECT MIN(timestamp::date), MAX(timestamp::date) 
-                FROM parking_data {where_clause}
-            """
-            cursor.execute(date_query)
+            self._execute(cursor, f"date_range_{suffix}", params)
             date_range = cursor.fetchone()
             from_date = str(date_range[0]) if date_range[0] else ""
             to_date = str(date_range[1]) if date_range[1] else ""
             
-            # Main aggregation query
-            # PostgreSQL DOW: Sun=0, Mon=1, ..., Sat=6
-            # time slot: 0 ~ 288 (5 mins)
-            # Convert UTC timestamp to local timezone for correct day/time slot calculation
-            query = f"""
-                SELECT 
-                    lot_id,
-                    EXTRACT(DOW FROM timestamp AT TIME ZONE 'America/Chicago')::int AS day_of_week,
-                    FLOOR((EXTRACT(HOUR FROM timestamp AT TIME ZONE 'America/Chicago') * 60 + EXTRACT(MINUTE FROM timestamp AT TIME ZONE 'America/Chicago')) / 5)::int AS time_slot,
-                    ROUND(AVG((occupied_spots::float / NULLIF(occupied_spots + available_spots, 0)) * 100)::numeric, 1) AS avg_occupancy,
-                    COUNT(*) AS sample_count
-                FROM parking_data
-                {where_clause}
-                GROUP BY lot_id, day_of_week, time_slot
-                ORDER BY lot_id, day_of_week, time_slot
-            """
-
+            # Main aggregation query (see HEATMAP_SQL)
             """
              lot_id | day_of_week | time_slot | avg_occupancy | sample_count 
             --------+-------------+-----------+---------------+--------------
@@ -350,8 +1198,7 @@ class DB:
                   2 |           2 |       193 |          75.0 |            1
                   3 |           1 |        90 |         100.0 |            1
             """
-
-            cursor.execute(query)
+            self._execute(cursor, f"heatmap_{suffix}", params)
             rows = cursor.fetchall()
             cursor.close()
             
@@ -359,9 +1206,314 @@ class DB:
             return rows, from_date, to_date
             
         except Exception as e:
+            self.conn.rollback()
             print(f"❌ Failed to get heatmap data: {e}")
             return [], "", ""
 
+    @timed("db.get_rollup_date_range")
+    def get_rollup_date_range(self):
+        """
+        Returns:
+            (first local day, last local day) in parking_daily_rollup, or (None, None)
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(CREATE_ROLLUP_TABLE_SQL)
+            cursor.execute("SELECT MIN(day), MAX(day) FROM parking_daily_rollup")
+            row = cursor.fetchone()
+            self.conn.commit()
+            cursor.close()
+            return row
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to get rollup date range: {e}")
+            return None, None
+
+    @timed("db.refresh_daily_rollups")
+    def refresh_daily_rollups(self, days_back=ROLLUP_REFRESH_DAYS):
+        """
+        Recompute per-(local day, lot, slot) rollups with occupancy histograms.
+        
+        Recent days are rebuilt because they may still be receiving readings.
+        If the rollup table is empty, all history is rolled up once.
+        
+        Args:
+            days_back: Number of local days before today to rebuild (None for all data)
+        
+        Returns:
+            bool: True if successful, False otherwise
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(CREATE_ROLLUP_TABLE_SQL)
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM parking_daily_rollup)")
+            if not cursor.fetchone()[0]:
+                days_back = None
+            
+            # Compacted days have no raw rows left to rebuild from; keep their rollups as they are
+            cursor.execute(CREATE_RETENTION_TABLE_SQL)
+            params = {"width": OCCUPANCY_BUCKET_WIDTH, "full": FULL_BUCKET}
+            if days_back is not None:
+                readings = f"parking_readings_since({LOCAL_DAYS_SINCE}) AS parking_readings WHERE timestamp >= {RAW_FROM_SQL}"
+                params["days"] = int(days_back)
+            else:
+                readings = f"parking_readings {RAW_WHERE}"
+            cursor.execute(REFRESH_ROLLUP_SQL.format(readings=readings), params)
+            updated = cursor.rowcount
+            self.conn.commit()
+            cursor.close()
+            
+            scope = f"last {days_back} day(s)" if days_back is not None else "all history"
+            print(f"  Refreshed {updated} rollup rows ({scope})")
+            return True
+            
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to refresh daily rollups: {e}")
+            return False
+
+    def get_raw_from(self):
+        """Local date from which parking_data holds raw readings (None if nothing was compacted)."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(CREATE_RETENTION_TABLE_SQL)
+            cursor.execute("SELECT raw_from FROM parking_retention")
+            row = cursor.fetchone()
+            self.conn.commit()
+            cursor.close()
+            return row[0] if row else None
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to get retention watermark: {e}")
+            return None
+
+    @timed("db.compact_readings")
+    def compact_readings(self, before_day, batch_days=COMPACT_BATCH_DAYS, archive_dir=None):
+        """
+        Fold raw readings on local days before before_day into parking_daily_rollup
+        and delete them from parking_data, advancing the retention watermark.
+        
+        Works oldest first, one transaction per batch_days local days: each batch
+        rebuilds its days' rollups from the raw readings, deletes the rows and moves
+        raw_from in one commit, so an interrupted run leaves a consistent state and
+        the next run continues from there. Raw rows inserted later for days already
+        compacted are never counted and are removed by the next run.
+        
+        Args:
+            before_day: First local date to keep raw
+            batch_days: Local days per transaction
+            archive_dir: Also write the deleted rows as gzipped CSV here (None: don't archive)
+        
+        Returns:
+            int: Raw rows deleted, or -1 on failure
+        """
+        deleted = 0
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(CREATE_RETENTION_TABLE_SQL)
+            self.conn.commit()
+            while True:
+                # One compaction at a time; readers are not blocked
+                cursor.execute("LOCK TABLE parking_retention IN EXCLUSIVE MODE")
+                raw_from = self._compaction_start(cursor)
+                if raw_from is None or raw_from >= before_day:
+                    self.conn.commit()
+                    break
+                batch_end = min(before_day, raw_from + timedelta(days=batch_days))
+                params = {
+                    "since": CENTRAL_TZ.localize(datetime.combine(raw_from, datetime.min.time())),
+                    "before": CENTRAL_TZ.localize(datetime.combine(batch_end, datetime.min.time())),
+                    "raw_from": batch_end,
+                    "width": OCCUPANCY_BUCKET_WIDTH,
+                    "full": FULL_BUCKET,
+                }
+                batch_readings = ("parking_readings_since(%(since)s) AS parking_readings "
+                                  f"WHERE timestamp >= {RAW_FROM_SQL} AND timestamp < %(before)s")
+                cursor.execute(REFRESH_ROLLUP_SQL.format(readings=batch_readings), params)
+                cursor.execute(f"SELECT MIN(timestamp), MAX(timestamp) FROM {batch_readings}", params)
+                params["first"], params["last"] = cursor.fetchone()
+
+                if archive_dir:
+                    os.makedirs(archive_dir, exist_ok=True)
+                    path = os.path.join(archive_dir, f"parking_data_{raw_from}_{batch_end}.csv.gz")
+                    query = cursor.mogrify(f"SELECT * FROM parking_data {COMPACTABLE_WHERE} ORDER BY timestamp, lot_id",
+                                           params).decode()
+                    with gzip.open(path, 'wt', encoding='utf-8', newline='') as f:
+                        cursor.copy_expert(f"COPY ({query}) TO STDOUT WITH CSV HEADER", f)
+
+                cursor.execute(f"DELETE FROM parking_data {COMPACTABLE_WHERE}", params)
+                batch_deleted = cursor.rowcount
+                cursor.execute("""
+                    INSERT INTO parking_retention (raw_from, first_reading, last_reading)
+                    VALUES (%(raw_from)s, %(first)s, %(last)s)
+                    ON CONFLICT (id) DO UPDATE SET
+                        raw_from = EXCLUDED.raw_from,
+                        first_reading = LEAST(parking_retention.first_reading, EXCLUDED.first_reading),
+                        last_reading = GREATEST(parking_retention.last_reading, EXCLUDED.last_reading),
+                        compacted_at = NOW()
+                """, params)
+                self.conn.commit()
+                deleted += batch_deleted
+                incr("db.rows_compacted", batch_deleted)
+                print(f"  Compacted {raw_from} .. {batch_end - timedelta(days=1)}: {batch_deleted} raw rows removed")
+            cursor.close()
+            return deleted
+
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to compact readings: {e}")
+            return -1
+
+    def _compaction_start(self, cursor):
+        """Watermark inside the compaction transaction; before the first compaction, the first raw day."""
+        cursor.execute("SELECT raw_from FROM parking_retention")
+        row = cursor.fetchone()
+        if row:
+            return row[0]
+        cursor.execute("SELECT (MIN(timestamp) AT TIME ZONE 'America/Chicago')::date FROM parking_data")
+        return cursor.fetchone()[0]
+
+    def vacuum_readings(self):
+        """VACUUM ANALYZE parking_data so space freed by compaction is reused and plans see the new size."""
+        try:
+            # VACUUM can't run inside a transaction block
+            self.conn.rollback()
+            self.conn.autocommit = True
+            cursor = self.conn.cursor()
+            cursor.execute("VACUUM (ANALYZE) parking_data")
+            cursor.close()
+            return True
+        except Exception as e:
+            print(f"❌ Failed to vacuum parking_data: {e}")
+            return False
+        finally:
+            self.conn.autocommit = False
+
+    @timed("db.get_storage_stats")
+    def get_storage_stats(self, table="parking_data"):
+        """
+        On-disk footprint of a table and its indexes (an exact count, so it scans the table).
+        
+        Returns:
+            Dict with rows, pages, heap_bytes (main fork), table_bytes (with TOAST and
+            maps), avg_row_bytes (pg_column_size of a row: tuple header plus data),
+            index_bytes and indexes ({name: bytes}); None on failure
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(f"SELECT COUNT(*), COALESCE(AVG(pg_column_size(t.*)), 0) FROM {table} t")
+            rows, avg_row_bytes = cursor.fetchone()
+            cursor.execute("""
+                SELECT pg_relation_size(%(t)s::regclass) / current_setting('block_size')::int,
+                       pg_relation_size(%(t)s::regclass),
+                       pg_table_size(%(t)s::regclass),
+                       pg_indexes_size(%(t)s::regclass)
+            """, {"t": table})
+            pages, heap_bytes, table_bytes, index_bytes = cursor.fetchone()
+            cursor.execute("""
+                SELECT indexrelid::regclass::text, pg_relation_size(indexrelid)
+                FROM pg_index WHERE indrelid = %s::regclass
+                ORDER BY 1
+            """, (table,))
+            indexes = dict(cursor.fetchall())
+            self.conn.commit()
+            cursor.close()
+            return {
+                "rows": rows,
+                "pages": pages,
+                "heap_bytes": heap_bytes,
+                "table_bytes": table_bytes,
+                "avg_row_bytes": float(avg_row_bytes),
+                "index_bytes": index_bytes,
+                "indexes": indexes,
+            }
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to get storage stats for {table}: {e}")
+            return None
+
+    @timed("db.flag_anomaly_day")
+    def flag_anomaly_day(self, day, lot_id, anomalous_readings, readings):
+        """Record (or update the counts of) a lot's anomalous local day."""
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(CREATE_ANOMALY_TABLE_SQL)
+            cursor.execute(
+                """INSERT INTO parking_anomaly_days (day, lot_id, anomalous_readings, readings)
+                   VALUES (%s, %s, %s, %s)
+                   ON CONFLICT (day, lot_id) DO UPDATE SET
+                       anomalous_readings = EXCLUDED.anomalous_readings,
+                       readings = EXCLUDED.readings""",
+                (day, lot_id, anomalous_readings, readings)
+            )
+            self.conn.commit()
+            cursor.close()
+            return True
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to flag anomaly day: {e}")
+            return False
+
+    @timed("db.get_segment_data")
+    def get_segment_data(self, calendar, default_segment="other"):
+        """
+        Aggregate the daily rollups by calendar segment in a single grouped pass.
+        
+        Args:
+            calendar: List of (start_date, end_date, tag); later entries win on overlap
+            default_segment: Segment for days no calendar entry covers
+        
+        Returns:
+            List of tuples (segment, lot_id, day_of_week, time_slot, sample_count,
+            occupancy_sum, occupancy_count, first_day, last_day)
+        """
+        try:
+            cursor = self.conn.cursor()
+            cursor.execute(SEGMENT_SQL, {
+                "starts": [start for start, _, _ in calendar],
+                "ends": [end for _, end, _ in calendar],
+                "tags": [tag for _, _, tag in calendar],
+                "default": default_segment,
+            })
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows
+            
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to get segment data: {e}")
+            return []
+
+    @timed("db.get_distribution_data")
+    def get_distribution_data(self, days=None):
+        """
+        Get merged occupancy histograms per (lot, day of week, slot) from the daily rollups.
+        
+        Args:
+            days: Number of local days to look back (None for all data)
+        
+        Returns:
+            Tuple of (rows, from_date, to_date): rows are (lot_id, day_of_week, time_slot, bucket, count),
+            omitting empty buckets; the dates are the first and last local day covered
+        """
+        try:
+            cursor = self.conn.cursor()
+            if days is not None:
+                where, params = DISTRIBUTION_WINDOW_WHERE, (int(days),)
+            else:
+                where, params = "", ()
+            cursor.execute(DISTRIBUTION_RANGE_SQL.format(where=where), params)
+            first_day, last_day = cursor.fetchone()
+            cursor.execute(DISTRIBUTION_SQL.format(where=where), params)
+            rows = cursor.fetchall()
+            cursor.close()
+            return rows, str(first_day) if first_day else "", str(last_day) if last_day else ""
+            
+        except Exception as e:
+            self.conn.rollback()
+            print(f"❌ Failed to get distribution data: {e}")
+            return [], "", ""
+
 if __name__ == "__main__":
     db = DB()
     db.test_connection()
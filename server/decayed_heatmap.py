@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+"""
+Exponentially decayed ("current typical occupancy") heatmap maintained online.
+
+Each (lot, day of week, 5-minute slot) cell keeps a decayed sum of occupancy %,
+a decayed reading count and the time of its last update. A new reading decays
+the cell to "now" and adds itself, so an update is O(1) and publishing needs no
+history scan: the cell average is decayed_sum / decayed_count.
+
+State is checkpointed to DECAY_STATE_PATH as JSON after each crawl tick.
+Sharded crawl workers on the same host save only the lots they own, merged
+into the shared file under a lock.
+
+Usage:
+    python decayed_heatmap.py --rebuild   # seed state once from all DB history
+"""
+import os
+import json
+import fcntl
+import argparse
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from dotenv import load_dotenv
+import pytz
+
+load_dotenv()
+
+# Configuration
+CENTRAL_TZ = pytz.timezone('America/Chicago')
+DECAY_HALF_LIFE_DAYS = float(os.getenv("DECAY_HALF_LIFE_DAYS", "14"))
+DECAY_STATE_PATH = os.getenv("DECAY_STATE_PATH", "./state/decayed_heatmap.json")
+DAYS_OF_WEEK = 7
+TIME_SLOTS = 288
+SLOT_MINUTES = 5
+CELLS = DAYS_OF_WEEK * TIME_SLOTS
+
+
+@contextmanager
+def checkpoint_lock(path: str):
+    """Exclusive lock around a checkpoint's read-modify-write, shared by processes on this host."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(f"{path}.lock", 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def write_checkpoint(path: str, data: Dict):
+    """Atomically replace a JSON checkpoint."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def cell_index(local_ts: datetime) -> int:
+    """Flat (day_of_week, slot) index for a local timestamp; day_of_week uses Sun=0."""
+    day = (local_ts.weekday() + 1) % 7
+    slot = (local_ts.hour * 60 + local_ts.minute) // SLOT_MINUTES
+    return day * TIME_SLOTS + slot
+
+
+class DecayedHeatmap:
+    def __init__(self, half_life_days: float = DECAY_HALF_LIFE_DAYS):
+        self.half_life_seconds = half_life_days * 86400
+        # lot_id -> {"sum": [...], "count": [...], "updated": [...]} flat over CELLS
+        self.lots: Dict[int, Dict[str, list]] = {}
+
+    def _lot(self, lot_id: int) -> Dict[str, list]:
+        lot = self.lots.get(lot_id)
+        if lot is None:
+            lot = self.lots[lot_id] = {
+                "sum": [0.0] * CELLS,
+                "count": [0.0] * CELLS,
+                "updated": [0.0] * CELLS,
+            }
+        return lot
+
+    def _decay(self, elapsed_seconds: float) -> float:
+        return 0.5 ** (max(elapsed_seconds, 0.0) / self.half_life_seconds)
+
+    def update(self, lot_id: int, timestamp: datetime, occupied_spots: int, available_spots: int,
+               weight: float = 1.0):
+        """Fold one reading into its cell; weight is the share of the 5-minute slot it covers."""
+        capacity = occupied_spots + available_spots
+        if capacity <= 0:
+            return
+        local_ts = timestamp.astimezone(CENTRAL_TZ)
+        t = local_ts.timestamp()
+        i = cell_index(local_ts)
+        lot = self._lot(lot_id)
+
+        factor = self._decay(t - lot["updated"][i]) if lot["count"][i] else 0.0
+        lot["sum"][i] = lot["sum"][i] * factor + occupied_spots / capacity * 100 * weight
+        lot["count"][i] = lot["count"][i] * factor + weight
+        lot["updated"][i] = t
+
+    def update_span(self, lot_id: int, start: datetime, minutes: int, occupied_spots: int, available_spots: int):
+        """Fold a reading that held for `minutes` from `start` into every slot it overlaps, weighted by overlap."""
+        end = start + timedelta(minutes=minutes)
+        slot = timedelta(minutes=SLOT_MINUTES)
+        cell = start - timedelta(minutes=start.minute % SLOT_MINUTES, seconds=start.second,
+                                 microseconds=start.microsecond)
+        while cell < end:
+            piece_start = max(start, cell)
+            overlap = min(end, cell + slot) - piece_start
+            self.update(lot_id, piece_start, occupied_spots, available_spots, overlap / slot)
+            cell += slot
+
+    def snapshot(self, lot_id: int, now: Optional[datetime] = None) -> Dict[str, list]:
+        """
+        Decay every cell of a lot to `now` without mutating state.
+
+        Returns:
+            Dict with flat "occupancy_sum" and "occupancy_count" lists over CELLS
+        """
+        t = (now or datetime.now(CENTRAL_TZ)).timestamp()
+        lot = self.lots.get(lot_id)
+        if lot is None:
+            return {"occupancy_sum": [0.0] * CELLS, "occupancy_count": [0.0] * CELLS}
+        factors = [self._decay(t - u) for u in lot["updated"]]
+        return {
+            "occupancy_sum": [s * f for s, f in zip(lot["sum"], factors)],
+            "occupancy_count": [c * f for c, f in zip(lot["count"], factors)],
+        }
+
+    def save(self, path: str = DECAY_STATE_PATH, lot_ids: Optional[Iterable[int]] = None):
+        """
+        Atomically write the checkpoint.
+
+        Args:
+            path: Checkpoint file
+            lot_ids: Only replace these lots in the existing file (None writes every lot)
+        """
+        with checkpoint_lock(path):
+            lots = self.lots
+            if lot_ids is not None and os.path.exists(path):
+                lots = type(self).load(path).lots
+                lots.update({lot_id: self.lots[lot_id] for lot_id in lot_ids if lot_id in self.lots})
+            write_checkpoint(path, {
+                "half_life_days": self.half_life_seconds / 86400,
+                "lots": {str(lot_id): lot for lot_id, lot in lots.items()},
+            })
+
+    @classmethod
+    def load(cls, path: str = DECAY_STATE_PATH) -> "DecayedHeatmap":
+        """Load the checkpoint, or start empty if there is none."""
+        heatmap = cls()
+        if not os.path.exists(path):
+            return heatmap
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("half_life_days") != DECAY_HALF_LIFE_DAYS:
+            print(f"⚠️  Decay half-life changed ({data.get('half_life_days')} -> {DECAY_HALF_LIFE_DAYS} days); "
+                  f"existing state keeps its weights until rebuilt")
+        heatmap.lots = {int(lot_id): lot for lot_id, lot in data.get("lots", {}).items()}
+        return heatmap
+
+
+# Process-wide state used by the crawler
+_state: Optional[DecayedHeatmap] = None
+
+
+def get_state() -> DecayedHeatmap:
+    """Return the crawler's state, loading the checkpoint on first use."""
+    global _state
+    if _state is None:
+        try:
+            _state = DecayedHeatmap.load()
+        except Exception as e:
+            print(f"⚠️  Failed to load decayed heatmap state, starting empty: {e}")
+            _state = DecayedHeatmap()
+    return _state
+
+
+def reset_state():
+    """Drop the in-memory state so the next get_state() re-reads the checkpoint."""
+    global _state
+    _state = None
+
+
+def rebuild_from_db(path: str = DECAY_STATE_PATH) -> bool:
+    """Seed the state from every stored reading (one streaming pass)."""
+    from db import DB
+    db = DB()
+    heatmap = DecayedHeatmap()
+    rows = 0
+    try:
+        for chunk in db.iter_readings():
+            for timestamp, lot_id, occupied, available in chunk:
+                heatmap.update(lot_id, timestamp, occupied, available)
+            rows += len(chunk)
+    finally:
+        db.close_connection()
+    heatmap.save(path)
+    print(f"✅ Rebuilt decayed heatmap from {rows} readings -> {path}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exponentially decayed heatmap state")
+    parser.add_argument("--rebuild", action="store_true", help="Seed state from all DB history")
+    args = parser.parse_args()
+    if args.rebuild:
+        rebuild_from_db()
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
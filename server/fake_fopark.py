@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the fopark `lot/occupancy` API.
+
+Serves `GET /lot/occupancy?client_name=...&name=...` for any number of lots.
+Each lot uses one of the three payload shapes the fetchers parse ("stadium",
+"athletics", "haley"): the real upstream names map to their own shape, and
+synthetic lots are named `<shape>-<n>` (e.g. `athletics-17`).
+
+Payloads are synthetic by default, or replayed from recordings saved with
+--record (one `<shape>.json` per lot shape). Either way the watched EV stalls
+change between ticks, each tick with probability --change-probability. With
+--churn the other stalls are re-drawn every tick too, like a live feed, so the
+body changes even when the watched stalls don't.
+Their statuses are a deterministic function of (seed, lot name, tick), so a
+client can compute the expected counts with expected_counts(). The tick is the
+`tick` query parameter, else FakeFopark.tick when set in-process, else the
+current 5-minute clock mark (plain crawler runs).
+
+Latency, error rate (HTTP 503, also deterministic per lot and tick) and
+payload size (number of non-watched stalls) are configurable. With --etag,
+responses carry an ETag and If-None-Match is answered with 304.
+
+Usage:
+    python fake_fopark.py [--port 8765] [--latency-ms 50] [--jitter-ms 20]
+                          [--error-rate 0.01] [--stalls 300] [--payloads DIR]
+                          [--change-probability 0.2] [--churn] [--etag]
+    python fake_fopark.py --record DIR   # save live payloads for replay
+    FOPARK_API_BASE=http://127.0.0.1:8765 python crawl_worker.py
+"""
+import os
+import json
+import hashlib
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from parking_crawl import (
+    UPSTREAM_LOTS, URLS, STADIUM_EV_COORDS, ATHLETICS_EV_SLICE, HALEY_EV_COORDS,
+    FETCH_INTERVAL_MINUTES,
+)
+
+SHAPES = ("stadium", "athletics", "haley")
+REAL_LOT_SHAPES = {name: shape for shape, name in UPSTREAM_LOTS.items()}
+DEFAULT_STALLS = 300
+# Occupied probability of a watched stall on a synthetic tick
+OCCUPIED_PROBABILITY = 0.5
+
+
+def shape_of(name: str) -> Optional[str]:
+    """Payload shape for an upstream or synthetic (`<shape>-<n>`) lot name."""
+    if name in REAL_LOT_SHAPES:
+        return REAL_LOT_SHAPES[name]
+    shape = name.rsplit("-", 1)[0]
+    return shape if shape in SHAPES else None
+
+
+def _rng(seed: int, name: str, tick: int, purpose: str) -> random.Random:
+    # str seeds hash with SHA-512, so this is stable across processes
+    return random.Random(f"{seed}:{name}:{tick}:{purpose}")
+
+
+def last_change(seed: int, name: str, tick: int, change_probability: float) -> int:
+    """Latest tick <= `tick` at which the lot's watched stalls changed (tick 0 always counts)."""
+    if change_probability >= 1:
+        return tick
+    if change_probability <= 0:
+        return 0
+    while tick > 0 and _rng(seed, name, tick, "change").random() >= change_probability:
+        tick -= 1
+    return tick
+
+
+def watched_statuses(seed: int, name: str, tick: int, change_probability: float = 1.0) -> List[int]:
+    """Statuses (1 occupied, 0 available) of a lot's watched stalls at a tick."""
+    watched = {"stadium": len(STADIUM_EV_COORDS),
+               "athletics": ATHLETICS_EV_SLICE.stop - ATHLETICS_EV_SLICE.start,
+               "haley": len(HALEY_EV_COORDS)}[shape_of(name)]
+    rng = _rng(seed, name, last_change(seed, name, tick, change_probability), "status")
+    return [int(rng.random() < OCCUPIED_PROBABILITY) for _ in range(watched)]
+
+
+def is_error(seed: int, name: str, tick: int, error_rate: float) -> bool:
+    return error_rate > 0 and _rng(seed, name, tick, "error").random() < error_rate
+
+
+def expected_counts(seed: int, name: str, tick: int, error_rate: float = 0.0,
+                    change_probability: float = 1.0) -> Optional[List[int]]:
+    """What a fetcher should return for this lot and tick: [occupied, available], or None on an injected error."""
+    if is_error(seed, name, tick, error_rate):
+        return None
+    statuses = watched_statuses(seed, name, tick, change_probability)
+    return [sum(statuses), len(statuses) - sum(statuses)]
+
+
+def synthetic_template(shape: str, stalls: int) -> Dict:
+    """A lot_status payload with `stalls` filler stalls around the watched ones."""
+    rng = random.Random(f"template:{shape}")
+
+    def stall(coords, status):
+        return {"coords": coords, "status": status, "name": f"Stall {rng.randint(1, 999)}"}
+
+    def filler():
+        return stall(f"{32.6 + rng.random() / 100},{-85.49 - rng.random() / 100}", rng.randint(0, 1))
+
+    if shape == "athletics":
+        size = max(stalls, ATHLETICS_EV_SLICE.stop)
+        return {"lot_status": [filler() for _ in range(size)]}
+
+    coords = STADIUM_EV_COORDS if shape == "stadium" else HALEY_EV_COORDS
+    items = [filler() for _ in range(stalls)]
+    for i, c in enumerate(coords):
+        items.insert(rng.randint(0, len(items)), stall(c, 0))
+    return {"lot_status": items}
+
+
+def watched_indexes(shape: str, payload: Dict) -> List[int]:
+    """Positions of the watched stalls in a payload, in the order fetchers count them."""
+    items = payload["lot_status"]
+    if shape == "athletics":
+        return list(range(len(items)))[ATHLETICS_EV_SLICE]
+    coords = set(STADIUM_EV_COORDS if shape == "stadium" else HALEY_EV_COORDS)
+    return [i for i, item in enumerate(items) if item.get("coords") in coords]
+
+
+class FakeFopark:
+    """Payload generator and fault injector behind the HTTP handler."""
+
+    def __init__(self, seed: int = 0, latency_ms: float = 0, jitter_ms: float = 0,
+                 error_rate: float = 0.0, stalls: int = DEFAULT_STALLS, payload_dir: Optional[str] = None,
+                 change_probability: float = 1.0, etag: bool = False, churn: bool = False):
+        self.seed = seed
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.change_probability = change_probability
+        self.etag = etag
+        self.churn = churn
+        # Tick served when a request has no `tick` parameter (None: wall clock)
+        self.tick: Optional[int] = None
+        self.templates = {}
+        for shape in SHAPES:
+            path = os.path.join(payload_dir, f"{shape}.json") if payload_dir else None
+            if path and os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    template = json.load(f)
+            else:
+                template = synthetic_template(shape, stalls)
+            self.templates[shape] = (template, watched_indexes(shape, template))
+        self.requests = 0
+        self.not_modified = 0
+        self._lock = threading.Lock()
+
+    def respond(self, name: str, tick: Optional[int],
+                if_none_match: Optional[str] = None) -> Tuple[int, bytes, Dict[str, str]]:
+        """Return (HTTP status, body, extra headers) for one occupancy request."""
+        with self._lock:
+            self.requests += 1
+        delay = self.latency_ms + random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+        shape = shape_of(name)
+        if shape is None:
+            return 404, b'{"error":"unknown lot"}', {}
+        if tick is None:
+            tick = self.tick if self.tick is not None else int(time.time() // (FETCH_INTERVAL_MINUTES * 60))
+        if is_error(self.seed, name, tick, self.error_rate):
+            return 503, b'{"error":"injected"}', {}
+
+        template, indexes = self.templates[shape]
+        items = list(template["lot_status"])
+        if self.churn:
+            rng, watched = _rng(self.seed, name, tick, "churn"), set(indexes)
+            items = [item if i in watched else {**item, "status": rng.randint(0, 1)} for i, item in enumerate(items)]
+        for i, status in zip(indexes, watched_statuses(self.seed, name, tick, self.change_probability)):
+            items[i] = {**items[i], "status": status}
+        body = json.dumps({**template, "lot_status": items}).encode()
+        if not self.etag:
+            return 200, body, {}
+
+        etag = f'"{hashlib.blake2b(body, digest_size=8).hexdigest()}"'
+        if if_none_match == etag:
+            with self._lock:
+                self.not_modified += 1
+            return 304, b"", {"ETag": etag}
+        return 200, body, {"ETag": etag}
+
+
+def make_handler(fake: FakeFopark):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path.rstrip("/") != "/lot/occupancy":
+                self._send(404, b'{"error":"not found"}')
+                return
+            query = parse_qs(url.query)
+            tick = query.get("tick", [None])[0]
+            self._send(*fake.respond(query.get("name", [""])[0], int(tick) if tick is not None else None,
+                                     self.headers.get("If-None-Match")))
+
+        def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            if status != 304:
+                self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # one line per request would swamp load tests
+
+    return Handler
+
+
+def serve(fake: FakeFopark, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the server on a background thread; port 0 picks a free port (see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def record(output_dir: str):
+    """Save one live payload per lot shape for --payloads replay."""
+    import requests
+    os.makedirs(output_dir, exist_ok=True)
+    for shape, url in URLS.items():
+        response = requests.get(url, timeout=30)
+        response.raise_for_status()
+        path = os.path.join(output_dir, f"{shape}.json")
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(response.text)
+        print(f"✅ Recorded {shape} ({len(response.content):,} bytes) -> {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake fopark lot/occupancy API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency-ms", type=float, default=0, help="Mean response latency")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="Uniform +/- latency jitter")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests answered with 503")
+    parser.add_argument("--stalls", type=int, default=DEFAULT_STALLS, help="Filler stalls per synthetic payload")
+    parser.add_argument("--payloads", help="Directory of recorded <shape>.json payloads to replay")
+    parser.add_argument("--change-probability", type=float, default=1.0,
+                        help="Chance per tick that a lot's watched stalls change (default 1)")
+    parser.add_argument("--churn", action="store_true", help="Re-draw the non-watched stalls every tick")
+    parser.add_argument("--etag", action="store_true", help="Send ETags and honor If-None-Match")
+    parser.add_argument("--record", metavar="DIR", help="Record live payloads into DIR and exit")
+    args = parser.parse_args()
+
+    if args.record:
+        record(args.record)
+        return
+
+    fake = FakeFopark(args.seed, args.latency_ms, args.jitter_ms, args.error_rate, args.stalls, args.payloads,
+                      args.change_probability, args.etag, args.churn)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    server.daemon_threads = True
+    print(f"🚀 Fake fopark API on http://{args.host}:{args.port}/lot/occupancy")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n👋 Stopped after {fake.requests:,} requests ({fake.not_modified:,} not modified).")
+
+
+if __name__ == "__main__":
+    main()
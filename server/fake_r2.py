@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the S3 API of a Cloudflare R2 bucket.
+
+Implements the subset boto3 uses for publishing, with path-style addressing
+(`http://host:port/<bucket>/<key>`): PutObject (keeping Content-Type and
+Cache-Control), GetObject / HeadObject (returning them), ListObjectsV2 with
+continuation tokens and DeleteObjects, which rejects more than 1000 keys per
+request like S3 does. Any bucket name is accepted and credentials are not
+checked. Objects live in memory; request counts are kept per operation.
+
+--page-size caps ListObjectsV2 pages below the usual 1000 so pagination gets
+exercised with a few hundred objects.
+
+Usage:
+    python fake_r2.py [--port 8766] [--page-size 1000]
+    R2_ENDPOINT=http://127.0.0.1:8766 R2_BUCKET=parking-stat \\
+        R2_ACCESS_KEY_ID=x R2_SECRET_ACCESS_KEY=x python r2_publish.py
+"""
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, unquote, urlparse
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+MAX_DELETE_KEYS = 1000
+DEFAULT_PAGE_SIZE = 1000
+S3_NS = "http://s3.amazonaws.com/doc/2006-03-01/"
+
+
+def decode_aws_chunked(body: bytes) -> bytes:
+    """Strip aws-chunked framing (`<hex size>[;ext]\\r\\n<data>\\r\\n` ... `0\\r\\n<trailers>`)."""
+    data, pos = [], 0
+    while True:
+        end = body.index(b"\r\n", pos)
+        size = int(body[pos:end].split(b";")[0], 16)
+        if size == 0:
+            return b"".join(data)
+        data.append(body[end + 2:end + 2 + size])
+        pos = end + 2 + size + 2
+
+
+class FakeR2:
+    """In-memory buckets: {bucket: {key: (body, headers, last_modified)}}."""
+
+    def __init__(self, page_size: int = DEFAULT_PAGE_SIZE):
+        self.page_size = page_size
+        self.buckets: Dict[str, Dict[str, Tuple[bytes, Dict[str, str], datetime]]] = {}
+        self.requests = Counter()
+        self._lock = threading.Lock()
+
+    def put(self, bucket: str, key: str, body: bytes, headers: Dict[str, str]) -> str:
+        etag = f'"{hashlib.md5(body).hexdigest()}"'
+        kept = {name: value for name, value in headers.items() if name in ("Content-Type", "Cache-Control")}
+        with self._lock:
+            self.requests["put"] += 1
+            self.buckets.setdefault(bucket, {})[key] = (body, {**kept, "ETag": etag}, datetime.now(timezone.utc))
+        return etag
+
+    def get(self, bucket: str, key: str) -> Optional[Tuple[bytes, Dict[str, str]]]:
+        with self._lock:
+            self.requests["get"] += 1
+            item = self.buckets.get(bucket, {}).get(key)
+        return None if item is None else item[:2]
+
+    def keys(self, bucket: str) -> List[str]:
+        with self._lock:
+            return sorted(self.buckets.get(bucket, {}))
+
+    def list(self, bucket: str, prefix: str, after: str, max_keys: int) -> Tuple[List[Tuple[str, Dict, datetime, int]], bool]:
+        """Keys under prefix after the continuation key; returns (page, truncated)."""
+        with self._lock:
+            self.requests["list"] += 1
+            objects = self.buckets.get(bucket, {})
+            keys = sorted(k for k in objects if k.startswith(prefix) and k > after)
+            limit = min(max_keys, self.page_size)
+            page = [(k, objects[k][1], objects[k][2], len(objects[k][0])) for k in keys[:limit]]
+        return page, len(keys) > limit
+
+    def delete(self, bucket: str, keys: List[str]) -> bool:
+        with self._lock:
+            self.requests["delete"] += 1
+            if len(keys) > MAX_DELETE_KEYS:
+                return False
+            objects = self.buckets.get(bucket, {})
+            for key in keys:
+                objects.pop(key, None)
+            self.requests["deleted_keys"] += len(keys)
+        return True
+
+
+def _xml(root: str, body: str) -> bytes:
+    return f'<?xml version="1.0" encoding="UTF-8"?><{root} xmlns="{S3_NS}">{body}</{root}>'.encode()
+
+
+def _error(code: str, message: str) -> bytes:
+    return f'<?xml version="1.0" encoding="UTF-8"?><Error><Code>{code}</Code><Message>{message}</Message></Error>'.encode()
+
+
+def make_handler(fake: FakeR2):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _target(self):
+            url = urlparse(self.path)
+            bucket, _, key = url.path.lstrip("/").partition("/")
+            return bucket, unquote(key), parse_qs(url.query, keep_blank_values=True)
+
+        def _body(self) -> bytes:
+            body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+            if "aws-chunked" in self.headers.get("Content-Encoding", "") or self.headers.get("x-amz-decoded-content-length"):
+                body = decode_aws_chunked(body)
+            return body
+
+        def do_PUT(self):
+            bucket, key, _ = self._target()
+            etag = fake.put(bucket, key, self._body(), dict(self.headers))
+            self._send(200, b"", {"ETag": etag})
+
+        def do_GET(self, head: bool = False):
+            bucket, key, query = self._target()
+            if not key:
+                self._list(bucket, query)
+                return
+            item = fake.get(bucket, key)
+            if item is None:
+                self._send(404, _error("NoSuchKey", "The specified key does not exist."),
+                           {"Content-Type": "application/xml"})
+                return
+            body, headers = item
+            self._send(200, body, headers, head)
+
+        def do_HEAD(self):
+            self.do_GET(head=True)
+
+        def do_POST(self):
+            bucket, _, query = self._target()
+            if "delete" not in query:
+                self._send(400, _error("InvalidRequest", "Only DeleteObjects is supported."))
+                return
+            root = ElementTree.fromstring(self._body())
+            keys = [element.text or "" for element in root.iter() if element.tag.split("}")[-1] == "Key"]
+            if not fake.delete(bucket, keys):
+                self._send(400, _error("MalformedXML", f"More than {MAX_DELETE_KEYS} keys."),
+                           {"Content-Type": "application/xml"})
+                return
+            self._send(200, _xml("DeleteResult", ""), {"Content-Type": "application/xml"})
+
+        def _list(self, bucket: str, query: Dict[str, List[str]]):
+            prefix = query.get("prefix", [""])[0]
+            after = query.get("continuation-token", query.get("start-after", [""]))[0]
+            max_keys = int(query.get("max-keys", [DEFAULT_PAGE_SIZE])[0])
+            page, truncated = fake.list(bucket, prefix, after, max_keys)
+            contents = "".join(
+                f"<Contents><Key>{escape(key)}</Key>"
+                f"<LastModified>{modified.strftime('%Y-%m-%dT%H:%M:%S.000Z')}</LastModified>"
+                f"<ETag>{escape(headers['ETag'])}</ETag><Size>{size}</Size>"
+                f"<StorageClass>STANDARD</StorageClass></Contents>"
+                for key, headers, modified, size in page
+            )
+            token = f"<NextContinuationToken>{escape(page[-1][0])}</NextContinuationToken>" if truncated else ""
+            body = (f"<Name>{escape(bucket)}</Name><Prefix>{escape(prefix)}</Prefix><KeyCount>{len(page)}</KeyCount>"
+                    f"<MaxKeys>{max_keys}</MaxKeys><IsTruncated>{'true' if truncated else 'false'}</IsTruncated>"
+                    f"{token}{contents}")
+            self._send(200, _xml("ListBucketResult", body), {"Content-Type": "application/xml"})
+
+        def _send(self, status: int, body: bytes, headers: Optional[Dict[str, str]] = None, head: bool = False):
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            if not head:
+                self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # one line per request would swamp harness runs
+
+    return Handler
+
+
+def serve(fake: FakeR2, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start the server on a background thread; port 0 picks a free port (see server.server_address)."""
+    server = ThreadingHTTPServer((host, port), make_handler(fake))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fake R2 (S3 API subset) bucket server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--page-size", type=int, default=DEFAULT_PAGE_SIZE, help="ListObjectsV2 page cap")
+    args = parser.parse_args()
+
+    fake = FakeR2(args.page_size)
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(fake))
+    server.daemon_threads = True
+    print(f"🚀 Fake R2 on http://{args.host}:{args.port}/<bucket>/<key>")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        counts = ", ".join(f"{op} {n:,}" for op, n in sorted(fake.requests.items()))
+        print(f"\n👋 Stopped ({counts}).")
+
+
+if __name__ == "__main__":
+    main()
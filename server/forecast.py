@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Availability forecast for the next 7 days, per lot × day × 5-minute slot.
+
+For every (lot, day of week, slot) cell the model fits, over that weekday's
+history, a recency-weighted mean plus a linear trend (weighted least squares,
+weights halving every FORECAST_HALF_LIFE_WEEKS). The probability of at least
+one free spot is the recency-weighted share of readings that were not full.
+All cells are fitted at once with NumPy; lots are processed in chunks so memory
+stays bounded with many lots and long histories.
+
+Produces:
+  - heatmaps/forecast.json
+"""
+import os
+import json
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+import pytz
+from db import DB
+from aggregate_heatmaps import OUTPUT_DIR, LOT_ID_TO_NAME, load_lots, round_half_up, TIME_SLOTS, generate_time_labels
+from metrics import timed
+
+# Configuration
+CENTRAL_TZ = pytz.timezone('America/Chicago')
+FORECAST_FILE = "forecast.json"
+FORECAST_DAYS = 7
+HALF_LIFE_WEEKS = float(os.getenv("FORECAST_HALF_LIFE_WEEKS", "4"))
+HISTORY_DAYS = int(os.getenv("FORECAST_HISTORY_DAYS", "365"))
+MIN_TREND_WEEKS = 3  # fewer observed weeks than this -> flat forecast (no trend term)
+LOT_CHUNK = 8        # lots fitted per vectorized batch
+DAY_LABELS = ["Sun", "Mon", "Tue", "Wed", "Thu", "Fri", "Sat"]
+
+
+def day_of_week(dates: np.ndarray) -> np.ndarray:
+    """Day of week with Sun=0 (PostgreSQL DOW, heatmap yLabels). 1970-01-01 was a Thursday."""
+    return (dates.astype("datetime64[D]").astype(np.int64) + 4) % 7
+
+
+def _to_weeks(values: np.ndarray, lead: int) -> np.ndarray:
+    """Reshape (lots, days, slots) into (lots, weeks, 7, slots), zero-padding partial weeks."""
+    lots, days, slots = values.shape
+    weeks = -(-(lead + days) // 7)
+    padded = np.zeros((lots, weeks * 7, slots), dtype=values.dtype)
+    padded[:, lead:lead + days] = values
+    return padded.reshape(lots, weeks, 7, slots)
+
+
+def fit_forecast(occupancy_sum: np.ndarray, occupancy_count: np.ndarray, full_count: np.ndarray,
+                 first_date: np.datetime64, horizon: List[np.datetime64],
+                 half_life_weeks: float = HALF_LIFE_WEEKS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Fit every (lot, weekday, slot) cell and predict the horizon dates.
+
+    Args:
+        occupancy_sum: (lots, days, slots) sum of occupancy % per day and slot
+        occupancy_count: (lots, days, slots) readings behind occupancy_sum
+        full_count: (lots, days, slots) readings with no free spot
+        first_date: Date of index 0 on the days axis
+        horizon: Dates to forecast
+        half_life_weeks: Age in weeks at which a day's weight halves
+
+    Returns:
+        Tuple of (occupancy, p_free), each (lots, len(horizon), slots) in percent, NaN without history
+    """
+    first_date = np.datetime64(first_date, "D")
+    lead = int(day_of_week(np.array([first_date]))[0])
+    n_lots, _, n_slots = occupancy_sum.shape
+
+    horizon_idx = (np.array(horizon, dtype="datetime64[D]") - first_date).astype(np.int64) + lead
+    target_week = (horizon_idx // 7).astype(float)
+    target_dow = horizon_idx % 7
+
+    occupancy = np.full((n_lots, len(horizon), n_slots), np.nan)
+    p_free = np.full((n_lots, len(horizon), n_slots), np.nan)
+
+    for start in range(0, n_lots, LOT_CHUNK):
+        chunk = slice(start, start + LOT_CHUNK)
+        sums = _to_weeks(occupancy_sum[chunk], lead).astype(float)
+        counts = _to_weeks(occupancy_count[chunk], lead).astype(float)
+        fulls = _to_weeks(full_count[chunk], lead).astype(float)
+
+        n_weeks = sums.shape[1]
+        x = np.arange(n_weeks, dtype=float)
+        decay = 0.5 ** (((n_weeks - 1) - x) / half_life_weeks)
+
+        observed = counts > 0
+        y = np.divide(sums, counts, out=np.zeros_like(sums), where=observed)
+        w = observed * decay[None, :, None, None]
+
+        # Weighted least squares y = mean_y + slope * (x - mean_x), reduced over the weeks axis
+        s0 = w.sum(axis=1)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean_x = np.einsum("lwds,w->lds", w, x) / s0
+            mean_y = (w * y).sum(axis=1) / s0
+            var_x = np.einsum("lwds,w->lds", w, x * x) / s0 - mean_x ** 2
+            cov_xy = np.einsum("lwds,w->lds", w * y, x) / s0 - mean_x * mean_y
+            enough = (observed.sum(axis=1) >= MIN_TREND_WEEKS) & (var_x > 1e-9)
+            slope = np.where(enough, cov_xy / np.where(enough, var_x, 1), 0.0)
+
+            weighted_counts = np.einsum("lwds,w->lds", counts, decay)
+            weighted_fulls = np.einsum("lwds,w->lds", fulls, decay)
+            free = np.where(weighted_counts > 0, (1 - weighted_fulls / weighted_counts) * 100, np.nan)
+
+        # Pick each horizon date's weekday row and extrapolate to its week
+        mx = mean_x[:, target_dow]
+        my = mean_y[:, target_dow]
+        sl = slope[:, target_dow]
+        predicted = my + sl * (target_week[None, :, None] - mx)
+        occupancy[chunk] = np.clip(predicted, 0, 100)
+        p_free[chunk] = free[:, target_dow]
+
+    return occupancy, p_free
+
+
+def load_history(db: DB, days: Optional[int]) -> Tuple[np.datetime64, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Load daily rollups into dense (lots, days, slots) arrays ordered like LOT_ID_TO_NAME.
+
+    Returns:
+        Tuple of (first_date, occupancy_sum, occupancy_count, full_count); first_date is None without data
+    """
+    today = np.datetime64(datetime.now(CENTRAL_TZ).date(), "D")
+    lot_index = {lot_id: i for i, lot_id in enumerate(LOT_ID_TO_NAME)}
+
+    first_date = None
+    occupancy_sum = occupancy_count = full_count = None
+    for rows in db.iter_daily_rollups(days):
+        if first_date is None:
+            first_date = np.datetime64(rows[0][0], "D")
+            shape = (len(lot_index), int((today - first_date) // np.timedelta64(1, "D")) + 1, TIME_SLOTS)
+            occupancy_sum = np.zeros(shape, dtype=np.float32)
+            occupancy_count = np.zeros(shape, dtype=np.int32)
+            full_count = np.zeros(shape, dtype=np.int32)
+
+        # Scatter the chunk column-wise instead of row by row
+        day, lot_id, slot, _, occ_sum, occ_count, full = zip(*rows)
+        lots = np.array([lot_index.get(l, -1) for l in lot_id])
+        offsets = (np.array(day, dtype="datetime64[D]") - first_date).astype(np.int64)
+        slots = np.array(slot)
+        keep = (lots >= 0) & (slots >= 0) & (slots < TIME_SLOTS) & (offsets < occupancy_sum.shape[1])
+        index = (lots[keep], offsets[keep], slots[keep])
+        occupancy_sum[index] = np.array(occ_sum, dtype=np.float32)[keep]
+        occupancy_count[index] = np.array(occ_count)[keep]
+        full_count[index] = np.array([f or 0 for f in full])[keep]
+
+    return first_date, occupancy_sum, occupancy_count, full_count
+
+
+def _to_json_row(values: np.ndarray) -> List[Optional[float]]:
+    return [None if np.isnan(v) else float(round_half_up(float(v))) for v in values]
+
+
+@timed("forecast.generate")
+def generate_forecast(output_dir: str = OUTPUT_DIR) -> bool:
+    """
+    Fit the forecast from the daily rollups and write forecast.json.
+
+    Returns:
+        bool: True if successful, False otherwise
+    """
+    db = DB()
+    try:
+        load_lots(db)
+        first_date, occupancy_sum, occupancy_count, full_count = load_history(db, HISTORY_DAYS)
+    finally:
+        db.close_connection()
+
+    if first_date is None:
+        print("❌ No rollup data available for forecasting")
+        return False
+
+    now = datetime.now(CENTRAL_TZ)
+    horizon_dates = [now.date() + timedelta(days=i) for i in range(FORECAST_DAYS)]
+    horizon = [np.datetime64(d, "D") for d in horizon_dates]
+
+    occupancy, p_free = fit_forecast(occupancy_sum, occupancy_count, full_count, first_date, horizon)
+
+    days = []
+    for h, date in enumerate(horizon_dates):
+        dow = int(day_of_week(np.array([horizon[h]]))[0])
+        lots: Dict[str, Dict] = {}
+        for i, lot_name in enumerate(LOT_ID_TO_NAME.values()):
+            lots[lot_name] = {
+                "occupancy": _to_json_row(occupancy[i, h]),
+                "p_free": _to_json_row(p_free[i, h]),
+            }
+        days.append({"date": date.isoformat(), "day_of_week": DAY_LABELS[dow], "lots": lots})
+
+    forecast = {
+        "days": days,
+        "meta": {
+            "xLabels": generate_time_labels(),
+            "metrics": {
+                "occupancy": "forecast occupancy rate (percent)",
+                "p_free": "probability at least one spot is free (percent)",
+            },
+            "model": "recency_weighted_trend",
+            "half_life_weeks": HALF_LIFE_WEEKS,
+            "history_from": str(first_date),
+            "generated_at": now.strftime("%Y-%m-%d %H:%M:%S")
+        }
+    }
+
+    os.makedirs(output_dir, exist_ok=True)
+    output_path = os.path.join(output_dir, FORECAST_FILE)
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(forecast, f, separators=(",", ":"))
+    print(f"✅ Forecast saved to: {output_path}")
+    return True
+
+
+def main():
+    """Standalone mode: generate the forecast when run directly."""
+    generate_forecast()
+
+
+if __name__ == "__main__":
+    main()
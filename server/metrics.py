@@ -0,0 +1,226 @@
+"""
+Lightweight stage timing and counters for the crawler and nightly jobs.
+
+Disabled unless METRICS_MODE is set, in which case every span records its
+duration under a dotted stage name (nested spans keep their parent) and is
+exported as either:
+  - jsonl:      one line per finished span, rotating log at METRICS_PATH
+  - prometheus: textfile-collector snapshot at METRICS_PATH, written on flush()
+
+When disabled, span() and @timed cost a single flag check per call.
+"""
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime
+from functools import wraps
+from logging.handlers import RotatingFileHandler
+from typing import Any, Callable, Dict, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+METRICS_MODE = os.getenv("METRICS_MODE", "off").strip().lower()  # off | jsonl | prometheus
+METRICS_PATH = os.getenv(
+    "METRICS_PATH",
+    "./metrics/parking.prom" if METRICS_MODE == "prometheus" else "./metrics/parking.jsonl",
+)
+METRICS_MAX_BYTES = int(os.getenv("METRICS_MAX_BYTES", str(5 * 1024 * 1024)))
+METRICS_BACKUP_COUNT = int(os.getenv("METRICS_BACKUP_COUNT", "5"))
+METRIC_PREFIX = "parking"
+
+ENABLED = METRICS_MODE in ("jsonl", "prometheus")
+
+# Currently open span (dotted path), used to give nested spans their parent
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_lock = threading.Lock()
+# stage -> {"count", "errors", "sum", "max"}
+_stages: Dict[str, Dict[str, float]] = {}
+_counters: Dict[str, float] = {}
+_jsonl_logger: Optional[logging.Logger] = None
+
+
+class SpanOutcome:
+    """Yielded by span(); set ok = False to record a handled failure as an error."""
+    __slots__ = ("ok",)
+
+    def __init__(self):
+        self.ok = True
+
+
+# Yielded while disabled; nothing reads it
+_DISABLED_OUTCOME = SpanOutcome()
+
+
+def _get_jsonl_logger() -> logging.Logger:
+    """Create the rotating JSONL logger on first use."""
+    global _jsonl_logger
+    if _jsonl_logger is None:
+        directory = os.path.dirname(METRICS_PATH)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        logger = logging.getLogger("parking.metrics")
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+        handler = RotatingFileHandler(
+            METRICS_PATH, maxBytes=METRICS_MAX_BYTES, backupCount=METRICS_BACKUP_COUNT, encoding="utf-8"
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        _jsonl_logger = logger
+    return _jsonl_logger
+
+
+def _record(stage: str, parent: Optional[str], duration: float, ok: bool):
+    with _lock:
+        stats = _stages.get(stage)
+        if stats is None:
+            stats = _stages[stage] = {"count": 0, "errors": 0, "sum": 0.0, "max": 0.0}
+        stats["count"] += 1
+        stats["sum"] += duration
+        if duration > stats["max"]:
+            stats["max"] = duration
+        if not ok:
+            stats["errors"] += 1
+
+    if METRICS_MODE == "jsonl":
+        _get_jsonl_logger().info(json.dumps({
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "type": "span",
+            "stage": stage,
+            "parent": parent,
+            "duration_ms": round(duration * 1000, 3),
+            "status": "ok" if ok else "error",
+        }))
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Time a block of work as a named stage.
+
+    The stage is recorded as an error when the block raises, or when it sets
+    ok = False on the yielded SpanOutcome (errors it handled itself).
+
+    Args:
+        stage: Dotted stage name, e.g. "db.add_data"
+    """
+    if not ENABLED:
+        yield _DISABLED_OUTCOME
+        return
+
+    parent = _current_span.get()
+    token = _current_span.set(stage)
+    outcome = SpanOutcome()
+    start = time.perf_counter()
+    try:
+        yield outcome
+    except BaseException:
+        outcome.ok = False
+        raise
+    finally:
+        duration = time.perf_counter() - start
+        _current_span.reset(token)
+        _record(stage, parent, duration, outcome.ok)
+
+
+def timed(stage: str, failed: Optional[Callable[[Any], bool]] = None):
+    """
+    Decorator form of span(); the check for ENABLED happens per call.
+
+    Args:
+        stage: Dotted stage name
+        failed: Predicate on the return value for functions that catch their own
+            errors (e.g. lambda result: result is None); a True result records an error
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not ENABLED:
+                return func(*args, **kwargs)
+            with span(stage) as outcome:
+                result = func(*args, **kwargs)
+                if failed is not None and failed(result):
+                    outcome.ok = False
+                return result
+        return wrapper
+    return decorator
+
+
+def incr(name: str, value: float = 1):
+    """Increment a named counter (e.g. rows inserted, bytes uploaded)."""
+    if not ENABLED:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+    if METRICS_MODE == "jsonl":
+        _get_jsonl_logger().info(json.dumps({
+            "ts": datetime.now().isoformat(timespec="milliseconds"),
+            "type": "counter",
+            "name": name,
+            "value": value,
+            "span": _current_span.get(),
+        }))
+
+
+def _render_prometheus() -> str:
+    """Render current stage stats and counters in Prometheus text format."""
+    lines = [
+        f"# HELP {METRIC_PREFIX}_stage_duration_seconds Wall time spent in each pipeline stage.",
+        f"# TYPE {METRIC_PREFIX}_stage_duration_seconds summary",
+    ]
+    with _lock:
+        stages = {k: dict(v) for k, v in _stages.items()}
+        counters = dict(_counters)
+
+    for stage, stats in sorted(stages.items()):
+        lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_sum{{stage="{stage}"}} {stats["sum"]:.6f}')
+        lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_count{{stage="{stage}"}} {int(stats["count"])}')
+
+    lines.append(f"# HELP {METRIC_PREFIX}_stage_duration_seconds_max Slowest observed run of each stage.")
+    lines.append(f"# TYPE {METRIC_PREFIX}_stage_duration_seconds_max gauge")
+    for stage, stats in sorted(stages.items()):
+        lines.append(f'{METRIC_PREFIX}_stage_duration_seconds_max{{stage="{stage}"}} {stats["max"]:.6f}')
+
+    lines.append(f"# HELP {METRIC_PREFIX}_stage_errors_total Stage runs that raised an exception.")
+    lines.append(f"# TYPE {METRIC_PREFIX}_stage_errors_total counter")
+    for stage, stats in sorted(stages.items()):
+        lines.append(f'{METRIC_PREFIX}_stage_errors_total{{stage="{stage}"}} {int(stats["errors"])}')
+
+    lines.append(f"# HELP {METRIC_PREFIX}_events_total Named event counters.")
+    lines.append(f"# TYPE {METRIC_PREFIX}_events_total counter")
+    for name, value in sorted(counters.items()):
+        lines.append(f'{METRIC_PREFIX}_events_total{{name="{name}"}} {value:g}')
+
+    return "\n".join(lines) + "\n"
+
+
+def flush():
+    """
+    Export accumulated metrics.
+
+    In prometheus mode the textfile is replaced atomically so a collector
+    never reads a half-written file. JSONL records are written as they happen.
+    """
+    if not ENABLED:
+        return
+    try:
+        if METRICS_MODE == "prometheus":
+            directory = os.path.dirname(METRICS_PATH)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            tmp_path = f"{METRICS_PATH}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(_render_prometheus())
+            os.replace(tmp_path, METRICS_PATH)
+        elif _jsonl_logger is not None:
+            for handler in _jsonl_logger.handlers:
+                handler.flush()
+    except Exception as e:
+        print(f"⚠️  Failed to write metrics: {e}")
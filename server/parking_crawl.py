@@ -1,116 +1,366 @@
+import os
+import hashlib
 import requests
 from datetime import datetime, timedelta
 import time
 import pytz
-from db import DB, LOT_NAME_TO_ID
+from db import DB, LOT_REGISTRY, LOT_NAME_TO_ID, READING_INTERVAL_MINUTES
+from poll_schedule import PollSchedule
+import metrics
+import decayed_heatmap
+import anomaly
+from metrics import timed, incr
 
 # Central Time zone
 CENTRAL_TZ = pytz.timezone('US/Central')
 
-# URLs to fetch parking data from
-URLS = {
-    "stadium": "https://api6.fopark-api.com/lot/occupancy?client_name=auburn&name=au-stdm-grg-lvl1",
-    "athletics": "https://api6.fopark-api.com/lot/occupancy?client_name=auburn&name=au-athletic-grg-lvl1",
-    "haley": "https://api6.fopark-api.com/lot/occupancy?client_name=auburn&name=au-west2"
+# Upstream API (point FOPARK_API_BASE at fake_fopark.py to crawl offline)
+FOPARK_API_BASE = os.getenv("FOPARK_API_BASE", "https://api6.fopark-api.com").rstrip("/")
+FOPARK_CLIENT_NAME = "auburn"
+FETCH_TIMEOUT_SECONDS = float(os.getenv("FETCH_TIMEOUT_SECONDS", "10"))
+
+# Upstream lot names per fetcher
+UPSTREAM_LOTS = {
+    "stadium": "au-stdm-grg-lvl1",
+    "athletics": "au-athletic-grg-lvl1",
+    "haley": "au-west2",
 }
 
+
+def occupancy_url(name, client_name=FOPARK_CLIENT_NAME, base=FOPARK_API_BASE):
+    return f"{base}/lot/occupancy?client_name={client_name}&name={name}"
+
+
+# URLs to fetch parking data from
+URLS = {key: occupancy_url(name) for key, name in UPSTREAM_LOTS.items()}
+
+# Watched EV stalls in each lot's lot_status payload
+STADIUM_EV_COORDS = [
+    "32.600559201904154,-85.48814522453688",  # Stall 33
+    "32.60053102304166,-85.48814664785039",   # Stall 34
+    "32.600503882656454,-85.48814530674588",  # Stall 35
+    "32.600475642272514,-85.48814396564137"   # Stall 134
+]
+ATHLETICS_EV_SLICE = slice(121, 125)  # by position in the status array
+HALEY_EV_COORDS = [
+    "32.60308136711112,-85.50106216197128",
+    "32.60305318310657,-85.50106213252354"
+]
+
 # Fetch interval in minutes (aligned to clock: :00, :05, :10, etc.)
-FETCH_INTERVAL_MINUTES = 5
+FETCH_INTERVAL_MINUTES = READING_INTERVAL_MINUTES
+
+# Per-lot cadence (fixed 5 minutes unless CRAWL_ADAPTIVE=1); the crawl loop wakes every TICK_MINUTES
+schedule = PollSchedule()
+TICK_MINUTES = schedule.tick_minutes
 
 def get_seconds_until_next_interval():
-    """Calculate seconds until the next 5-minute clock mark."""
+    """Calculate seconds until the next crawl tick (5-minute clock mark unless polling is adaptive)."""
     now = datetime.now(CENTRAL_TZ)
     current_minute = now.minute
-    minutes_past_interval = current_minute % FETCH_INTERVAL_MINUTES
+    minutes_past_interval = current_minute % TICK_MINUTES
     
     if minutes_past_interval == 0 and now.second == 0:
         return 0
     
-    minutes_to_next = FETCH_INTERVAL_MINUTES - minutes_past_interval
+    minutes_to_next = TICK_MINUTES - minutes_past_interval
     next_interval = now.replace(second=0, microsecond=0) + timedelta(minutes=minutes_to_next)
     seconds_until_next = (next_interval - now).total_seconds()
     
     return max(0, seconds_until_next)
 
-def fetch_stadium_data():
+# url -> {"etag", "last_modified", "digest", "watched", "result"} from the last successful fetch
+_payload_cache = {}
+
+
+def get_lot_status(url, watched):
+    """
+    GET a lot/occupancy payload and pick out the watched stalls, short-circuiting
+    when they haven't changed.
+
+    Sends If-None-Match / If-Modified-Since when upstream supplied validators.
+    On 304, or when the body hashes the same as last time, the previous result
+    is returned without parsing. Otherwise the payload is parsed and
+    watched(lot_status) selects the stall statuses the fetcher counts; if they
+    equal last time's, the previous result is returned too, so changes to
+    unrelated fields (timestamps, other stalls) don't count as a change.
+
+    Returns:
+        (watched statuses, None) when they changed (pass the counts to remember_result),
+        (None, previous result) when unchanged, or (None, None) on an HTTP error
+    """
+    cached = _payload_cache.get(url)
+    if cached and cached["result"] is None:
+        cached = None
+    headers = {}
+    if cached:
+        if cached["etag"]:
+            headers["If-None-Match"] = cached["etag"]
+        if cached["last_modified"]:
+            headers["If-Modified-Since"] = cached["last_modified"]
+
+    response = requests.get(url, headers=headers, timeout=FETCH_TIMEOUT_SECONDS)
+    if response.status_code == 304 and headers:
+        incr("crawl.not_modified")
+        return None, list(cached["result"])
+    if not response.ok:
+        return None, None
+
+    entry = {
+        "etag": response.headers.get("ETag"),
+        "last_modified": response.headers.get("Last-Modified"),
+        "digest": hashlib.blake2b(response.content, digest_size=16).digest(),
+        "watched": None,
+        "result": None,
+    }
+    if cached and cached["digest"] == entry["digest"]:
+        entry["watched"], entry["result"] = cached["watched"], cached["result"]
+        _payload_cache[url] = entry
+        incr("crawl.payload_unchanged")
+        return None, list(entry["result"])
+
+    entry["watched"] = watched(response.json()['lot_status'])
+    if cached and cached["watched"] == entry["watched"]:
+        entry["result"] = cached["result"]
+        _payload_cache[url] = entry
+        incr("crawl.watched_unchanged")
+        return None, list(entry["result"])
+
+    _payload_cache[url] = entry
+    return entry["watched"], None
+
+
+def remember_result(url, result):
+    """Cache the counts computed from the statuses get_lot_status() just returned for url."""
+    entry = _payload_cache.get(url)
+    if entry is not None:
+        entry["result"] = list(result)
+    return result
+
+
+def stadium_statuses(lot_status):
+    return [item['status'] for item in lot_status if item['coords'] in STADIUM_EV_COORDS]
+
+
+def athletics_statuses(lot_status):
+    txt = ''
+    for item in lot_status:
+        txt += str(item['status'])
+    return txt[ATHLETICS_EV_SLICE]
+
+
+def haley_statuses(lot_status):
+    return [item['status'] for item in lot_status if item['coords'] in HALEY_EV_COORDS]
+
+
+def fetch_failed(result) -> bool:
+    """Fetchers catch their own errors and return None; count that as a failed fetch span."""
+    return result is None
+
+
+@timed("crawl.fetch_stadium", failed=fetch_failed)
+def fetch_stadium_data(url=None):
     try:
-        stadiumResponse = requests.get(URLS['stadium'])
-        if not stadiumResponse.ok:
+        url = url or URLS['stadium']
+        electricStatuses, cached = get_lot_status(url, stadium_statuses)
+        if cached is not None:
+            return cached
+        if electricStatuses is None:
             return None
-        
-        stadiumJson = stadiumResponse.json()
-        stadiumData = stadiumJson['lot_status']
-
-        evSpotCoords = [
-            "32.600559201904154,-85.48814522453688",  # Stall 33
-            "32.60053102304166,-85.48814664785039",   # Stall 34
-            "32.600503882656454,-85.48814530674588",  # Stall 35
-            "32.600475642272514,-85.48814396564137"   # Stall 134
-        ]
-        electricStatuses = [item['status'] for item in stadiumData if item['coords'] in evSpotCoords]
 
         occAndAva = [0, 0]
         for status in electricStatuses:
             if status == 1: occAndAva[0] += 1
             if status == 0: occAndAva[1] += 1
         
-        return occAndAva
+        return remember_result(url, occAndAva)
 
     except Exception as error:
         print("Error fetching Stadium Deck data:", error)
 
-def fetch_athletics_data():
+@timed("crawl.fetch_athletics", failed=fetch_failed)
+def fetch_athletics_data(url=None):
     try:
-        athleticsResponse = requests.get(URLS['athletics'])
-        if not athleticsResponse.ok:
+        url = url or URLS['athletics']
+        slicedTxt, cached = get_lot_status(url, athletics_statuses)
+        if cached is not None:
+            return cached
+        if slicedTxt is None:
             return None
-        
-        athleticsJson = athleticsResponse.json()
-        athleticsData = athleticsJson['lot_status']
-
-        txt = ''
-        for item in athleticsData:
-            txt += str(item['status'])
-        
-        slicedTxt = txt[121:125]
 
         occAndAva = [0, 0]
         for status in slicedTxt:
             if status == str(1): occAndAva[0] += 1
             if status == str(0): occAndAva[1] += 1
         
-        return occAndAva
+        return remember_result(url, occAndAva)
 
     except Exception as error:
         print("Error fetching Athletics Deck data:", error)
 
-def fetch_haley_data():
+@timed("crawl.fetch_haley", failed=fetch_failed)
+def fetch_haley_data(url=None):
     try:
-        haleyResponse = requests.get(URLS['haley'])
-        if not haleyResponse.ok:
+        url = url or URLS['haley']
+        haleyEvSpotStatuses, cached = get_lot_status(url, haley_statuses)
+        if cached is not None:
+            return cached
+        if haleyEvSpotStatuses is None:
             return None
-        
-        haleyJson = haleyResponse.json()
-        haleyData = haleyJson['lot_status']
-
-        haleyEvSpotCoords = [
-            "32.60308136711112,-85.50106216197128",
-            "32.60305318310657,-85.50106213252354"
-        ]
-        
-        haleyEvSpotStatuses = [item['status'] for item in haleyData if item['coords'] in haleyEvSpotCoords]
 
         occAndAva = [0, 0]
         for status in haleyEvSpotStatuses:
             if status == 1: occAndAva[0] += 1
             if status == 0: occAndAva[1] += 1
         
-        return occAndAva
+        return remember_result(url, occAndAva)
 
     except Exception as error:
         print("Error fetching Haley Deck data:", error)
 
 
+def record_online_stats(db, lot_id, timestamp, occupied, available, covered_minutes=FETCH_INTERVAL_MINUTES):
+    """Fold a saved reading (covering covered_minutes from timestamp) into the decayed heatmap and the anomaly detector."""
+    try:
+        decayed_heatmap.get_state().update_span(lot_id, timestamp, covered_minutes, occupied, available)
+        flagged = anomaly.get_state().observe(lot_id, timestamp, occupied, available)
+        if flagged:
+            day, _, anomalous, readings = flagged
+            if anomalous == anomaly.ANOMALY_DAY_MIN_READINGS:
+                print(f"⚠️  Flagged {day} as an anomalous day for lot {lot_id}")
+            db.flag_anomaly_day(*flagged)
+    except Exception as e:
+        print(f"⚠️  Failed to update online stats: {e}")
+
+
+def save_online_stats(lot_ids=None):
+    """
+    Checkpoint the crawler's online state to disk.
+
+    Args:
+        lot_ids: Only write these lots into the shared checkpoint (None writes all)
+    """
+    try:
+        decayed_heatmap.get_state().save(lot_ids=lot_ids)
+        anomaly.get_state().save(lot_ids=lot_ids)
+    except Exception as e:
+        print(f"⚠️  Failed to checkpoint online stats: {e}")
+
+
+# lot_id -> [run_start, last_tick, occupied, available, covered_minutes] of the row the lot's last reading went to
+_last_readings = {}
+
+
+def forget_readings(lot_ids=None):
+    """Drop cached last readings and schedules (all lots when None) so the next tick re-reads them from the DB."""
+    if lot_ids is None:
+        _last_readings.clear()
+    for lot_id in lot_ids or ():
+        _last_readings.pop(lot_id, None)
+    schedule.forget(lot_ids)
+
+
+def save_reading(db, lot_id, now, occupied, available, covered_minutes=FETCH_INTERVAL_MINUTES):
+    """
+    Store one tick's reading, covering covered_minutes from `now`. When it
+    matches the lot's previous reading and that one covered exactly up to now,
+    extend that row's run (an "unchanged" marker) instead of inserting a repeat.
+
+    Returns:
+        "inserted", "extended", "duplicate" (tick already stored) or None on failure
+    """
+    last = _last_readings.get(lot_id)
+    if last is None:
+        row = db.get_last_reading(lot_id)
+        last = _last_readings[lot_id] = list(row) if row else None
+
+    # Coverage is stored only when it differs from the grid interval
+    poll_minutes = None if covered_minutes == READING_INTERVAL_MINUTES else covered_minutes
+
+    if last is not None:
+        run_start, last_tick, last_occupied, last_available, last_covered = last
+        if last_tick >= now:
+            return "duplicate"
+        last_end = last_tick + timedelta(minutes=last_covered)
+        if ((last_occupied, last_available) == (occupied, available)
+                and last_end == now
+                and run_start.astimezone(CENTRAL_TZ).date() == now.astimezone(CENTRAL_TZ).date()
+                and db.extend_reading(lot_id, run_start, now, poll_minutes)):
+            last[1], last[4] = now, covered_minutes
+            incr("crawl.readings_unchanged")
+            return "extended"
+        if last_end > now:
+            # Polled before the previous reading's scheduled end (restart or shard hand-over)
+            db.set_reading_coverage(lot_id, run_start, int((now - last_tick).total_seconds() // 60))
+
+    added = db.add_data(now, lot_id, occupied, available, poll_minutes)
+    if added != "inserted":
+        # On "duplicate" another worker stored this tick first; re-read its row next tick
+        _last_readings.pop(lot_id, None)
+        if added == "duplicate":
+            incr("crawl.readings_duplicate")
+        return added
+    _last_readings[lot_id] = [now, now, occupied, available, covered_minutes]
+    return "inserted"
+
+
+# Fetchers by payload shape, each returning [occupied, available] or None
+FETCHERS = {
+    "stadium": fetch_stadium_data,
+    "athletics": fetch_athletics_data,
+    "haley": fetch_haley_data,
+}
+
+# Lot name -> fetcher, for every lot in db.LOT_REGISTRY
+LOT_FETCHERS = {name: FETCHERS[fetcher] for name, _, fetcher in LOT_REGISTRY.values()}
+
+
+def crawl_lots(db, lot_names, now, checkpoint_lot_ids=None):
+    """
+    Fetch and save one reading for each named lot that is due at tick timestamp `now`.
+
+    Args:
+        db: Database connection (DB instance)
+        lot_names: Keys of LOT_FETCHERS to crawl
+        now: Tick timestamp stored with every reading
+        checkpoint_lot_ids: Passed to save_online_stats (None writes all lots)
+
+    Returns:
+        bool: True if any data was saved, False otherwise
+    """
+    timestamp_str = now.strftime("%Y-%m-%d %H:%M")
+    saved_any = False
+
+    for lot_name in lot_names:
+        lot_id = LOT_NAME_TO_ID.get(lot_name)
+        if not schedule.is_due(lot_id, now):
+            continue
+
+        data = LOT_FETCHERS[lot_name]()
+        if not data:
+            incr("crawl.fetch_failed")
+            schedule.failed(lot_id, now)
+            continue
+
+        covered = schedule.observe(lot_id, now, data[0], data[1])
+        saved = save_reading(db, lot_id, now, data[0], data[1], covered)
+        if saved in (None, "duplicate"):
+            continue
+        record_online_stats(db, lot_id, now, data[0], data[1], covered)
+        marker = " (unchanged)" if saved == "extended" else ""
+        cadence = f", next in {covered} min" if schedule.adaptive else ""
+        print(f"[{timestamp_str}] {lot_name.replace('_', ' ')}: "
+              f"{data[0]} occupied, {data[1]} available{marker}{cadence}")
+        saved_any = True
+
+    if saved_any:
+        print(f"[{timestamp_str}] ✅ Data saved to PostgreSQL")
+        save_online_stats(checkpoint_lot_ids)
+
+    return saved_any
+
+
+@timed("crawl.tick")
 def crawl_once(db):
     """
     Perform a single crawl and save data to database.
@@ -125,38 +375,7 @@ def crawl_once(db):
         # Get current timestamp (truncate to minute for clean DB entries)
         now = datetime.now(CENTRAL_TZ)
         now = now.replace(second=0, microsecond=0)  # Clean timestamp
-        timestamp_str = now.strftime("%Y-%m-%d %H:%M")
-        
-        # Fetch data from all lots
-        stadiumData = fetch_stadium_data()
-        athleticsData = fetch_athletics_data()
-        haleyData = fetch_haley_data()
-        
-        saved_any = False
-        
-        # Save to PostgreSQL
-        if stadiumData:
-            lot_id = LOT_NAME_TO_ID.get("Stadium_Deck")
-            db.add_data(now, lot_id, stadiumData[0], stadiumData[1])
-            print(f"[{timestamp_str}] Stadium Deck: {stadiumData[0]} occupied, {stadiumData[1]} available")
-            saved_any = True
-        
-        if athleticsData:
-            lot_id = LOT_NAME_TO_ID.get("Athletics_Deck")
-            db.add_data(now, lot_id, athleticsData[0], athleticsData[1])
-            print(f"[{timestamp_str}] Athletics Deck: {athleticsData[0]} occupied, {athleticsData[1]} available")
-            saved_any = True
-        
-        if haleyData:
-            lot_id = LOT_NAME_TO_ID.get("Haley_Deck")
-            db.add_data(now, lot_id, haleyData[0], haleyData[1])
-            print(f"[{timestamp_str}] Haley Deck: {haleyData[0]} occupied, {haleyData[1]} available")
-            saved_any = True
-        
-        if saved_any:
-            print(f"[{timestamp_str}] ✅ Data saved to PostgreSQL")
-        
-        return saved_any
+        return crawl_lots(db, LOT_FETCHERS, now)
         
     except Exception as e:
         print(f"Error during crawl: {e}")
@@ -175,6 +394,7 @@ def main():
     success = crawl_once(db)
     
     db.close_connection()
+    metrics.flush()
     
     if success:
         print("✅ Crawl completed successfully")
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""
+Per-lot polling cadence for the crawler.
+
+Fixed mode (default) polls every lot every FIXED_INTERVAL_MINUTES, exactly as
+before. Adaptive mode (CRAWL_ADAPTIVE=1) gives each lot its own interval on a
+ladder of clock-aligned intervals between CRAWL_MIN_INTERVAL_MINUTES and
+CRAWL_MAX_INTERVAL_MINUTES. Volatility is an exponentially weighted mean of
+the absolute occupancy change between polls. Above CRAWL_VOLATILE_PCT the lot
+moves one rung faster; below CRAWL_STABLE_PCT it moves one rung slower.
+
+Every poll covers the time until the lot's next scheduled poll. The crawler
+stores that as the reading's poll_minutes, and parking_readings weights
+readings by it, so heatmaps stay time-weighted whatever the cadence.
+
+Long-running crawlers keep the schedule in memory; the one-shot crawler
+(crawl_tick.py) carries it between runs in CRAWL_SCHEDULE_PATH.
+"""
+import os
+import json
+import math
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+FIXED_INTERVAL_MINUTES = 5
+CRAWL_ADAPTIVE = os.getenv("CRAWL_ADAPTIVE", "0").strip().lower() in ("1", "true", "yes", "on")
+CRAWL_MIN_INTERVAL_MINUTES = int(os.getenv("CRAWL_MIN_INTERVAL_MINUTES", "1"))
+CRAWL_MAX_INTERVAL_MINUTES = int(os.getenv("CRAWL_MAX_INTERVAL_MINUTES", "15"))
+CRAWL_VOLATILE_PCT = float(os.getenv("CRAWL_VOLATILE_PCT", "10"))
+CRAWL_STABLE_PCT = float(os.getenv("CRAWL_STABLE_PCT", "1"))
+CRAWL_SCHEDULE_PATH = os.getenv("CRAWL_SCHEDULE_PATH", "./state/poll_schedule.json")
+VOLATILITY_ALPHA = 0.5
+# Intervals that divide an hour, so every rung stays on clock marks
+INTERVAL_LADDER = (1, 2, 5, 10, 15, 20, 30, 60)
+
+
+def next_mark(now: datetime, minutes: int) -> datetime:
+    """First clock mark of a `minutes` interval strictly after `now` (a whole minute)."""
+    epoch_minute = int(now.timestamp() // 60)
+    return now + timedelta(minutes=(epoch_minute // minutes + 1) * minutes - epoch_minute)
+
+
+class PollSchedule:
+    def __init__(self, adaptive: bool = CRAWL_ADAPTIVE,
+                 min_minutes: int = CRAWL_MIN_INTERVAL_MINUTES,
+                 max_minutes: int = CRAWL_MAX_INTERVAL_MINUTES):
+        self.adaptive = adaptive
+        if adaptive:
+            self.ladder = [m for m in INTERVAL_LADDER if min_minutes <= m <= max_minutes]
+            if not self.ladder:
+                raise ValueError(f"No polling interval in {INTERVAL_LADDER} lies within "
+                                 f"[{min_minutes}, {max_minutes}] minutes")
+        else:
+            self.ladder = [FIXED_INTERVAL_MINUTES]
+        # Lots start on the rung closest to the fixed cadence
+        self.start_rung = min(range(len(self.ladder)), key=lambda i: abs(self.ladder[i] - FIXED_INTERVAL_MINUTES))
+        # lot_id -> {"rung", "volatility", "pct", "next_poll"}
+        self.lots: Dict[int, Dict] = {}
+
+    @property
+    def tick_minutes(self) -> int:
+        """How often the crawl loop must wake to serve the fastest rung."""
+        return self.ladder[0]
+
+    def is_due(self, lot_id: int, now: datetime) -> bool:
+        """Fixed mode polls on every call; adaptive mode once the lot's next poll time is reached."""
+        if not self.adaptive:
+            return True
+        lot = self.lots.get(lot_id)
+        return lot is None or lot["next_poll"] <= now
+
+    def observe(self, lot_id: int, now: datetime, occupied: int, available: int) -> int:
+        """
+        Record a successful poll and schedule the next one.
+
+        Returns:
+            Minutes this reading covers (until the lot's next scheduled poll)
+        """
+        capacity = occupied + available
+        pct = occupied / capacity * 100 if capacity > 0 else None
+        lot = self.lots.get(lot_id)
+        if lot is None:
+            lot = self.lots[lot_id] = {"rung": self.start_rung, "volatility": 0.0, "pct": pct}
+        elif pct is not None and lot["pct"] is not None:
+            change = abs(pct - lot["pct"])
+            lot["volatility"] = VOLATILITY_ALPHA * change + (1 - VOLATILITY_ALPHA) * lot["volatility"]
+            if lot["volatility"] > CRAWL_VOLATILE_PCT:
+                lot["rung"] = max(lot["rung"] - 1, 0)
+            elif lot["volatility"] < CRAWL_STABLE_PCT:
+                lot["rung"] = min(lot["rung"] + 1, len(self.ladder) - 1)
+        lot["pct"] = pct
+
+        lot["next_poll"] = next_mark(now, self.ladder[lot["rung"]])
+        return int(math.ceil((lot["next_poll"] - now).total_seconds() / 60))
+
+    def overdue_minutes(self, now: datetime) -> float:
+        """How long the most overdue lot has been due (0 when none is); adaptive mode only."""
+        if not self.adaptive:
+            return 0.0
+        due = [lot["next_poll"] for lot in self.lots.values() if "next_poll" in lot]
+        return max([(now - next_poll).total_seconds() / 60 for next_poll in due] + [0.0])
+
+    def failed(self, lot_id: int, now: datetime):
+        """Retry a failed poll on the lot's current cadence."""
+        lot = self.lots.get(lot_id)
+        if lot is not None:
+            lot["next_poll"] = next_mark(now, self.ladder[lot["rung"]])
+
+    def forget(self, lot_ids: Optional[Iterable[int]] = None):
+        """Drop state (all lots when None); forgotten lots restart on the default rung and are due at once."""
+        if lot_ids is None:
+            self.lots.clear()
+        for lot_id in lot_ids or ():
+            self.lots.pop(lot_id, None)
+
+    def save(self, path: str = CRAWL_SCHEDULE_PATH):
+        """Atomically checkpoint per-lot state (adaptive mode only; fixed mode has none worth keeping)."""
+        if not self.adaptive:
+            return
+        from decayed_heatmap import checkpoint_lock, write_checkpoint
+        lots = {str(lot_id): {**lot, "next_poll": lot["next_poll"].isoformat()}
+                for lot_id, lot in self.lots.items() if "next_poll" in lot}
+        with checkpoint_lock(path):
+            write_checkpoint(path, {"ladder": self.ladder, "lots": lots})
+
+    def restore(self, path: str = CRAWL_SCHEDULE_PATH):
+        """Load a checkpoint written by save(); a missing file or a changed ladder starts fresh."""
+        if not self.adaptive or not os.path.exists(path):
+            return
+        with open(path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        if data.get("ladder") != self.ladder:
+            print(f"⚠️  Polling ladder changed ({data.get('ladder')} -> {self.ladder}); schedule restarts")
+            return
+        self.lots = {int(lot_id): {**lot, "next_poll": datetime.fromisoformat(lot["next_poll"])}
+                     for lot_id, lot in data.get("lots", {}).items()}
@@ -0,0 +1,110 @@
+"""
+Opt-in cProfile + tracemalloc hooks for the nightly jobs.
+
+Enable with PROFILE_DAILY=1 (or `start.py --profile`). Each wrapped step writes:
+  - profiles/<timestamp>_<step>.prof        (load with pstats / snakeviz)
+  - profiles/<timestamp>_<step>_alloc.txt   (runtime, peak memory, top allocations)
+
+Steps whose runtime or peak traced memory exceed PROFILE_MAX_SECONDS /
+PROFILE_MAX_PEAK_MB are flagged in the log.
+"""
+import os
+import time
+import cProfile
+import pstats
+import tracemalloc
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Optional
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Configuration
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_TOP_N = int(os.getenv("PROFILE_TOP_N", "25"))
+
+
+def _env_flag(name: str) -> bool:
+    return os.getenv(name, "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _env_float(name: str) -> Optional[float]:
+    value = os.getenv(name, "").strip()
+    return float(value) if value else None
+
+
+_enabled = _env_flag("PROFILE_DAILY")
+MAX_SECONDS = _env_float("PROFILE_MAX_SECONDS")
+MAX_PEAK_MB = _env_float("PROFILE_MAX_PEAK_MB")
+
+
+def enable(flag: bool = True):
+    """Turn profiling on or off at runtime (used by the CLI flag)."""
+    global _enabled
+    _enabled = flag
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def _write_alloc_report(path: str, step: str, elapsed: float, peak_bytes: int, snapshot):
+    stats = snapshot.statistics("lineno")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(f"step: {step}\n")
+        f.write(f"runtime_seconds: {elapsed:.3f}\n")
+        f.write(f"peak_traced_mb: {peak_bytes / (1024 * 1024):.2f}\n")
+        f.write(f"\nTop {PROFILE_TOP_N} allocations (by line):\n")
+        for stat in stats[:PROFILE_TOP_N]:
+            f.write(f"{stat}\n")
+
+
+@contextmanager
+def profile_step(step: str):
+    """
+    Profile a block of work as one nightly step.
+
+    Args:
+        step: Short step name used in report filenames (e.g. "heatmaps")
+    """
+    if not _enabled:
+        yield
+        return
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    prof_path = os.path.join(PROFILE_DIR, f"{stamp}_{step}.prof")
+    alloc_path = os.path.join(PROFILE_DIR, f"{stamp}_{step}_alloc.txt")
+
+    # Don't stomp on a trace someone else already started
+    started_tracing = not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+
+    profiler = cProfile.Profile()
+    start = time.perf_counter()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        elapsed = time.perf_counter() - start
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot()
+        if started_tracing:
+            tracemalloc.stop()
+
+        try:
+            pstats.Stats(profiler).dump_stats(prof_path)
+            _write_alloc_report(alloc_path, step, elapsed, peak_bytes, snapshot)
+            peak_mb = peak_bytes / (1024 * 1024)
+            print(f"🔬 Profiled '{step}': {elapsed:.2f}s, peak {peak_mb:.1f} MB -> {prof_path}")
+
+            if MAX_SECONDS is not None and elapsed > MAX_SECONDS:
+                print(f"⚠️  Step '{step}' exceeded runtime threshold: {elapsed:.2f}s > {MAX_SECONDS:g}s")
+            if MAX_PEAK_MB is not None and peak_mb > MAX_PEAK_MB:
+                print(f"⚠️  Step '{step}' exceeded memory threshold: {peak_mb:.1f} MB > {MAX_PEAK_MB:g} MB")
+        except Exception as e:
+            print(f"⚠️  Failed to write profile for '{step}': {e}")
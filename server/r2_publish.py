@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Versioned, cache-friendly publishing of the heatmap files to Cloudflare R2.
+
+Every published file is uploaded under a content-hashed key
+(7d_15m.json -> 7d_15m.<16 hex of its SHA-256>.json) with a year-long immutable
+Cache-Control, so the CDN and browsers never have to revalidate it. A key that
+already exists is not uploaded again, so unchanged files cost nothing.
+
+Manifests (tiles/index.json, then meta.json) are rewritten on the way out:
+every published file name they mention is replaced by its versioned key, and
+the files in their directory they don't mention are listed under "objects"
+(name -> versioned key). Nested manifests are versioned like any other file.
+Only the root manifest, meta.json, keeps a fixed key with a short max-age
+(R2_MANIFEST_MAX_AGE), and it is uploaded last, so it never points at an
+object that isn't there yet.
+
+Versioned keys no longer referenced, and the fixed keys older publishers
+wrote, are retired and deleted in batches once they have been retired for
+R2_GC_GRACE_HOURS, so clients holding an older meta.json can still load what
+it points at. Retirement times are kept in PUBLISH_STATE_PATH; if that file is
+lost, retired objects simply start a new grace period.
+
+Usage:
+    python r2_publish.py [--output-dir ./heatmaps]   # publish what is on disk
+"""
+import os
+import re
+import json
+import hashlib
+import argparse
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+from dotenv import load_dotenv
+from decayed_heatmap import checkpoint_lock, write_checkpoint
+import metrics
+from metrics import timed, incr
+
+load_dotenv()
+
+# Configuration
+R2_MANIFEST_MAX_AGE = int(os.getenv("R2_MANIFEST_MAX_AGE", "60"))
+R2_GC_GRACE_HOURS = float(os.getenv("R2_GC_GRACE_HOURS", "48"))
+PUBLISH_STATE_PATH = os.getenv("PUBLISH_STATE_PATH", "./state/r2_publish.json")
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+ROOT_MANIFEST = "meta.json"
+R2_DELETE_BATCH = 1000  # DeleteObjects limit per request
+DIGEST_CHARS = 16
+VERSIONED_KEY = re.compile(rf"\.[0-9a-f]{{{DIGEST_CHARS}}}(\.[^./]+)$")
+
+
+def normalized_prefix(prefix: str) -> str:
+    if not prefix:
+        return ""
+    prefix = prefix.lstrip("/")
+    return prefix if prefix.endswith("/") else f"{prefix}/"
+
+
+def r2_client():
+    """
+    S3 client and target from the R2_* environment.
+
+    Returns:
+        Tuple of (client, bucket, key prefix), or None if the configuration is incomplete
+    """
+    access_key = os.getenv("R2_ACCESS_KEY_ID")
+    secret_key = os.getenv("R2_SECRET_ACCESS_KEY")
+    endpoint = os.getenv("R2_ENDPOINT")
+    bucket = os.getenv("R2_BUCKET")
+
+    if not all([access_key, secret_key, endpoint, bucket]):
+        print("❌ Missing R2 configuration. Required: R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY, R2_ENDPOINT, R2_BUCKET")
+        return None
+
+    import boto3
+    session = boto3.session.Session()
+    client = session.client(
+        "s3",
+        endpoint_url=endpoint,
+        aws_access_key_id=access_key,
+        aws_secret_access_key=secret_key,
+        region_name=os.getenv("R2_REGION", "auto"),
+    )
+    return client, bucket, normalized_prefix(os.getenv("R2_PREFIX", ""))
+
+
+def versioned_key(name: str, body: bytes) -> str:
+    """Content-addressed name, e.g. tiles/1h/2026-10.json -> tiles/1h/2026-10.<digest>.json."""
+    root, ext = os.path.splitext(name)
+    return f"{root}.{hashlib.sha256(body).hexdigest()[:DIGEST_CHARS]}{ext}"
+
+
+def list_objects(client, bucket: str, prefix: str) -> Dict[str, str]:
+    """Every key under prefix with its ETag (unquoted), following continuation tokens."""
+    objects = {}
+    kwargs = {"Bucket": bucket, "Prefix": prefix}
+    while True:
+        page = client.list_objects_v2(**kwargs)
+        for item in page.get("Contents", []):
+            objects[item["Key"]] = item.get("ETag", "").strip('"')
+        if not page.get("IsTruncated"):
+            return objects
+        kwargs["ContinuationToken"] = page["NextContinuationToken"]
+
+
+def delete_keys(client, bucket: str, keys: Sequence[str]) -> List[str]:
+    """Delete keys, R2_DELETE_BATCH per request; returns the keys actually deleted."""
+    deleted = []
+    for i in range(0, len(keys), R2_DELETE_BATCH):
+        batch = keys[i:i + R2_DELETE_BATCH]
+        response = client.delete_objects(Bucket=bucket,
+                                         Delete={"Objects": [{"Key": key} for key in batch], "Quiet": True})
+        failed = {error["Key"] for error in response.get("Errors", [])}
+        for key in failed:
+            print(f"⚠️  Failed to delete {key}")
+        deleted.extend(key for key in batch if key not in failed)
+    return deleted
+
+
+def rewrite_references(value, versions: Dict[str, str], referenced: Set[str]):
+    """Replace every string equal to a published name by its versioned key, recording which were seen."""
+    if isinstance(value, dict):
+        return {k: rewrite_references(v, versions, referenced) for k, v in value.items()}
+    if isinstance(value, list):
+        return [rewrite_references(v, versions, referenced) for v in value]
+    if isinstance(value, str) and value in versions:
+        referenced.add(value)
+        return versions[value]
+    return value
+
+
+def manifest_scope(manifest: str, manifests: Sequence[str], names: Iterable[str]) -> List[str]:
+    """Names a manifest lists under "objects": those in its directory not covered by a deeper manifest."""
+    def directory(path: str) -> str:
+        d = os.path.dirname(path)
+        return f"{d}/" if d else ""
+
+    own = directory(manifest)
+    deeper = [directory(m) for m in manifests if len(directory(m)) > len(own) and directory(m).startswith(own)]
+    return [name for name in names
+            if name.startswith(own) and name not in manifests
+            and not any(name.startswith(d) for d in deeper)]
+
+
+def build_manifest(doc: Dict, name: str, manifests: Sequence[str], versions: Dict[str, str]) -> bytes:
+    """Manifest body with references rewritten and unreferenced in-scope files under "objects"."""
+    referenced = set()
+    doc = rewrite_references(doc, versions, referenced)
+    doc["objects"] = {n: versions[n] for n in sorted(manifest_scope(name, manifests, versions))
+                      if n not in referenced}
+    return json.dumps(doc, separators=(",", ":")).encode()
+
+
+def load_retired(path: str) -> Dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f).get("retired", {})
+    except Exception as e:
+        print(f"⚠️  Failed to read publish state, restarting grace periods: {e}")
+        return {}
+
+
+def save_retired(path: str, retired: Dict[str, str]):
+    with checkpoint_lock(path):
+        write_checkpoint(path, {"retired": retired})
+
+
+@timed("r2.collect_garbage")
+def collect_garbage(client, bucket: str, prefix: str, existing: Iterable[str], live: Set[str],
+                    published: Set[str], now: datetime, grace_hours: float = R2_GC_GRACE_HOURS,
+                    state_path: str = PUBLISH_STATE_PATH) -> int:
+    """
+    Retire objects no longer referenced and delete those retired longer than the grace period.
+
+    Args:
+        existing: Keys currently in the bucket under prefix
+        live: Keys the new manifest references (never touched)
+        published: Logical names published this run; their old fixed keys are retired too
+
+    Returns:
+        Number of objects deleted
+    """
+    retired = load_retired(state_path)
+    candidates = set()
+    for key in existing:
+        name = key[len(prefix):]
+        if key in live or name == ROOT_MANIFEST:
+            continue
+        if VERSIONED_KEY.search(name) or name in published:
+            candidates.add(key)
+
+    stamp = now.isoformat()
+    retired = {key: retired.get(key, stamp) for key in candidates}
+    cutoff = now - timedelta(hours=grace_hours)
+    due = sorted(key for key, since in retired.items() if datetime.fromisoformat(since) <= cutoff)
+    deleted = delete_keys(client, bucket, due) if due else []
+    for key in deleted:
+        del retired[key]
+    save_retired(state_path, retired)
+
+    incr("r2.objects_deleted", len(deleted))
+    print(f"🧹 {len(deleted)} old objects deleted, {len(retired)} retired within the "
+          f"{grace_hours:g} h grace period")
+    return len(deleted)
+
+
+def _put(client, bucket: str, key: str, body: bytes, cache_control: str):
+    client.put_object(Bucket=bucket, Key=key, Body=body, ContentType="application/json",
+                      CacheControl=cache_control)
+    incr("r2.bytes_uploaded", len(body))
+
+
+@timed("r2.publish")
+def publish(client, bucket: str, prefix: str, output_dir: str, filenames: Iterable[str],
+            manifests: Sequence[str] = (ROOT_MANIFEST,), now: Optional[datetime] = None,
+            grace_hours: float = R2_GC_GRACE_HOURS, state_path: str = PUBLISH_STATE_PATH) -> bool:
+    """
+    Publish files from output_dir as immutable versioned objects behind the root manifest.
+
+    Args:
+        filenames: Names relative to output_dir (manifests included)
+        manifests: Manifest names, innermost first; the last one is the root and keeps its fixed key
+
+    Returns:
+        bool: True if everything was uploaded (garbage collection failures only warn), False otherwise
+    """
+    now = now or datetime.now(timezone.utc)
+    root = manifests[-1]
+
+    bodies: Dict[str, bytes] = {}
+    for name in dict.fromkeys(filenames):
+        path = os.path.join(output_dir, name)
+        if not os.path.isfile(path):
+            print(f"⚠️  Heatmap file missing, skipping: {path}")
+            continue
+        with open(path, 'rb') as f:
+            bodies[name] = f.read()
+    if not bodies or root not in bodies:
+        print(f"❌ No heatmap files or no {root} found to upload.")
+        return False
+
+    try:
+        existing = list_objects(client, bucket, prefix)
+    except Exception as e:
+        print(f"❌ Failed to list R2 objects: {e}")
+        return False
+
+    versions = {name: versioned_key(name, body) for name, body in bodies.items() if name not in manifests}
+    uploaded = skipped = 0
+
+    def upload_versioned(name: str, body: bytes) -> bool:
+        nonlocal uploaded, skipped
+        key = f"{prefix}{versions[name]}"
+        if key in existing:
+            skipped += 1
+            return True
+        try:
+            _put(client, bucket, key, body, IMMUTABLE_CACHE_CONTROL)
+        except Exception as e:
+            print(f"❌ Failed to upload {name}: {e}")
+            return False
+        uploaded += 1
+        return True
+
+    for name in versions:
+        if not upload_versioned(name, bodies[name]):
+            return False
+
+    for name in manifests:
+        if name not in bodies:
+            continue
+        body = build_manifest(json.loads(bodies[name]), name, manifests, versions)
+        if name != root:
+            versions[name] = versioned_key(name, body)
+            if not upload_versioned(name, body):
+                return False
+            continue
+        key = f"{prefix}{name}"
+        if existing.get(key) == hashlib.md5(body).hexdigest():
+            skipped += 1
+            continue
+        try:
+            _put(client, bucket, key, body, f"public, max-age={R2_MANIFEST_MAX_AGE}")
+        except Exception as e:
+            print(f"❌ Failed to upload {name}: {e}")
+            return False
+        uploaded += 1
+
+    incr("r2.objects_uploaded", uploaded)
+    print(f"☁️  Published {len(bodies)} files: {uploaded} uploaded, {skipped} unchanged")
+
+    try:
+        live = {f"{prefix}{key}" for key in versions.values()}
+        collect_garbage(client, bucket, prefix, existing, live, set(bodies), now, grace_hours, state_path)
+    except Exception as e:
+        print(f"⚠️  Garbage collection failed, retrying next run: {e}")
+    return True
+
+
+def walk_files(output_dir: str) -> List[str]:
+    """Every file under output_dir, relative, with '/' separators."""
+    names = []
+    for directory, _, files in os.walk(output_dir):
+        for file in files:
+            names.append(os.path.relpath(os.path.join(directory, file), output_dir).replace(os.sep, "/"))
+    return sorted(names)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Publish the heatmap directory to R2 as versioned objects")
+    parser.add_argument("--output-dir", default="./heatmaps", help="Directory to publish (default ./heatmaps)")
+    parser.add_argument("--manifest", action="append",
+                        help=f"Manifest, innermost first (repeatable; default tiles/index.json then {ROOT_MANIFEST})")
+    args = parser.parse_args()
+    from timeseries_tiles import TILE_INDEX_FILE
+    target = r2_client()
+    if target is None:
+        raise SystemExit(1)
+    client, bucket, prefix = target
+    files = [name for name in walk_files(args.output_dir) if name.endswith(".json")]
+    ok = publish(client, bucket, prefix, args.output_dir, files,
+                 args.manifest or [TILE_INDEX_FILE, ROOT_MANIFEST])
+    metrics.flush()
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Tiered retention for parking_data.
+
+Raw readings on local days more than RETENTION_RAW_DAYS ago are folded into
+parking_daily_rollup (per local day, lot and 5-minute slot: sample count,
+exact occupancy sum and count, histogram) and deleted from parking_data. The
+retention watermark (parking_retention.raw_from) tells the "all" heatmap which
+days to read from rollups and which from raw rows, so all.json comes out the
+same as before compaction. The windowed heatmaps only ever read raw rows, so
+RETENTION_RAW_DAYS must stay longer than the longest window.
+
+Deleted rows can be archived as gzipped CSV (RETENTION_ARCHIVE_DIR or
+--archive-dir); the weekly CSV exports in data/ already hold them as well.
+History replays (decayed_heatmap.py / anomaly.py --rebuild) only see raw rows.
+
+Usage:
+    python retention.py [--days 180] [--archive-dir DIR] [--no-vacuum]
+"""
+import os
+import argparse
+from datetime import datetime, timedelta
+from typing import Optional
+from dotenv import load_dotenv
+from db import DB, CENTRAL_TZ
+from aggregate_heatmaps import RANGES
+import metrics
+
+load_dotenv()
+
+# Configuration (RETENTION_RAW_DAYS=0 keeps raw rows forever and skips the nightly run)
+RETENTION_RAW_DAYS = int(os.getenv("RETENTION_RAW_DAYS", "0"))
+RETENTION_ARCHIVE_DIR = os.getenv("RETENTION_ARCHIVE_DIR", "")
+# Windowed heatmaps look back from NOW(), so keep a day more than the longest one
+MIN_RETENTION_DAYS = max(days for days, _ in RANGES if days is not None) + 2
+
+
+def compact(days: int = RETENTION_RAW_DAYS, archive_dir: Optional[str] = RETENTION_ARCHIVE_DIR or None,
+            vacuum: bool = True) -> bool:
+    """
+    Compact raw readings older than `days` local days into the daily rollups.
+
+    Returns:
+        bool: True if successful (or nothing to do), False otherwise
+    """
+    if days < MIN_RETENTION_DAYS:
+        print(f"❌ Retention of {days} days would cut into the heatmap windows; use at least {MIN_RETENTION_DAYS}")
+        return False
+
+    before_day = datetime.now(CENTRAL_TZ).date() - timedelta(days=days)
+    db = DB()
+    try:
+        if not db.create_aux_tables():
+            return False
+        deleted = db.compact_readings(before_day, archive_dir=archive_dir)
+        if deleted < 0:
+            return False
+        print(f"✅ Raw readings kept from {db.get_raw_from() or before_day}; {deleted} rows compacted")
+        if deleted and vacuum:
+            db.vacuum_readings()
+        return True
+    finally:
+        db.close_connection()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compact old raw readings into daily rollups")
+    parser.add_argument("--days", type=int, default=RETENTION_RAW_DAYS or MIN_RETENTION_DAYS,
+                        help=f"Keep raw readings for this many local days (default RETENTION_RAW_DAYS "
+                             f"or {MIN_RETENTION_DAYS})")
+    parser.add_argument("--archive-dir", default=RETENTION_ARCHIVE_DIR or None,
+                        help="Write deleted rows here as gzipped CSV")
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM ANALYZE afterwards")
+    args = parser.parse_args()
+    ok = compact(args.days, args.archive_dir, vacuum=not args.no_vacuum)
+    metrics.flush()
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,20 +11,25 @@ import time
 import subprocess
 import os
 import sys
+import argparse
 from datetime import datetime, timedelta
 from typing import List
 import pytz
 from dotenv import load_dotenv
-import boto3
 
 # Ensure we are running from the Project Root
 PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 os.chdir(PROJECT_ROOT)
 sys.path.append(os.path.join(PROJECT_ROOT, "server"))
 
+# Only what crawling needs is imported here; the daily-task modules (numpy, boto3)
+# are imported on first use, so a crawl-only process stays small
 from db import DB
-from parking_crawl import crawl_once
-from aggregate_heatmaps import generate_all_heatmaps
+from parking_crawl import crawl_once, schedule, TICK_MINUTES
+import metrics
+import profiling
+from metrics import timed
+from profiling import profile_step
 
 # Load environment variables (R2 credentials, DB creds, etc.)
 load_dotenv()
@@ -33,78 +38,30 @@ load_dotenv()
 CENTRAL_TZ = pytz.timezone('US/Central')
 
 # Configuration
-CRAWL_INTERVAL_MINUTES = 5
-DEFAULT_HEATMAP_FILES = ["7d.json", "30d.json", "90d.json", "120d.json", "all.json", "meta.json"]
+# Loop wake-up for crawling: 5 minutes, or the fastest adaptive interval (CRAWL_ADAPTIVE=1)
+CRAWL_INTERVAL_MINUTES = TICK_MINUTES
 
 
-def _normalized_prefix(prefix: str) -> str:
-    if not prefix:
-        return ""
-    prefix = prefix.lstrip("/")
-    return prefix if prefix.endswith("/") else f"{prefix}/"
+def default_heatmap_files(output_dir: str) -> List[str]:
+    """Every file the nightly run publishes besides the tiles."""
+    from aggregate_heatmaps import heatmap_filenames
+    from forecast import FORECAST_FILE
+    return heatmap_filenames(output_dir) + [FORECAST_FILE, "meta.json"]
 
 
+@timed("r2.upload_heatmaps")
 def upload_heatmaps_to_r2(output_dir: str, filenames: List[str]) -> bool:
-    """Upload heatmap JSON files to Cloudflare R2, replacing existing objects."""
-
-    access_key = os.getenv("R2_ACCESS_KEY_ID")
-    secret_key = os.getenv("R2_SECRET_ACCESS_KEY")
-    endpoint = os.getenv("R2_ENDPOINT")
-    bucket = os.getenv("R2_BUCKET")
-    prefix = _normalized_prefix(os.getenv("R2_PREFIX", ""))
-
-    if not all([access_key, secret_key, endpoint, bucket]):
-        print("❌ Missing R2 configuration. Required: R2_ACCESS_KEY_ID, R2_SECRET_ACCESS_KEY, R2_ENDPOINT, R2_BUCKET")
+    """Publish heatmap JSON files to Cloudflare R2 as immutable versioned objects behind meta.json."""
+    from r2_publish import r2_client, publish
+    from timeseries_tiles import TILE_INDEX_FILE
+    target = r2_client()
+    if target is None:
         return False
-
-    session = boto3.session.Session()
-    client = session.client(
-        "s3",
-        endpoint_url=endpoint,
-        aws_access_key_id=access_key,
-        aws_secret_access_key=secret_key,
-        region_name=os.getenv("R2_REGION", "auto"),
-    )
-
-    # Build list of existing local files to upload
-    local_files = []
-    for name in filenames:
-        path = os.path.join(output_dir, name)
-        if os.path.isfile(path):
-            local_files.append((name, path))
-        else:
-            print(f"⚠️  Heatmap file missing, skipping: {path}")
-
-    if not local_files:
-        print("❌ No heatmap files found to upload.")
-        return False
-
-    # Delete previous objects (same keys) from R2
-    keys_to_delete = [{"Key": f"{prefix}{name}"} for name, _ in local_files]
-    try:
-        client.delete_objects(Bucket=bucket, Delete={"Objects": keys_to_delete, "Quiet": True})
-        print(f"🧹 Deleted {len(keys_to_delete)} previous heatmap objects from R2.")
-    except Exception as e:
-        print(f"❌ Failed to delete previous heatmap objects: {e}")
-        return False
-
-    # Upload updated files
-    for name, path in local_files:
-        key = f"{prefix}{name}"
-        try:
-            client.upload_file(
-                path,
-                bucket,
-                key,
-                ExtraArgs={"ContentType": "application/json"},
-            )
-            print(f"☁️  Uploaded: {key}")
-        except Exception as e:
-            print(f"❌ Failed to upload {path}: {e}")
-            return False
-
-    print("✅ R2 upload complete.")
-    return True
+    client, bucket, prefix = target
+    ok = publish(client, bucket, prefix, output_dir, filenames, [TILE_INDEX_FILE, "meta.json"])
+    if ok:
+        print("✅ R2 upload complete.")
+    return ok
 
 
 def get_seconds_until_next_interval(interval_minutes):
@@ -166,39 +123,88 @@ def run_daily_tasks(db):
     print("\n" + "=" * 60)
     print("🌙 Running daily tasks at midnight...")
     print("=" * 60)
+    from aggregate_heatmaps import generate_all_heatmaps
+    from forecast import generate_forecast
+    from timeseries_tiles import generate_tiles, tile_files
+    from retention import RETENTION_RAW_DAYS, compact as compact_readings
     
     # 1. Generate heatmaps
     print("\n[1/3] Generating heatmaps...")
-    heatmaps_ok = generate_all_heatmaps()
+    with profile_step("generate_all_heatmaps"):
+        heatmaps_ok = generate_all_heatmaps()
     if heatmaps_ok:
         # output_dir is heatmaps folder in project root
         output_dir = os.path.join(PROJECT_ROOT, "heatmaps")
-        print("\n[1b/3] Uploading heatmaps to R2...")
-        upload_heatmaps_to_r2(output_dir, DEFAULT_HEATMAP_FILES)
+        print("\n[1b/3] Forecasting the next 7 days...")
+        with profile_step("generate_forecast"):
+            generate_forecast(output_dir)
+        print("\n[1c/3] Updating time-series tiles...")
+        with profile_step("generate_tiles"):
+            generate_tiles(output_dir)
+        print("\n[1d/3] Uploading heatmaps to R2...")
+        with profile_step("upload_heatmaps_to_r2"):
+            upload_heatmaps_to_r2(output_dir, default_heatmap_files(output_dir) + tile_files(output_dir))
     
     # 2. Export CSV
     print("\n[2/3] Exporting CSV...")
-    db.export_to_csv()  # Exports all data split by week to ./data/
+    with profile_step("export_to_csv"):
+        db.export_to_csv()  # Exports all data split by week to ./data/
+    
+    # 2b. Compact old raw readings (after the export, so their weeks are on disk first)
+    if RETENTION_RAW_DAYS > 0:
+        print(f"\n[2b/3] Compacting readings older than {RETENTION_RAW_DAYS} days...")
+        with profile_step("compact_readings"):
+            compact_readings()
     
     # 3. Git commit and push
     print("\n[3/3] Committing to git...")
-    git_commit_and_push()
+    with profile_step("git_commit_and_push"):
+        git_commit_and_push()
     
     print("\n" + "=" * 60)
     print("✅ Daily tasks completed!")
     print("=" * 60 + "\n")
 
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Auburn Parking Analytics scheduler")
+    parser.add_argument("--profile", action="store_true",
+                        help="Profile each daily step with cProfile + tracemalloc (same as PROFILE_DAILY=1)")
+    parser.add_argument("--daily-now", action="store_true",
+                        help="Run the daily tasks once immediately and exit")
+    parser.add_argument("--no-crawl", action="store_true",
+                        help="Only run daily tasks; crawling is left to crawl_worker.py processes")
+    return parser.parse_args()
+
+
 def main():
     """Main scheduler loop."""
+    args = parse_args()
+    if args.profile:
+        profiling.enable()
+
     print("🚀 Auburn Parking Analytics - Central Scheduler")
-    print(f"Crawl interval: every {CRAWL_INTERVAL_MINUTES} minutes")
+    if args.no_crawl:
+        print("Crawling disabled (handled by crawl_worker.py)")
+    elif schedule.adaptive:
+        print(f"Crawl interval: adaptive, {schedule.ladder[0]}-{schedule.ladder[-1]} minutes per lot")
+    else:
+        print(f"Crawl interval: every {CRAWL_INTERVAL_MINUTES} minutes")
     print("Daily tasks: 12:00 AM (heatmaps, CSV export, git commit)")
+    if profiling.is_enabled():
+        print(f"Profiling daily steps -> {profiling.PROFILE_DIR}")
     
     # Connect to database
     db = DB()
     db.test_connection()
+    db.create_aux_tables()
     print("-" * 60)
+
+    if args.daily_now:
+        run_daily_tasks(db)
+        metrics.flush()
+        db.close_connection()
+        return
     
     # Track last daily run
     last_daily_date = None
@@ -212,14 +218,16 @@ def main():
             
             # Check for 5-minute crawl interval
             current_interval = (now.hour * 60 + now.minute) // CRAWL_INTERVAL_MINUTES
-            if last_crawl_time is None or current_interval != last_crawl_time:
+            if not args.no_crawl and (last_crawl_time is None or current_interval != last_crawl_time):
                 crawl_once(db)
                 last_crawl_time = current_interval
+                metrics.flush()
             
             # Check for midnight daily tasks
             if is_midnight(now, last_daily_date):
                 run_daily_tasks(db)
                 last_daily_date = now.date()
+                metrics.flush()
             
             # Sleep until next check (every 30 seconds)
             wait_seconds = get_seconds_until_next_interval(CRAWL_INTERVAL_MINUTES)
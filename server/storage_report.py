@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Storage footprint of the readings tables, and the compact-layout migration.
+
+Reports rows, heap size, bytes per row (on disk including page overhead, and
+the tuple itself), rows per 8 kB page and per-index sizes. Rows per page is
+what the heatmap scans pay for. With --migrate, parking_data is rewritten into
+the compact layout (see CREATE_READINGS_TABLE_SQL in db.py), reporting before
+and after; stop the crawlers first.
+
+Usage:
+    python storage_report.py [--table parking_data] [--table parking_daily_rollup]
+    python storage_report.py --migrate
+"""
+import argparse
+from typing import Dict, Optional
+from db import DB
+
+
+def format_bytes(n: float) -> str:
+    for unit in ("B", "kB", "MB", "GB"):
+        if abs(n) < 1024 or unit == "GB":
+            return f"{n:,.0f} {unit}" if unit == "B" else f"{n:,.1f} {unit}"
+        n /= 1024
+
+
+def print_stats(table: str, stats: Dict):
+    rows = stats["rows"]
+    per_row = (lambda n: n / rows) if rows else (lambda n: 0.0)
+    print(f"\n📦 {table}: {rows:,} rows, {stats['pages']:,} pages")
+    print(f"  heap        {format_bytes(stats['heap_bytes']):>10}   {per_row(stats['heap_bytes']):6.1f} B/row   "
+          f"{rows / stats['pages'] if stats['pages'] else 0:6.1f} rows/page   "
+          f"tuple {stats['avg_row_bytes']:.1f} B")
+    print(f"  indexes     {format_bytes(stats['index_bytes']):>10}   {per_row(stats['index_bytes']):6.1f} B/row")
+    for name, size in stats["indexes"].items():
+        print(f"    {name:<32} {format_bytes(size):>10}   {per_row(size):6.1f} B/row")
+    total = stats["table_bytes"] + stats["index_bytes"]
+    print(f"  total       {format_bytes(total):>10}   {per_row(total):6.1f} B/row")
+
+
+def print_change(before: Dict, after: Dict):
+    print("\n📉 parking_data before -> after")
+    for label, key in (("heap", "heap_bytes"), ("indexes", "index_bytes"), ("tuple", "avg_row_bytes")):
+        old, new = before[key], after[key]
+        change = (new - old) / old * 100 if old else 0.0
+        print(f"  {label:<8} {format_bytes(old):>10} -> {format_bytes(new):>10}  ({change:+.1f}%)")
+    old_density = before["rows"] / before["pages"] if before["pages"] else 0
+    new_density = after["rows"] / after["pages"] if after["pages"] else 0
+    print(f"  rows/page {old_density:9.1f} -> {new_density:10.1f}")
+
+
+def report(db: DB, tables) -> Optional[Dict]:
+    """Print every table's stats; returns the first table's."""
+    first = None
+    for table in tables:
+        stats = db.get_storage_stats(table)
+        if stats is None:
+            continue
+        print_stats(table, stats)
+        first = first or stats
+    return first
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Readings table storage report and compact-layout migration")
+    parser.add_argument("--table", action="append", help="Table to report (repeatable; default parking_data)")
+    parser.add_argument("--migrate", action="store_true",
+                        help="Migrate parking_data to the compact layout, reporting before and after")
+    args = parser.parse_args()
+    tables = args.table or ["parking_data"]
+
+    db = DB()
+    try:
+        if not args.migrate:
+            report(db, tables)
+            return
+        before = db.get_storage_stats("parking_data")
+        if before:
+            print_stats("parking_data (before)", before)
+        if not db.migrate_compact_schema():
+            raise SystemExit(1)
+        after = db.get_storage_stats("parking_data")
+        if after:
+            print_stats("parking_data (after)", after)
+        if before and after:
+            print_change(before, after)
+    finally:
+        db.close_connection()
+
+
+if __name__ == "__main__":
+    main()
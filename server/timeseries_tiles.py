@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+"""
+Occupancy time-series tiles for timeline views.
+
+A three-level pyramid, one small JSON file per period, built from the daily
+rollups (so compacted history is covered too):
+  - heatmaps/tiles/5m/2026-10-18.json  (one local day, 288 five-minute values per lot)
+  - heatmaps/tiles/1h/2026-10.json     (one month, days × 24 hourly values per lot)
+  - heatmaps/tiles/1d/2026.json        (one year, one daily value per lot and day)
+  - heatmaps/tiles/index.json          (covered date range and key templates)
+
+Values are occupancy % averaged over the period's readings (null without data),
+alongside the number of readings. Slots follow local wall-clock time, like the
+heatmaps. A tile's content only depends on its period's rollups, so once its
+period is older than the days the nightly rollup refresh rebuilds, the tile is
+"complete" and never changes. Each night only tiles that are missing locally or
+overlap the refreshed days are rebuilt, and only files whose content changed
+are written (and uploaded).
+
+Usage:
+    python timeseries_tiles.py   # bring heatmaps/tiles up to date
+"""
+import os
+import json
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional
+import numpy as np
+import pytz
+from db import DB, ROLLUP_REFRESH_DAYS
+from aggregate_heatmaps import OUTPUT_DIR, LOT_ID_TO_NAME, load_lots, round_half_up, TIME_SLOTS, SLOT_MINUTES
+from metrics import timed
+
+# Configuration
+CENTRAL_TZ = pytz.timezone('America/Chicago')
+TILES_DIR = "tiles"
+SLOTS_PER_HOUR = 60 // SLOT_MINUTES
+TILE_INDEX_FILE = f"{TILES_DIR}/index.json"
+
+# Resolution label -> (directory, key template, step in minutes)
+TILE_LEVELS = {
+    "5M": ("5m", "{day}", SLOT_MINUTES),
+    "1H": ("1h", "{month}", 60),
+    "1D": ("1d", "{year}", 1440),
+}
+
+
+def tile_filename(resolution: str, period: str) -> str:
+    """Tile path relative to the output directory, e.g. tiles/1h/2026-10.json."""
+    directory = TILE_LEVELS[resolution][0]
+    return f"{TILES_DIR}/{directory}/{period}.json"
+
+
+def tile_files(output_dir: str = OUTPUT_DIR) -> List[str]:
+    """Every tile file on disk (index included), relative to the output directory."""
+    names = []
+    for directory, _, files in os.walk(os.path.join(output_dir, TILES_DIR)):
+        for file in files:
+            if file.endswith(".json"):
+                names.append(os.path.relpath(os.path.join(directory, file), output_dir).replace(os.sep, "/"))
+    return sorted(names)
+
+
+def next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def load_year(db: DB, year: int, last_day: date) -> Dict[str, np.ndarray]:
+    """
+    Load one year's rollups (up to last_day) into dense (lots, days, slots) arrays ordered like LOT_ID_TO_NAME.
+
+    Returns:
+        Dict with "first" (Jan 1), "sum", "count" (readings with occupancy) and "samples"
+    """
+    first = date(year, 1, 1)
+    end = min(date(year + 1, 1, 1), last_day + timedelta(days=1))
+    lot_index = {lot_id: i for i, lot_id in enumerate(LOT_ID_TO_NAME)}
+    shape = (len(lot_index), (date(year + 1, 1, 1) - first).days, TIME_SLOTS)
+    occupancy_sum = np.zeros(shape)
+    occupancy_count = np.zeros(shape, dtype=np.int64)
+    samples = np.zeros(shape, dtype=np.int64)
+
+    for rows in db.iter_daily_rollups(start=first, end=end):
+        day, lot_id, slot, sample_count, occ_sum, occ_count, _ = zip(*rows)
+        lots = np.array([lot_index.get(l, -1) for l in lot_id])
+        offsets = (np.array(day, dtype="datetime64[D]") - np.datetime64(first, "D")).astype(np.int64)
+        slots = np.array(slot)
+        keep = (lots >= 0) & (slots >= 0) & (slots < TIME_SLOTS)
+        index = (lots[keep], offsets[keep], slots[keep])
+        occupancy_sum[index] = np.array([float(v) for v in occ_sum])[keep]
+        occupancy_count[index] = np.array(occ_count)[keep]
+        samples[index] = np.array(sample_count)[keep]
+
+    return {"first": first, "sum": occupancy_sum, "count": occupancy_count, "samples": samples}
+
+
+def _averages(occupancy_sum: np.ndarray, occupancy_count: np.ndarray) -> list:
+    with np.errstate(invalid="ignore", divide="ignore"):
+        avg = np.where(occupancy_count > 0, round_half_up(occupancy_sum / occupancy_count), np.nan)
+    return np.where(np.isnan(avg), None, avg).tolist()
+
+
+def build_tile(resolution: str, period: str, start: date, complete: bool,
+               occupancy_sum: np.ndarray, occupancy_count: np.ndarray, samples: np.ndarray) -> Dict:
+    """Tile document from (lots, ...) arrays already summed to the tile's resolution."""
+    return {
+        "period": period,
+        "resolution": resolution,
+        "from": start.isoformat(),
+        "step_minutes": TILE_LEVELS[resolution][2],
+        "complete": complete,
+        "lots": {name: _averages(occupancy_sum[i], occupancy_count[i])
+                 for i, name in enumerate(LOT_ID_TO_NAME.values())},
+        "sample_counts": {name: samples[i].tolist() for i, name in enumerate(LOT_ID_TO_NAME.values())},
+        "meta": {"metric": "occupancy_rate", "unit": "percent"},
+    }
+
+
+def year_tiles(data: Dict[str, np.ndarray], settled_before: date, stale: set):
+    """
+    Yield (resolution, period, document) for the stale tiles of one loaded year.
+
+    stale holds (resolution, period) pairs. A tile is complete when its period
+    ends before settled_before, the first day the nightly refresh may still rebuild.
+    """
+    first = data["first"]
+    year = first.year
+    arrays = (data["sum"], data["count"], data["samples"])
+
+    def offset(day: date) -> int:
+        return (day - first).days
+
+    for resolution, period in sorted(stale):
+        if resolution == "5M":
+            day = date.fromisoformat(period)
+            if day.year != year:
+                continue
+            i = offset(day)
+            yield resolution, period, build_tile(resolution, period, day, day < settled_before,
+                                                 *(a[:, i] for a in arrays))
+        elif resolution == "1H":
+            start = date.fromisoformat(f"{period}-01")
+            if start.year != year:
+                continue
+            end = next_month(start)
+            hourly = [a[:, offset(start):offset(end)]
+                      .reshape(a.shape[0], -1, TIME_SLOTS // SLOTS_PER_HOUR, SLOTS_PER_HOUR).sum(axis=3)
+                      for a in arrays]
+            yield resolution, period, build_tile(resolution, period, start, end <= settled_before, *hourly)
+        elif resolution == "1D" and period == str(year):
+            daily = [a.sum(axis=2) for a in arrays]
+            yield resolution, period, build_tile(resolution, period, first,
+                                                 date(year + 1, 1, 1) <= settled_before, *daily)
+
+
+def write_if_changed(output_dir: str, name: str, doc: Dict) -> bool:
+    """Write a tile unless the file already holds the same content."""
+    path = os.path.join(output_dir, name)
+    data = json.dumps(doc, separators=(",", ":")).encode()
+    if os.path.exists(path):
+        with open(path, 'rb') as f:
+            if f.read() == data:
+                return False
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+    return True
+
+
+@timed("tiles.generate")
+def generate_tiles(output_dir: str = OUTPUT_DIR, now: Optional[datetime] = None) -> List[str]:
+    """
+    Bring the tile pyramid up to date through yesterday (local time).
+
+    Returns:
+        Tile files written this run (relative to output_dir), index included; empty without data
+    """
+    now = now or datetime.now(CENTRAL_TZ)
+    last_day = now.date() - timedelta(days=1)
+    refreshed_from = now.date() - timedelta(days=ROLLUP_REFRESH_DAYS)
+
+    db = DB()
+    try:
+        load_lots(db)
+        first_day, _ = db.get_rollup_date_range()
+        if first_day is None or first_day > last_day:
+            print("❌ No rollup data available for tiles")
+            return []
+
+        # Every period with data; stale = missing locally or touched by the nightly rollup refresh
+        stale = set()
+        day = first_day
+        while day <= last_day:
+            recent = day >= refreshed_from
+            for resolution, period in (("5M", day.isoformat()), ("1H", day.strftime("%Y-%m")), ("1D", str(day.year))):
+                if recent or not os.path.exists(os.path.join(output_dir, tile_filename(resolution, period))):
+                    stale.add((resolution, period))
+            day += timedelta(days=1)
+
+        written = []
+        for year in sorted({int(period[:4]) for _, period in stale}):
+            data = load_year(db, year, last_day)
+            for resolution, period, doc in year_tiles(data, refreshed_from, stale):
+                name = tile_filename(resolution, period)
+                if write_if_changed(output_dir, name, doc):
+                    written.append(name)
+    finally:
+        db.close_connection()
+
+    index = {
+        "range": {"from": first_day.isoformat(), "to": last_day.isoformat()},
+        "tiles": {resolution: tile_filename(resolution, template)
+                  for resolution, (_, template, _) in TILE_LEVELS.items()},
+        "step_minutes": {resolution: step for resolution, (_, _, step) in TILE_LEVELS.items()},
+    }
+    if write_if_changed(output_dir, TILE_INDEX_FILE, index):
+        written.append(TILE_INDEX_FILE)
+
+    print(f"✅ {len(stale)} tiles checked, {len(written)} files written under {os.path.join(output_dir, TILES_DIR)}")
+    return written
+
+
+def main():
+    """Standalone mode: update the tiles when run directly."""
+    generate_tiles()
+
+
+if __name__ == "__main__":
+    main()